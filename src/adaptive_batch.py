@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+OOM-resilient adaptive batch sizing for batch processing.
+
+Files are grouped into duration buckets. Within a bucket the batch grows
+while memory headroom allows, and a batch that fails to allocate is split
+in half and retried instead of aborting the job. The largest batch size
+that worked for each bucket, and the smallest one that ran out of memory,
+are kept in a small JSON profile so the next run starts at the former and
+does not grow past the latter. An out-of-memory error may have been
+transient (fragmentation, another process on the GPU), so after
+REPROBE_AFTER clean batches in a row the bucket is allowed to grow past it
+again; running out of memory again puts it back.
+"""
+
+import gc
+import os
+import json
+import tempfile
+
+import canary_config
+
+# Upper edges (seconds) of the duration buckets; the last one is open-ended
+BUCKET_EDGES = [10, 30, 60, 120, 300, 600]
+# Keep this fraction of device memory free when deciding to grow a batch
+HEADROOM = 0.15
+# Clean batches in a row after which a bucket may grow past the size that ran out of memory
+REPROBE_AFTER = 50
+
+def bucket_for(duration):
+    """Name of the duration bucket a file falls into, e.g. "<=30s" """
+    for edge in BUCKET_EDGES:
+        if duration <= edge:
+            return f"<={edge}s"
+    return f">{BUCKET_EDGES[-1]}s"
+
+def default_profile_path():
+    return os.path.join(canary_config.get("paths", "model_dir"), "batch_profile.json")
+
+# Allocation failures as torch reports them: CUDA, the CPU allocator, and mmap/malloc on the host
+OOM_MESSAGES = ("out of memory", "not enough memory", "can't allocate memory", "cannot allocate memory")
+
+def is_oom(error):
+    """True for allocation failures on the GPU or the host"""
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    return isinstance(error, RuntimeError) and any(text in message for text in OOM_MESSAGES)
+
+class BatchProfile:
+    """
+    Per device and duration bucket: the best batch size that worked ("best"),
+    the smallest one that ran out of memory ("oom") and the clean batches
+    since ("clean"), persisted as JSON
+    """
+
+    def __init__(self, path=None, device_name="cpu"):
+        self.path = path or default_profile_path()
+        self.device_name = device_name
+        self.sizes = {}
+        try:
+            with open(self.path) as f:
+                self.sizes = json.load(f).get(device_name, {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, bucket, key, default=None):
+        return self.sizes.get(bucket, {}).get(key, default)
+
+    def set(self, bucket, key, size):
+        self.sizes.setdefault(bucket, {})[key] = size
+
+    def clear(self, bucket, key):
+        self.sizes.get(bucket, {}).pop(key, None)
+
+    def save(self):
+        """Merge into the profile file and replace it atomically"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[self.device_name] = self.sizes
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save batch profile to {self.path}: {e}")
+
+class MemoryMonitor:
+    """Peak memory of the last batch relative to what the device has"""
+
+    def __init__(self, device="cpu"):
+        self.device = str(device)
+        self.cuda = self.device.startswith("cuda")
+        if self.cuda:
+            import torch
+            self.torch = torch
+
+    @property
+    def device_name(self):
+        return self.torch.cuda.get_device_name(self.device) if self.cuda else "cpu"
+
+    def reset(self):
+        if self.cuda:
+            self.torch.cuda.reset_peak_memory_stats(self.device)
+
+    def release(self):
+        """Free what a failed batch left behind (call once its exception is gone)"""
+        gc.collect()
+        if self.cuda:
+            self.torch.cuda.empty_cache()
+
+    def can_grow(self, size, new_size):
+        """Whether scaling the last batch from size to new_size should still fit"""
+        if self.cuda:
+            _, total = self.torch.cuda.mem_get_info(self.device)
+            peak = self.torch.cuda.max_memory_allocated(self.device)
+            return peak * new_size / size < total * (1 - HEADROOM)
+        return _host_available_fraction() > HEADROOM
+
+def _host_available_fraction():
+    """MemAvailable / MemTotal from /proc/meminfo (1.0 if unknown)"""
+    try:
+        info = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                info[key] = int(value.split()[0])
+        return info["MemAvailable"] / info["MemTotal"]
+    except (OSError, KeyError, ValueError):
+        return 1.0
+
+def transcribe_adaptive(backend, audio_files, durations, options, max_batch_size=64, profile_path=None):
+    """
+    Transcribe audio_files with batch sizes adapted to memory
+
+    Args:
+        backend: Loaded backend (see backends.py)
+        audio_files: List of audio file paths
+        durations: Duration in seconds of each file
+        options: Dict with taskname, source_lang, target_lang, pnc, batch_size
+                 (batch_size is the starting size for buckets with no profile entry)
+        max_batch_size: Never grow a batch beyond this
+        profile_path: Profile file (default: batch_profile.json in paths.model_dir)
+
+    Returns:
+        List of results in the order of audio_files
+    """
+    monitor = MemoryMonitor(backend.device)
+    profile = BatchProfile(profile_path, monitor.device_name)
+    prompt = {key: options[key] for key in ("taskname", "source_lang", "target_lang", "pnc")}
+    results = [None] * len(audio_files)
+
+    def run(indices):
+        """Transcribe one batch, halving it on allocation failure; returns False if it was split"""
+        nonlocal ceiling, clean
+        monitor.reset()
+        texts = None
+        try:
+            texts = backend.transcribe([audio_files[i] for i in indices], batch_size=len(indices), **prompt)
+        except Exception as e:
+            if not is_oom(e) or len(indices) == 1:
+                raise
+        if texts is not None:
+            for i, text in zip(indices, texts):
+                results[i] = text
+            worked.add(len(indices))
+            clean += 1
+            if ceiling <= max_batch_size and clean >= REPROBE_AFTER:
+                print(f"{clean} clean batches since running out of memory with {ceiling}; "
+                      f"trying larger batches again")
+                ceiling = max_batch_size + 1
+            return True
+
+        # Split outside the except block: the exception's traceback holds the failed
+        # batch's tensors, which have to be gone before release() can free them
+        monitor.release()
+        ceiling = min(ceiling, len(indices))
+        clean = 0
+        half = len(indices) // 2
+        print(f"Out of memory with batch of {len(indices)}, retrying as {half} + {len(indices) - half}")
+        run(indices[:half])
+        run(indices[half:])
+        return False
+
+    buckets = {}
+    for i, duration in enumerate(durations):
+        buckets.setdefault(bucket_for(duration), []).append(i)
+
+    for bucket, indices in buckets.items():
+        ceiling = profile.get(bucket, "oom", max_batch_size + 1)
+        clean = profile.get(bucket, "clean", 0)
+        size = max(1, min(profile.get(bucket, "best", options["batch_size"]), max_batch_size, ceiling - 1))
+        # Batch sizes that ran without running out of memory, this run or before
+        worked = {profile.get(bucket, "best", 0)}
+        position = 0
+        while position < len(indices):
+            batch = indices[position:position + size]
+            position += len(batch)
+            if run(batch):
+                new_size = min(size * 2, max_batch_size, ceiling - 1)
+                if len(batch) == size and new_size > size:
+                    if monitor.can_grow(size, new_size):
+                        size = new_size
+            else:
+                size = max(1, len(batch) // 2)
+        if ceiling <= max_batch_size:
+            profile.set(bucket, "oom", ceiling)
+            profile.set(bucket, "clean", clean)
+        else:
+            profile.clear(bucket, "oom")
+            profile.clear(bucket, "clean")
+        # A size that worked once but ran out of memory later is no longer the best
+        best = max((worked_size for worked_size in worked if worked_size < ceiling), default=0)
+        if best:
+            profile.set(bucket, "best", best)
+            print(f"Batch size for {bucket} files: {best}")
+
+    profile.save()
+    return results
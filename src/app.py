@@ -5,32 +5,32 @@ import json
 import argparse
 import datetime
 from pathlib import Path
-from nemo.collections.asr.models import EncDecMultiTaskModel
+from backends import load_backend
+from canary_model import model_name_for
+from canary_daemon import request_transcription, DaemonUnavailable, RemoteModel
+from audio_store import AudioStore, StoredAudioBackend
+from inference_scheduler import BATCH
+import canary_config
+from transcript_index import index_result
 
 class CanaryASR:
-    def __init__(self, beam_size=1):
-        print("Loading Canary-1B model...")
-        self.model = EncDecMultiTaskModel.from_pretrained('nvidia/canary-1b')
-        
-        # Update decode params
-        decode_cfg = self.model.cfg.decoding
-        decode_cfg.beam.beam_size = beam_size
-        self.model.change_decoding_strategy(decode_cfg)
+    def __init__(self, beam_size=1, audio_store=None):
+        print(f"Loading {model_name_for('batch')}...")
+        self.backend = load_backend(role="batch", beam_size=beam_size)
+        if audio_store:
+            # Decode each file once and reuse the samples on later runs
+            self.backend = StoredAudioBackend(self.backend, AudioStore(audio_store))
         print("Model loaded successfully!")
         
     def transcribe_audio(self, audio_paths, batch_size=1):
         """Transcribe list of audio files (English ASR)"""
-        return self.model.transcribe(
-            paths2audio_files=audio_paths,
-            batch_size=batch_size
-        )
+        return self.backend.transcribe(audio_paths, batch_size=batch_size)
     
     def process_with_manifest(self, manifest_path, batch_size=1):
         """Process audio according to manifest file specifications"""
-        return self.model.transcribe(
-            manifest_path,
-            batch_size=batch_size
-        )
+        with open(manifest_path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return self.backend.transcribe_entries(entries, batch_size=batch_size)
     
     def create_manifest(self, audio_paths, output_path, task_configs):
         """
@@ -65,22 +65,39 @@ class CanaryASR:
                 
         return manifest_data
 
-    def save_results(self, results, audio_paths, task, source_lang, target_lang):
+    @staticmethod
+    def save_results(results, audio_paths, task, source_lang, target_lang):
         """Save results to transcripts directory"""
-        os.makedirs("/workspace/transcripts", exist_ok=True)
+        output_dir = canary_config.get("paths", "output_dir")
+        os.makedirs(output_dir, exist_ok=True)
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         
         for i, (path, text) in enumerate(zip(audio_paths, results)):
             filename = Path(path).stem
             if task == "asr":
-                output_file = f"/workspace/transcripts/{filename}_{source_lang}_transcription_{timestamp}.txt"
+                output_file = f"{output_dir}/{filename}_{source_lang}_transcription_{timestamp}.txt"
             else:
-                output_file = f"/workspace/transcripts/{filename}_{source_lang}_to_{target_lang}_{timestamp}.txt"
+                output_file = f"{output_dir}/{filename}_{source_lang}_to_{target_lang}_{timestamp}.txt"
                 
             with open(output_file, "w") as f:
                 f.write(text)
+            index_result(output_file, text, path, "asr" if task == "asr" else "s2t_translation",
+                         source_lang, target_lang)
             print(f"Result saved to {output_file}")
 
+def print_results(args, results):
+    """Print one result per input file"""
+    simple_asr = args.task == "asr" and args.source_lang == "en" and args.target_lang == "en"
+    for i, (path, text) in enumerate(zip(args.audio, results)):
+        print(f"\nAudio {i+1}: {Path(path).name}")
+        if not simple_asr:
+            print(f"Source language: {args.source_lang}")
+            print(f"Target language: {args.target_lang}")
+        if args.task == "asr":
+            print(f"Transcription: {text}")
+        else:
+            print(f"Translation: {text}")
+
 def main():
     parser = argparse.ArgumentParser(description="Canary ASR/Translation CLI")
     parser.add_argument("--audio", "-a", type=str, nargs="+", help="Path to audio file(s)")
@@ -95,6 +112,11 @@ def main():
     parser.add_argument("--batch-size", "-b", type=int, default=1, help="Batch size")
     parser.add_argument("--beam-size", type=int, default=1, help="Beam size for decoding")
     parser.add_argument("--save", action="store_true", help="Save results to transcripts directory")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Always load the model in-process, even if the daemon is running")
+    parser.add_argument("--audio-store", type=str, default=canary_config.get("paths", "audio_store"),
+                        help="Keep decoded 16 kHz audio in this directory and reuse it on later runs "
+                             "(default: paths.audio_store, if set)")
     
     args = parser.parse_args()
     
@@ -106,19 +128,44 @@ def main():
         if not os.path.exists(audio_path):
             parser.error(f"Audio file not found: {audio_path}")
     
-    # Initialize the model
-    asr = CanaryASR(beam_size=args.beam_size)
+    task_name = "asr" if args.task == "asr" else "s2t_translation"
+    
+    # Use the warm model of a running daemon when there is one
+    results = None
+    if not args.no_daemon:
+        try:
+            if args.audio_store:
+                backend = StoredAudioBackend(RemoteModel(beam_size=args.beam_size, priority=BATCH, role="batch").load(),
+                                             AudioStore(args.audio_store))
+                results = backend.transcribe(args.audio, task_name, args.source_lang, args.target_lang,
+                                             args.pnc, batch_size=args.batch_size)
+            else:
+                results = request_transcription(
+                    args.audio,
+                    taskname=task_name,
+                    source_lang=args.source_lang,
+                    target_lang=args.target_lang,
+                    pnc=args.pnc,
+                    beam_size=args.beam_size,
+                    batch_size=args.batch_size
+                )
+        except DaemonUnavailable:
+            pass
     
-    if args.task == "asr" and args.source_lang == "en" and args.target_lang == "en":
+    if results is not None:
+        print_results(args, results)
+    elif args.task == "asr" and args.source_lang == "en" and args.target_lang == "en":
+        # Initialize the model
+        asr = CanaryASR(beam_size=args.beam_size, audio_store=args.audio_store)
+        
         # Simple English ASR
         results = asr.transcribe_audio(args.audio, batch_size=args.batch_size)
-        
-        for i, (path, text) in enumerate(zip(args.audio, results)):
-            print(f"\nAudio {i+1}: {Path(path).name}")
-            print(f"Transcription: {text}")
+        print_results(args, results)
     else:
+        # Initialize the model
+        asr = CanaryASR(beam_size=args.beam_size, audio_store=args.audio_store)
+        
         # Create manifest for specified task
-        task_name = "asr" if args.task == "asr" else "s2t_translation"
         config = {
             "taskname": task_name,
             "source_lang": args.source_lang,
@@ -131,15 +178,7 @@ def main():
         
         # Process with manifest
         results = asr.process_with_manifest(manifest_path, batch_size=args.batch_size)
-        
-        for i, (path, text) in enumerate(zip(args.audio, results)):
-            print(f"\nAudio {i+1}: {Path(path).name}")
-            print(f"Source language: {args.source_lang}")
-            print(f"Target language: {args.target_lang}")
-            if args.task == "asr":
-                print(f"Transcription: {text}")
-            else:
-                print(f"Translation: {text}")
+        print_results(args, results)
         
         # Clean up temp manifest
         if os.path.exists(manifest_path):
@@ -147,7 +186,7 @@ def main():
     
     # Save results if requested
     if args.save:
-        asr.save_results(results, args.audio, args.task, args.source_lang, args.target_lang)
+        CanaryASR.save_results(results, args.audio, args.task, args.source_lang, args.target_lang)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
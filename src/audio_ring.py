@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Lock-free single-producer/single-consumer audio ring.
+
+The sounddevice callback (producer) copies each block into a preallocated
+numpy array and then publishes it by advancing write_index; the processing
+thread (consumer) copies frames out and advances read_index. Each index is
+written by one side only and is a plain int, so under the GIL a store is
+atomic and no locks are needed. Neither side allocates sample memory per
+block.
+
+Instead of printing PortAudio status flags from the audio thread, the ring
+counts them, together with frames dropped because the ring was full and
+reads that timed out with no audio, and exposes them through metrics().
+"""
+
+import time
+import numpy as np
+
+class AudioRing:
+    def __init__(self, capacity, channels=1, samplerate=16000, dtype=np.float32):
+        """
+        Initialize AudioRing
+
+        Args:
+            capacity: Ring size in frames
+            channels: Number of channels per frame
+            samplerate: Sampling rate, used to pace the consumer while it waits
+            dtype: Sample type (sounddevice delivers float32 by default)
+        """
+        self.buffer = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.samplerate = samplerate
+        # Total frames ever written/read; only the producer/consumer writes each
+        self.write_index = 0
+        self.read_index = 0
+
+        # Producer-side counters
+        self.dropped_frames = 0
+        self.overflows = 0
+        self.input_overflows = 0
+        self.input_underflows = 0
+        # Consumer-side counter
+        self.underflows = 0
+
+    def available(self):
+        """Frames written but not yet read"""
+        return self.write_index - self.read_index
+
+    def record_status(self, status):
+        """Count PortAudio status flags (producer side)"""
+        if status.input_overflow:
+            self.input_overflows += 1
+        if status.input_underflow:
+            self.input_underflows += 1
+
+    def write(self, data):
+        """
+        Copy a block of frames into the ring (producer side)
+
+        Frames that do not fit are dropped and counted, since the audio
+        thread must never block.
+        """
+        frames = len(data)
+        free = self.capacity - (self.write_index - self.read_index)
+        if frames > free:
+            self.overflows += 1
+            self.dropped_frames += frames - free
+            frames = free
+            if frames == 0:
+                return 0
+
+        start = self.write_index % self.capacity
+        first = min(frames, self.capacity - start)
+        self.buffer[start:start + first] = data[:first]
+        if first < frames:
+            self.buffer[:frames - first] = data[first:frames]
+
+        # Publish only after the samples are in place
+        self.write_index += frames
+        return frames
+
+    def read_into(self, out, timeout=0.1):
+        """
+        Copy up to len(out) frames into out (consumer side)
+
+        Waits up to timeout seconds for audio, sleeping for roughly as long
+        as it takes the device to deliver the missing frames instead of
+        spinning. Returns the number of frames copied.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            available = self.write_index - self.read_index
+            if available:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.underflows += 1
+                return 0
+            time.sleep(min(remaining, len(out) / self.samplerate))
+
+        frames = min(available, len(out))
+        start = self.read_index % self.capacity
+        first = min(frames, self.capacity - start)
+        out[:first] = self.buffer[start:start + first]
+        if first < frames:
+            out[first:frames] = self.buffer[:frames - first]
+
+        # Release the space only after the samples are copied out
+        self.read_index += frames
+        return frames
+
+    def metrics(self):
+        """Snapshot of the ring counters"""
+        return {
+            'overflows': self.overflows,
+            'dropped_frames': self.dropped_frames,
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+            'underflows': self.underflows,
+            'fill': self.available() / self.capacity
+        }
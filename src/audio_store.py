@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Decoded-audio store for repeated batch runs.
+
+The first run over a corpus decodes every file to 16 kHz mono and appends
+the samples to a pack file in the store directory; later runs map the pack
+and read the samples in place, so mp3/m4a/flac files are not decoded and
+resampled again for every beam size, language or pnc setting.
+
+    audio.pack    samples of every decoded file, back to back
+    index.jsonl   where each decoded file lives in the pack, and which
+                  source files (path, size, mtime) have which content
+
+Entries are keyed by a hash of the source file's bytes, so copies of a file
+share one entry, and a source whose size or mtime changed is hashed again:
+if its content changed it is decoded again, otherwise it maps to its
+existing entry. The pack only grows; delete the directory to reclaim the
+space of stale entries.
+
+Samples are stored as float32 (read zero-copy) or int16 (half the size,
+converted to float32 when read), set with audio_store.dtype in the config.
+Files soundfile cannot open are left to the model's own loader.
+"""
+
+import os
+import json
+import mmap
+import fcntl
+import hashlib
+
+import numpy as np
+
+import canary_config
+from backends import Backend, SAMPLE_RATE
+
+PACK_FILE = "audio.pack"
+INDEX_FILE = "index.jsonl"
+ALIGNMENT = 64
+DTYPES = ("float32", "int16")
+
+def content_hash(path, block_size=1 << 20):
+    """Hash of a file's bytes"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def decode_file(path, block_frames=1 << 16):
+    """Decode an audio file to 16 kHz mono float32"""
+    import soundfile as sf
+    from resample import StreamResampler
+
+    with sf.SoundFile(path) as f:
+        if f.samplerate == SAMPLE_RATE and f.channels == 1:
+            return f.read(dtype="float32")
+        resampler = StreamResampler(f.samplerate, f.channels, out_rate=SAMPLE_RATE, max_block=block_frames)
+        expected = -(-f.frames * resampler.up // resampler.down)
+        parts = []
+        sink = lambda out: parts.append(out[:, 0].copy())
+        for block in f.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+            resampler.process(block, sink)
+        # Flush the filter tail, then drop its group delay from the front
+        resampler.process(np.zeros((resampler.taps, f.channels), dtype=np.float32), sink)
+    samples = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+    delay = round((resampler.taps * resampler.up - 1) / 2 / resampler.down)
+    return samples[delay:delay + expected]
+
+class AudioStore:
+    def __init__(self, directory, dtype=None):
+        """
+        Initialize AudioStore
+
+        Args:
+            directory: Store directory, created if missing
+            dtype: float32 or int16 for newly decoded files (default: audio_store.dtype, else float32)
+        """
+        self.directory = directory
+        self.dtype = dtype or canary_config.get("audio_store", "dtype", "float32")
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Unknown audio store dtype: {self.dtype} (expected {' or '.join(DTYPES)})")
+        os.makedirs(directory, exist_ok=True)
+        self.pack_path = os.path.join(directory, PACK_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.lock_path = os.path.join(directory, ".lock")
+        # Content key -> {"offset", "frames", "dtype"}
+        self.entries = {}
+        # Source path -> {"size", "mtime_ns", "key"}
+        self.sources = {}
+        self.index_offset = 0
+        self.map = None
+        self.hits = 0
+        self.decoded = 0
+        self._read_index()
+
+    def _read_index(self):
+        """Apply index lines appended since the last read (possibly by another process)"""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # being written; read it next time
+                self.index_offset += len(line)
+                record = json.loads(line)
+                if "source" in record:
+                    self.sources[record["source"]] = record
+                else:
+                    self.entries[record["key"]] = record
+
+    def _key(self, digest):
+        return f"{digest}:{self.dtype}"
+
+    def _view(self, entry):
+        """Samples of an entry, mapped from the pack"""
+        if not entry["frames"]:
+            return np.zeros(0, dtype=np.float32)
+        itemsize = np.dtype(entry["dtype"]).itemsize
+        end = entry["offset"] + entry["frames"] * itemsize
+        if self.map is None or len(self.map) < end:
+            with open(self.pack_path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        samples = np.frombuffer(self.map, dtype=entry["dtype"], count=entry["frames"], offset=entry["offset"])
+        if entry["dtype"] == "int16":
+            return samples.astype(np.float32) / 32768.0
+        return samples
+
+    def _append(self, lines):
+        with open(self.index_path, "a") as f:
+            for record in lines:
+                f.write(json.dumps(record) + "\n")
+
+    def _add(self, path, stat, digest):
+        """Decode path into the pack unless its content is there; caller holds the lock"""
+        key = self._key(digest)
+        records = []
+        if key not in self.entries:
+            samples = decode_file(path)
+            if self.dtype == "int16":
+                samples = (np.clip(samples, -1.0, 1.0) * 32767.0).astype(np.int16)
+            with open(self.pack_path, "ab") as f:
+                offset = f.tell()
+                padding = -offset % ALIGNMENT
+                f.write(b"\0" * padding)
+                f.write(np.ascontiguousarray(samples).tobytes())
+            entry = {"key": key, "offset": offset + padding, "frames": len(samples), "dtype": self.dtype}
+            self.entries[key] = entry
+            records.append(entry)
+            self.decoded += 1
+        source = {"source": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "key": key}
+        self.sources[path] = source
+        records.append(source)
+        self._append(records)
+
+    def get(self, path):
+        """
+        16 kHz mono float32 samples of an audio file, decoding it on first use
+
+        Returns:
+            Array of samples, or None if the file cannot be decoded here
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        source = self.sources.get(path)
+        if source is None or (source["size"], source["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+            self._read_index()
+            source = self.sources.get(path)
+        if source is not None and (source["size"], source["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            self.hits += 1
+            return self._view(self.entries[source["key"]])
+
+        # New or changed source: hash it, and decode it if the content is new
+        digest = content_hash(path)
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._read_index()
+            try:
+                self._add(path, stat, digest)
+            except Exception as e:
+                print(f"Not storing {path} ({type(e).__name__}: {e})")
+                return None
+        return self._view(self.entries[self._key(digest)])
+
+class StoredAudioBackend(Backend):
+    """Backend wrapper that replaces audio file paths with samples from an AudioStore"""
+
+    name = "audio_store"
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+        self.capabilities = backend.capabilities
+        self.device = backend.device
+
+    def load(self):
+        self.backend.load()
+        self.device = self.backend.device
+        return self
+
+    def warmup(self):
+        self.backend.warmup()
+
+    def set_decoding(self, beam_size=1):
+        self.backend.set_decoding(beam_size)
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        audio = list(audio)
+        if not self.capabilities.get("in_memory_audio") or not audio or not isinstance(audio[0], str):
+            return self.backend.transcribe(audio, taskname, source_lang, target_lang, pnc, batch_size)
+
+        stored = [self.store.get(path) for path in audio]
+        results = [None] * len(audio)
+        # Files the store could not decode still go to the model as paths
+        for indices, items in (([i for i, s in enumerate(stored) if s is not None],
+                                [s for s in stored if s is not None]),
+                               ([i for i, s in enumerate(stored) if s is None],
+                                [path for path, s in zip(audio, stored) if s is None])):
+            if items:
+                for i, text in zip(indices, self.backend.transcribe(items, taskname, source_lang, target_lang,
+                                                                    pnc, batch_size=batch_size)):
+                    results[i] = text
+        return results
+
+    def transcribe_targets(self, audio, targets, source_lang="en", pnc="yes"):
+        return self.backend.transcribe_targets(audio, targets, source_lang, pnc)
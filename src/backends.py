@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Inference backends.
+
+A backend wraps one speech model behind a small interface, so the entry
+points never call NeMo directly:
+
+    load()                  load the model (once; later calls do nothing)
+    warmup()                run one second of silence so the first real call is fast
+    transcribe(audio, ...)  one batched call with one prompt; audio is a list of
+                            file paths or of 16 kHz mono float32 arrays
+    transcribe_targets()    in-memory audio into several target languages
+    transcribe_entries()    manifest-style entries, each with its own prompt
+    set_decoding()          change the beam size without reloading
+    capabilities            dict of what the backend supports
+
+Two backends ship here: "nemo" (Canary through canary_model) and "stub", a
+deterministic CPU stand-in whose latency is a function of audio length, for
+profiling the pipeline without the checkpoint. The daemon client
+(canary_daemon.RemoteModel) is a backend as well. load_backend() picks one
+from its argument, $CANARY_BACKEND or model.backend in the config; other
+backends can be added with register_backend().
+"""
+
+import os
+import time
+import threading
+
+import canary_config
+
+SAMPLE_RATE = 16000
+
+class Backend:
+    name = None
+    capabilities = {
+        "tasks": ("asr", "s2t_translation"),
+        "languages": ("en", "de", "es", "fr"),
+        "in_memory_audio": True,
+        "beam_search": True,
+        "shared_encoder": False
+    }
+    device = "cpu"
+
+    def load(self):
+        """Load the model; a backend must be usable after this returns"""
+        return self
+
+    def warmup(self):
+        import numpy as np
+        self.transcribe([np.zeros(SAMPLE_RATE, dtype=np.float32)])
+
+    def set_decoding(self, beam_size=1):
+        """Change the beam size of later calls"""
+        raise NotImplementedError
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        """
+        Run a list of inputs through the model with one prompt
+
+        Returns:
+            List of result strings, one per input
+        """
+        raise NotImplementedError
+
+    def transcribe_targets(self, audio, targets, source_lang="en", pnc="yes"):
+        """
+        Decode in-memory audio into several target languages
+
+        Returns:
+            Dict of target language -> list of texts, one per input
+        """
+        from canary_model import taskname_for
+        audio = list(audio)
+        return {target: self.transcribe(audio, taskname_for(source_lang, target), source_lang, target, pnc,
+                                        batch_size=len(audio)) if audio else []
+                for target in targets}
+
+    def transcribe_entries(self, entries, batch_size=1):
+        """
+        Transcribe manifest-style entries, batching those that share a prompt
+
+        Args:
+            entries: Dicts with audio_filepath, taskname, source_lang, target_lang and pnc
+
+        Returns:
+            List of result strings in the order of entries
+        """
+        groups = {}
+        for i, entry in enumerate(entries):
+            prompt = (entry.get("taskname", "asr"), entry.get("source_lang", "en"),
+                      entry.get("target_lang", "en"), entry.get("pnc", "yes"))
+            groups.setdefault(prompt, []).append(i)
+
+        results = [None] * len(entries)
+        for prompt, indices in groups.items():
+            texts = self.transcribe([entries[i]["audio_filepath"] for i in indices], *prompt,
+                                    batch_size=batch_size)
+            for i, text in zip(indices, texts):
+                results[i] = text
+        return results
+
+class NemoBackend(Backend):
+    """Canary through NeMo; see canary_model for loading"""
+
+    name = "nemo"
+    capabilities = {**Backend.capabilities, "shared_encoder": True}
+
+    def __init__(self, beam_size=1, model_name=None, model_dir=None, device=None):
+        self.beam_size = beam_size
+        self.model_name = model_name
+        self.model_dir = model_dir
+        self.requested_device = device
+        self.model = None
+
+    def load(self):
+        from canary_model import load_model
+        if self.model is None:
+            self.model = load_model(beam_size=self.beam_size, model_name=self.model_name,
+                                    model_dir=self.model_dir, device=self.requested_device)
+            self.device = str(next(self.model.parameters()).device)
+        return self
+
+    def set_decoding(self, beam_size=1):
+        from canary_model import set_decoding
+        self.beam_size = beam_size
+        set_decoding(self.model, beam_size)
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        from canary_model import transcribe
+        return transcribe(self.model, list(audio), taskname, source_lang, target_lang, pnc, batch_size)
+
+    def transcribe_targets(self, audio, targets, source_lang="en", pnc="yes"):
+        from canary_model import transcribe_targets
+        return transcribe_targets(self.model, audio, targets, source_lang, pnc)
+
+class StubBackend(Backend):
+    """
+    Deterministic stand-in that loads nothing
+
+    Every input gets a text derived from its prompt and length, after a
+    sleep of overhead + per_item * inputs + rtf * seconds of audio. Calls
+    are serialized like on a single GPU.
+    """
+
+    name = "stub"
+
+    def __init__(self, beam_size=1, rtf=None, overhead=None, per_item=None, model_name=None, **kwargs):
+        self.beam_size = beam_size
+        self.model_name = model_name
+        self.rtf = rtf if rtf is not None else canary_config.get("stub", "rtf", 0.0)
+        self.overhead = overhead if overhead is not None else canary_config.get("stub", "overhead", 0.0)
+        self.per_item = per_item if per_item is not None else canary_config.get("stub", "per_item", 0.0)
+        self.lock = threading.Lock()
+
+    def set_decoding(self, beam_size=1):
+        self.beam_size = beam_size
+
+    @staticmethod
+    def _seconds(item):
+        if isinstance(item, str):
+            import soundfile as sf
+            return sf.info(item).duration
+        return len(item) / SAMPLE_RATE
+
+    def latency(self, seconds):
+        """Simulated time of one call over inputs of the given lengths"""
+        return self.overhead + self.per_item * len(seconds) + self.rtf * sum(seconds)
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        seconds = [self._seconds(item) for item in audio]
+        with self.lock:
+            time.sleep(self.latency(seconds))
+        return [f"[{source_lang}->{target_lang}] {s:.2f} s of audio" for s in seconds]
+
+BACKENDS = {
+    NemoBackend.name: NemoBackend,
+    StubBackend.name: StubBackend
+}
+
+def register_backend(name, backend_class):
+    """Make a Backend subclass available to load_backend() under name"""
+    BACKENDS[name] = backend_class
+
+def backend_name(name=None):
+    """Backend to use: name, else $CANARY_BACKEND, else model.backend from the config"""
+    return name or os.environ.get("CANARY_BACKEND") or canary_config.get("model", "backend", NemoBackend.name)
+
+def load_backend(name=None, role=None, **options):
+    """
+    Create and load a backend
+
+    Args:
+        name: nemo, stub or a registered name (default: see backend_name())
+        role: final, interim or batch; picks the checkpoint configured for it
+              (canary_model.model_name_for) unless model_name is given
+        options: Passed to the backend, e.g. beam_size and device
+    """
+    name = backend_name(name)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name} (available: {', '.join(sorted(BACKENDS))})")
+    if role is not None and "model_name" not in options:
+        from canary_model import model_name_for
+        options["model_name"] = model_name_for(role)
+    return BACKENDS[name](**options).load()
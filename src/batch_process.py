@@ -2,12 +2,156 @@
 
 import os
 import argparse
-import json
 import datetime
 from pathlib import Path
-from nemo.collections.asr.models import EncDecMultiTaskModel
+from backends import load_backend
+from canary_model import model_name_for
+from canary_daemon import request_transcription, DaemonUnavailable, RemoteModel
+from batch_workers import transcribe_sharded, audio_duration, WorkerPool
+from adaptive_batch import transcribe_adaptive
+from inference_scheduler import BATCH
+from watch_folder import FolderWatcher, parse_watch_spec, result_filename
+from file_discovery import DirectoryWalker
+from audio_store import AudioStore, StoredAudioBackend
+from transcript_index import index_result
+import canary_config
 
-def process_directory(audio_dir, output_dir, task, source_lang, target_lang, pnc, batch_size, beam_size):
+# Files transcribed per chunk while the directory is still being walked, in batches
+CHUNK_BATCHES = 8
+
+def open_backend(beam_size, use_daemon=True, audio_store=None):
+    """
+    The daemon (at batch priority) when it is running and use_daemon is set, else a model loaded here
+
+    With audio_store (a directory), files are decoded once into that store
+    and read from it on later runs; see audio_store.py.
+    """
+    backend = None
+    if use_daemon:
+        try:
+            backend = RemoteModel(beam_size=beam_size, priority=BATCH, role="batch").load()
+            print("Sending files to the daemon")
+        except DaemonUnavailable:
+            pass
+    if backend is None:
+        print(f"Loading {model_name_for('batch')}...")
+        backend = load_backend(role="batch", beam_size=beam_size)
+        print("Model loaded successfully!")
+    if audio_store:
+        backend = StoredAudioBackend(backend, AudioStore(audio_store))
+    return backend
+
+def transcribe_in_process(audio_files, taskname, source_lang, target_lang, pnc, batch_size, beam_size,
+                          adaptive=None, audio_store=None):
+    """Load the backend in this process and transcribe the files"""
+    backend = open_backend(beam_size, use_daemon=False, audio_store=audio_store)
+    return transcribe_with_backend(backend, audio_files, taskname, source_lang, target_lang, pnc,
+                                   batch_size, adaptive=adaptive)
+
+def transcribe_with_backend(backend, audio_files, taskname, source_lang, target_lang, pnc, batch_size,
+                            adaptive=None):
+    """Transcribe the files on a loaded backend, with a fixed or an adaptive batch size"""
+    if adaptive:
+        print(f"\nProcessing {len(audio_files)} files with adaptive batch sizes...")
+        options = {
+            "taskname": taskname,
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "pnc": pnc,
+            "batch_size": batch_size
+        }
+        durations = [audio_duration(path) for path in audio_files]
+        return transcribe_adaptive(backend, audio_files, durations, options,
+                                   max_batch_size=adaptive["max_batch_size"],
+                                   profile_path=adaptive["profile_path"])
+    
+    print(f"\nProcessing {len(audio_files)} files with batch size {batch_size}...")
+    return backend.transcribe(audio_files, taskname, source_lang, target_lang, pnc, batch_size=batch_size)
+
+def worker_options(taskname, source_lang, target_lang, pnc, batch_size, beam_size, adaptive=None,
+                   audio_store=None):
+    """Options dict passed to worker processes (see batch_workers)"""
+    return {
+        "taskname": taskname,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "pnc": pnc,
+        "batch_size": batch_size,
+        "beam_size": beam_size,
+        "adaptive": adaptive,
+        "audio_store": audio_store
+    }
+
+def transcribe_files(audio_files, taskname, source_lang, target_lang, pnc, batch_size, beam_size,
+                     use_daemon=True, workers=None, devices=None, adaptive=None, audio_store=None):
+    """
+    Transcribe a list of files through the batch path and return the texts in input order
+
+    Worker processes are used when workers or devices are given, otherwise a
+    running daemon, otherwise a model loaded in this process. See
+    process_directory for the arguments.
+    """
+    results = None
+    
+    if workers or devices:
+        # Shard the files over several model replicas
+        options = worker_options(taskname, source_lang, target_lang, pnc, batch_size, beam_size,
+                                 adaptive, audio_store)
+        print(f"\nProcessing {len(audio_files)} files with batch size {batch_size} across workers...")
+        results = transcribe_sharded(audio_files, options, workers=workers, devices=devices)
+    elif use_daemon and not adaptive and not audio_store:
+        # Use the warm model of a running daemon when there is one
+        try:
+            results = request_transcription(
+                audio_files,
+                taskname=taskname,
+                source_lang=source_lang,
+                target_lang=target_lang,
+                pnc=pnc,
+                beam_size=beam_size,
+                batch_size=batch_size
+            )
+            print(f"Processed {len(audio_files)} files on the daemon")
+        except DaemonUnavailable:
+            pass
+    
+    if results is None:
+        results = transcribe_in_process(audio_files, taskname, source_lang, target_lang,
+                                        pnc, batch_size, beam_size, adaptive=adaptive, audio_store=audio_store)
+    return results
+
+def transcribe_chunks(walker, taskname, source_lang, target_lang, pnc, batch_size, beam_size,
+                      use_daemon=True, workers=None, devices=None, adaptive=None, audio_store=None):
+    """
+    Yield (audio_files, results) for the files of a DirectoryWalker
+
+    Files are transcribed in chunks as the walk finds them, on one backend
+    opened for the first chunk. With workers or devices, the worker
+    processes are started once and each chunk goes to the next free one.
+    """
+    chunk_size = CHUNK_BATCHES * (adaptive["max_batch_size"] if adaptive else batch_size)
+    if workers or devices:
+        options = worker_options(taskname, source_lang, target_lang, pnc, batch_size, beam_size,
+                                 adaptive, audio_store)
+        print(f"\nProcessing files in chunks of {chunk_size} across workers...")
+        with WorkerPool(options, workers=workers, devices=devices) as pool:
+            yield from pool.map(iter(lambda: walker.take(chunk_size), []))
+        return
+
+    backend = None
+    while True:
+        audio_files = walker.take(chunk_size)
+        if not audio_files:
+            return
+        if backend is None:
+            # The daemon does not adapt batch sizes
+            backend = open_backend(beam_size, use_daemon=use_daemon and not adaptive, audio_store=audio_store)
+        yield audio_files, transcribe_with_backend(backend, audio_files, taskname, source_lang, target_lang,
+                                                   pnc, batch_size, adaptive=adaptive)
+
+def process_directory(audio_dir, output_dir, task, source_lang, target_lang, pnc, batch_size, beam_size,
+                      use_daemon=True, workers=None, devices=None, adaptive=None, scan_workers=8,
+                      audio_store=None):
     """
     Process all audio files in a directory
     
@@ -20,93 +164,96 @@ def process_directory(audio_dir, output_dir, task, source_lang, target_lang, pnc
         pnc: Include punctuation and capitalization
         batch_size: Batch size for processing
         beam_size: Beam size for decoding
+        use_daemon: Send the files to a running daemon instead of loading the model
+        workers: Number of worker processes, each with its own model replica
+        devices: Devices to spread the workers over, e.g. ["cuda:0", "cuda:1"] or ["cpu"]
+        adaptive: Dict with max_batch_size and profile_path to adapt the batch size to
+                  memory instead of using batch_size throughout (None for a fixed size)
+        scan_workers: Threads listing directories; inference starts while they walk
+        audio_store: Directory of a decoded-audio store to read and fill (None to decode every run)
     """
-    # Find all audio files in directory
-    audio_extensions = ['.wav', '.mp3', '.flac', '.ogg', '.m4a']
-    audio_files = []
-    
-    for root, _, files in os.walk(audio_dir):
-        for file in files:
-            if Path(file).suffix.lower() in audio_extensions:
-                audio_files.append(os.path.join(root, file))
-    
-    if not audio_files:
-        print(f"No audio files found in {audio_dir}")
-        return
-    
-    print(f"Found {len(audio_files)} audio files to process")
-    
-    # Create output directory
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Load Canary model
-    print("Loading Canary-1B model...")
-    model = EncDecMultiTaskModel.from_pretrained('nvidia/canary-1b')
-    
-    # Update decode params
-    decode_cfg = model.cfg.decoding
-    decode_cfg.beam.beam_size = beam_size
-    model.change_decoding_strategy(decode_cfg)
-    print("Model loaded successfully!")
-    
-    # Create manifest for processing
+    # Find audio files in the background and transcribe them as they turn up
+    walker = DirectoryWalker(audio_dir, workers=scan_workers)
     taskname = "asr" if task == "asr" else "s2t_translation"
-    manifest_path = f"{output_dir}/batch_manifest.json"
-    
-    with open(manifest_path, 'w') as f:
-        for audio_path in audio_files:
-            entry = {
-                "audio_filepath": os.path.abspath(audio_path),
-                "duration": 1000,  # placeholder
-                "taskname": taskname,
-                "source_lang": source_lang,
-                "target_lang": target_lang,
-                "pnc": pnc,
-                "answer": "na"
-            }
-            f.write(json.dumps(entry) + '\n')
-    
-    # Process with manifest
-    print(f"\nProcessing {len(audio_files)} files with batch size {batch_size}...")
-    results = model.transcribe(manifest_path, batch_size=batch_size)
-    
-    # Save results
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # Single output file with all results
     all_results_file = f"{output_dir}/all_results_{timestamp}.txt"
-    with open(all_results_file, 'w') as f:
-        f.write(f"# Batch processing results - {timestamp}\n")
-        f.write(f"# Task: {task}, Source: {source_lang}, Target: {target_lang}\n\n")
-        
-        for i, (path, text) in enumerate(zip(audio_files, results)):
-            f.write(f"## File: {Path(path).name}\n")
-            f.write(f"{text}\n\n")
-    
-    print(f"All results saved to {all_results_file}")
+    processed = 0
     
-    # Individual files for each result
-    for i, (path, text) in enumerate(zip(audio_files, results)):
-        filename = Path(path).stem
-        if task == "asr":
-            output_file = f"{output_dir}/{filename}_{source_lang}_transcription.txt"
-        else:
-            output_file = f"{output_dir}/{filename}_{source_lang}_to_{target_lang}.txt"
+    try:
+        for audio_files, results in transcribe_chunks(walker, taskname, source_lang, target_lang, pnc,
+                                                      batch_size, beam_size, use_daemon=use_daemon,
+                                                      workers=workers, devices=devices, adaptive=adaptive,
+                                                      audio_store=audio_store):
+            if not processed:
+                os.makedirs(output_dir, exist_ok=True)
+                # Single output file with all results, appended chunk by chunk
+                with open(all_results_file, 'w') as f:
+                    f.write(f"# Batch processing results - {timestamp}\n")
+                    f.write(f"# Task: {task}, Source: {source_lang}, Target: {target_lang}\n\n")
+            
+            with open(all_results_file, 'a') as f:
+                for path, text in zip(audio_files, results):
+                    f.write(f"## File: {Path(path).name}\n")
+                    f.write(f"{text}\n\n")
             
-        with open(output_file, 'w') as f:
-            f.write(text)
-        
-        print(f"Saved result for {Path(path).name} to {output_file}")
+            # Individual files for each result
+            for path, text in zip(audio_files, results):
+                output_file = f"{output_dir}/{result_filename(path, taskname, source_lang, target_lang)}"
+                
+                with open(output_file, 'w') as f:
+                    f.write(text)
+                index_result(output_file, text, path, taskname, source_lang, target_lang)
+                
+                print(f"Saved result for {Path(path).name} to {output_file}")
+            
+            processed += len(audio_files)
+            print(f"Processed {processed} files{'' if walker.done else ', still scanning'}")
+    finally:
+        walker.stop()
+    
+    for error in walker.errors:
+        print(f"Could not list {error}")
     
-    # Clean up manifest
-    os.remove(manifest_path)
+    if not processed:
+        print(f"No audio files found in {audio_dir}")
+        return
+    
+    print(f"All results saved to {all_results_file}")
+
+def watch_directories(audio_dirs, output_dir, task, source_lang, target_lang, pnc, batch_size, beam_size,
+                      use_daemon=True, settle=2.0, max_wait=2.0, poll_interval=None):
+    """
+    Keep processing new files in the directories until interrupted
+
+    The model stays warm between batches: the daemon's when one is running,
+    otherwise one loaded in this process. See watch_folder.py for how files
+    are picked up and batched.
+
+    Args:
+        audio_dirs: Directories to watch, each optionally "DIR=task:source:target"
+        settle: Seconds a file must stay unchanged before it is processed
+        max_wait: Longest a stable file waits for its micro-batch to fill
+        poll_interval: Re-scan every this many seconds instead of using inotify
+        Others as for process_directory
+    """
+    default_prompt = ("asr" if task == "asr" else "s2t_translation", source_lang, target_lang, pnc)
+    roots = dict(parse_watch_spec(spec, default_prompt) for spec in audio_dirs)
+
+    backend = open_backend(beam_size, use_daemon)
+    watcher = FolderWatcher(roots, output_dir, backend, batch_size=batch_size, settle=settle,
+                            max_wait=max_wait, poll_interval=poll_interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("Stopped watching")
 
 def main():
     parser = argparse.ArgumentParser(description="Batch process audio files with Canary")
-    parser.add_argument("--audio-dir", "-a", type=str, required=True, 
-                        help="Directory containing audio files to process")
-    parser.add_argument("--output-dir", "-o", type=str, default="/workspace/transcripts",
-                        help="Directory to save results")
+    parser.add_argument("--audio-dir", "-a", type=str, nargs="+", required=True,
+                        help="Directory containing audio files to process (several with --watch, "
+                             "each optionally DIR=task:source:target)")
+    parser.add_argument("--output-dir", "-o", type=str, default=canary_config.get("paths", "output_dir"),
+                        help="Directory to save results (default: paths.output_dir)")
     parser.add_argument("--task", "-t", choices=["asr", "translation"], default="asr", 
                         help="Task to perform (asr or translation)")
     parser.add_argument("--source-lang", "-s", choices=["en", "de", "es", "fr"], default="en",
@@ -115,30 +262,87 @@ def main():
                         help="Target language")
     parser.add_argument("--pnc", choices=["yes", "no"], default="yes",
                         help="Include punctuation and capitalization")
-    parser.add_argument("--batch-size", "-b", type=int, default=4, help="Batch size")
+    parser.add_argument("--batch-size", "-b", type=int, default=4,
+                        help="Batch size (starting size with --adaptive-batch)")
+    parser.add_argument("--adaptive-batch", action="store_true",
+                        help="Grow the batch while memory allows and split it on out-of-memory errors")
+    parser.add_argument("--max-batch-size", type=int, default=64,
+                        help="Largest batch size --adaptive-batch may grow to")
+    parser.add_argument("--batch-profile", type=str, default=None,
+                        help="File remembering the best batch size per duration bucket "
+                             "(default: batch_profile.json in paths.model_dir)")
     parser.add_argument("--beam-size", type=int, default=1, help="Beam size for decoding")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Always load the model in-process, even if the daemon is running")
+    parser.add_argument("--workers", "-w", type=int, default=None,
+                        help="Number of worker processes, each with its own model replica")
+    parser.add_argument("--devices", type=str, default=None,
+                        help="Comma-separated devices for the workers, e.g. cuda:0,cuda:1 or cpu")
+    parser.add_argument("--audio-store", type=str, default=canary_config.get("paths", "audio_store"),
+                        help="Keep decoded 16 kHz audio in this directory and reuse it on later runs "
+                             "(default: paths.audio_store, if set)")
+    parser.add_argument("--scan-workers", type=int, default=8,
+                        help="Threads listing directories; transcription starts while they walk")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and process new files as they arrive")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="With --watch: seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--max-wait", type=float, default=2.0,
+                        help="With --watch: longest a ready file waits for its batch to fill, in seconds")
+    parser.add_argument("--poll", type=float, default=None,
+                        help="With --watch: re-scan every this many seconds instead of using inotify "
+                             "(for shares that do not deliver inotify events)")
     
     args = parser.parse_args()
     
     # Check if audio directory exists
-    if not os.path.exists(args.audio_dir):
-        parser.error(f"Audio directory not found: {args.audio_dir}")
+    for spec in args.audio_dir:
+        audio_dir = spec
+        if args.watch:
+            try:
+                audio_dir, _ = parse_watch_spec(spec, (None, None, None, None))
+            except ValueError as e:
+                parser.error(str(e))
+        if not os.path.exists(audio_dir):
+            parser.error(f"Audio directory not found: {audio_dir}")
+    if len(args.audio_dir) > 1 and not args.watch:
+        parser.error("Several audio directories need --watch")
+    
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
     
     # Check if task and languages make sense
     if args.task == "asr" and args.source_lang != args.target_lang:
         print(f"Warning: For ASR, source and target languages should be the same. Setting target_lang to {args.source_lang}")
         args.target_lang = args.source_lang
     
+    if args.watch:
+        if args.workers or args.devices or args.adaptive_batch:
+            parser.error("--watch runs on one warm model; drop --workers, --devices and --adaptive-batch")
+        watch_directories(args.audio_dir, args.output_dir, args.task, args.source_lang, args.target_lang,
+                          args.pnc, args.batch_size, args.beam_size, use_daemon=not args.no_daemon,
+                          settle=args.settle, max_wait=args.max_wait, poll_interval=args.poll)
+        return
+
     # Process directory
     process_directory(
-        args.audio_dir,
+        args.audio_dir[0],
         args.output_dir,
         args.task,
         args.source_lang,
         args.target_lang,
         args.pnc,
         args.batch_size,
-        args.beam_size
+        args.beam_size,
+        use_daemon=not args.no_daemon,
+        workers=args.workers,
+        devices=args.devices.split(",") if args.devices else None,
+        adaptive={
+            "max_batch_size": args.max_batch_size,
+            "profile_path": args.batch_profile
+        } if args.adaptive_batch else None,
+        scan_workers=args.scan_workers,
+        audio_store=args.audio_store
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Sharded multi-process execution for batch_process.py.
+
+The file list is split into one shard per worker, balanced by total audio
+duration. Each worker process loads its own model replica pinned to a GPU
+or to a disjoint set of CPU cores, and the results are merged back into
+input order.
+
+For a list that is still growing (a directory being walked), WorkerPool
+starts the workers once and feeds them shards through a bounded queue:
+each worker takes the next shard when it finishes one, which balances the
+load without knowing the durations up front.
+"""
+
+import os
+import heapq
+import queue
+import multiprocessing
+
+# Compressed files soundfile cannot open are sized at roughly 128 kbit/s
+BYTES_PER_SECOND_ESTIMATE = 16000
+
+def audio_duration(path):
+    """Duration of an audio file in seconds, estimated from its size if the header is unreadable"""
+    try:
+        import soundfile as sf
+        return sf.info(path).duration
+    except Exception:
+        return os.path.getsize(path) / BYTES_PER_SECOND_ESTIMATE
+
+def shard_by_duration(durations, num_shards):
+    """
+    Split file indices into shards with similar total duration
+
+    Longest files are placed first, each on the currently lightest shard.
+    Indices inside a shard keep their input order.
+    """
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0.0, shard) for shard in range(num_shards)]
+    for i in sorted(range(len(durations)), key=lambda i: durations[i], reverse=True):
+        total, shard = heapq.heappop(heap)
+        shards[shard].append(i)
+        heapq.heappush(heap, (total + durations[i], shard))
+    return [sorted(shard) for shard in shards]
+
+def default_devices():
+    """All visible GPUs, or the CPU when there are none"""
+    import torch
+    if torch.cuda.is_available():
+        return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    return ["cpu"]
+
+def plan_workers(workers=None, devices=None):
+    """
+    Assign a device and, for CPU workers, a core set to each worker
+
+    Args:
+        workers: Number of worker processes (default: one per device)
+        devices: List of devices such as ["cuda:0", "cuda:1"] or ["cpu"]
+
+    Returns:
+        List of (device, cores) tuples, cores being None for GPU workers
+    """
+    devices = devices or default_devices()
+    workers = workers or len(devices)
+    assignment = [devices[i % len(devices)] for i in range(workers)]
+
+    # Split the available cores evenly between the CPU workers
+    cpu_workers = [i for i, device in enumerate(assignment) if device == "cpu"]
+    cores = sorted(os.sched_getaffinity(0))
+    core_sets = {}
+    if cpu_workers:
+        per_worker = max(1, len(cores) // len(cpu_workers))
+        for n, i in enumerate(cpu_workers):
+            start = (n * per_worker) % len(cores)
+            core_sets[i] = cores[start:start + per_worker]
+    return [(device, core_sets.get(i)) for i, device in enumerate(assignment)]
+
+def _load_worker_backend(device, cores, options):
+    """Pin a worker process to its cores and load its model replica"""
+    if cores:
+        os.sched_setaffinity(0, cores)
+        os.environ["OMP_NUM_THREADS"] = str(len(cores))
+        try:
+            import torch
+            torch.set_num_threads(len(cores))
+        except ImportError:
+            pass  # a backend without torch (e.g. the stub) only needs the affinity
+
+    from backends import load_backend
+    backend = load_backend(role="batch", beam_size=options["beam_size"], device=device)
+    if options.get("audio_store"):
+        from audio_store import AudioStore, StoredAudioBackend
+        backend = StoredAudioBackend(backend, AudioStore(options["audio_store"]))
+    return backend
+
+def _transcribe_shard(backend, audio_files, options):
+    if options.get("adaptive"):
+        from adaptive_batch import transcribe_adaptive
+        durations = [audio_duration(path) for path in audio_files]
+        results = transcribe_adaptive(backend, audio_files, durations, options,
+                                      max_batch_size=options["adaptive"]["max_batch_size"],
+                                      profile_path=options["adaptive"]["profile_path"])
+    else:
+        results = backend.transcribe(audio_files,
+                                     taskname=options["taskname"],
+                                     source_lang=options["source_lang"],
+                                     target_lang=options["target_lang"],
+                                     pnc=options["pnc"],
+                                     batch_size=options["batch_size"])
+    return [str(r) for r in results]
+
+def _run_shard(shard_id, device, cores, audio_files, options, result_queue):
+    """Worker process body: load a model replica and transcribe one shard"""
+    try:
+        backend = _load_worker_backend(device, cores, options)
+        result_queue.put((shard_id, _transcribe_shard(backend, audio_files, options), None))
+    except Exception as e:
+        result_queue.put((shard_id, None, f"{type(e).__name__}: {e}"))
+
+def _serve(worker_id, device, cores, options, tasks, results):
+    """Worker process body: load a model replica once, then transcribe shards from tasks until None"""
+    try:
+        backend = _load_worker_backend(device, cores, options)
+    except Exception as e:
+        results.put((None, worker_id, None, f"{type(e).__name__}: {e}"))
+        return
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        task_id, audio_files = task
+        try:
+            results.put((task_id, worker_id, _transcribe_shard(backend, audio_files, options), None))
+        except Exception as e:
+            results.put((task_id, worker_id, None, f"{type(e).__name__}: {e}"))
+
+def transcribe_sharded(audio_files, options, workers=None, devices=None):
+    """
+    Transcribe audio_files across worker processes
+
+    Args:
+        audio_files: List of audio file paths
+        options: Dict with taskname, source_lang, target_lang, pnc, batch_size, beam_size
+                 and adaptive (see batch_process.process_directory)
+        workers: Number of worker processes
+        devices: Devices to place the workers on
+
+    Returns:
+        List of results in the order of audio_files
+    """
+    plan = plan_workers(workers, devices)
+    durations = [audio_duration(path) for path in audio_files]
+    shards = shard_by_duration(durations, len(plan))
+
+    for n, ((device, cores), shard) in enumerate(zip(plan, shards)):
+        total = sum(durations[i] for i in shard)
+        pinned = f", cores {cores}" if cores else ""
+        print(f"Worker {n}: {device}{pinned}, {len(shard)} files, {total:.0f}s of audio")
+
+    # One process per shard; CUDA cannot be re-initialised in a forked child
+    context = multiprocessing.get_context("spawn")
+    result_queue = context.Queue()
+    processes = {}
+    for shard_id, ((device, cores), shard) in enumerate(zip(plan, shards)):
+        if not shard:
+            continue
+        process = context.Process(target=_run_shard, args=(
+            shard_id, device, cores, [audio_files[i] for i in shard], options, result_queue))
+        process.start()
+        processes[shard_id] = process
+
+    results = [None] * len(audio_files)
+    errors = []
+    pending = set(processes)
+    try:
+        while pending:
+            try:
+                shard_id, shard_results, error = result_queue.get(timeout=1)
+            except queue.Empty:
+                # A worker killed outright (e.g. by the OOM killer) never reports back
+                for shard_id in list(pending):
+                    exitcode = processes[shard_id].exitcode
+                    if exitcode not in (None, 0):
+                        errors.append(f"worker {shard_id}: exited with code {exitcode}")
+                        pending.discard(shard_id)
+                continue
+            pending.discard(shard_id)
+            if error:
+                errors.append(f"worker {shard_id}: {error}")
+                continue
+            for i, text in zip(shards[shard_id], shard_results):
+                results[i] = text
+    finally:
+        for process in processes.values():
+            process.join()
+
+    if errors:
+        raise RuntimeError("Sharded transcription failed: " + "; ".join(errors))
+    return results
+
+class WorkerPool:
+    """
+    Worker processes started once, each with its own model replica, fed
+    shards of a growing file list through a bounded queue
+
+    Use as a context manager; the workers stop when it exits.
+    """
+
+    def __init__(self, options, workers=None, devices=None, max_pending=None):
+        """
+        Initialize WorkerPool and start the workers
+
+        Args:
+            options: As for transcribe_sharded()
+            workers: Number of worker processes
+            devices: Devices to place the workers on
+            max_pending: Shards queued for the workers before map() waits (default: two per worker)
+        """
+        plan = plan_workers(workers, devices)
+        for n, (device, cores) in enumerate(plan):
+            pinned = f", cores {cores}" if cores else ""
+            print(f"Worker {n}: {device}{pinned}")
+
+        # CUDA cannot be re-initialised in a forked child
+        context = multiprocessing.get_context("spawn")
+        self.tasks = context.Queue(maxsize=max_pending or 2 * len(plan))
+        self.results = context.Queue()
+        self.processes = [context.Process(target=_serve, args=(n, device, cores, options, self.tasks, self.results))
+                          for n, (device, cores) in enumerate(plan)]
+        for process in self.processes:
+            process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _check_workers(self):
+        """Raise if a worker died; one killed outright (e.g. by the OOM killer) never reports back"""
+        for n, process in enumerate(self.processes):
+            if process.exitcode not in (None, 0):
+                raise RuntimeError(f"Sharded transcription failed: worker {n}: exited with code {process.exitcode}")
+
+    def _collect(self, done, timeout):
+        """Move one finished shard into done, waiting up to timeout seconds; raises on a failed shard"""
+        try:
+            task_id, worker_id, texts, error = self.results.get(timeout=timeout)
+        except queue.Empty:
+            self._check_workers()
+            return
+        if error:
+            raise RuntimeError(f"Sharded transcription failed: worker {worker_id}: {error}")
+        done[task_id] = texts
+
+    def map(self, shards):
+        """
+        Transcribe each list of files from shards on the next free worker
+
+        Yields (audio_files, results) per shard, in the order of shards. Taking
+        the next shard waits while max_pending shards are queued, so a walk
+        that runs ahead of the workers is held back.
+        """
+        submitted = {}
+        done = {}
+        next_id = 0
+
+        def ready():
+            nonlocal next_id
+            while next_id in done:
+                yield submitted.pop(next_id), done.pop(next_id)
+                next_id += 1
+
+        for task_id, audio_files in enumerate(shards):
+            submitted[task_id] = audio_files
+            while True:
+                try:
+                    self.tasks.put((task_id, audio_files), timeout=0.1)
+                    break
+                except queue.Full:
+                    self._collect(done, timeout=0.1)
+            yield from ready()
+        while submitted:
+            self._collect(done, timeout=1)
+            yield from ready()
+
+    def close(self):
+        """Stop the workers once they finish their current shard; queued shards are dropped"""
+        try:
+            while True:
+                self.tasks.get_nowait()
+        except queue.Empty:
+            pass
+        for process in self.processes:
+            if process.is_alive():
+                try:
+                    self.tasks.put(None, timeout=1)
+                except queue.Full:
+                    pass
+        for process in self.processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+                process.join()
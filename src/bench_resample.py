@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark StreamResampler against naive per-block resampling.
+
+Feeds random capture blocks of the given rate/channels through:
+  - stream:      StreamResampler (stateful polyphase, preallocated)
+  - interp:      downmix with mean() + np.interp per block (allocates, no filter)
+  - resample_poly: scipy.signal.resample_poly per block (if scipy is installed;
+                 stateless, so it also clicks at block edges)
+
+and prints the time per block and how many times faster than real time
+each path runs.
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from resample import StreamResampler
+
+def naive_interp(block, in_rate, out_rate):
+    mono = block.mean(axis=1)
+    n_out = int(round(len(mono) * out_rate / in_rate))
+    t_out = np.arange(n_out) * (in_rate / out_rate)
+    return np.interp(t_out, np.arange(len(mono)), mono).astype(np.float32)
+
+def bench(name, fn, blocks, block_seconds):
+    fn(blocks[0])  # warm up
+    start = time.perf_counter()
+    for block in blocks:
+        fn(block)
+    elapsed = time.perf_counter() - start
+    per_block = elapsed / len(blocks)
+    print(f"{name:>14}: {per_block * 1e6:8.1f} us/block  {block_seconds / per_block:8.0f}x real time")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming resampling to 16 kHz mono")
+    parser.add_argument("--rate", type=int, default=48000, help="Capture sampling rate")
+    parser.add_argument("--channels", type=int, default=2, help="Capture channel count")
+    parser.add_argument("--block", type=int, default=1024, help="Frames per capture block")
+    parser.add_argument("--blocks", type=int, default=2000, help="Number of blocks to process")
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    blocks = [rng.standard_normal((args.block, args.channels)).astype(np.float32)
+              for _ in range(64)]
+    blocks = [blocks[i % len(blocks)] for i in range(args.blocks)]
+    block_seconds = args.block / args.rate
+
+    print(f"{args.rate} Hz x {args.channels} ch -> 16000 Hz mono, {args.block}-frame blocks")
+
+    resampler = StreamResampler(args.rate, args.channels, max_block=args.block)
+    sink = lambda out: None
+    bench("stream", lambda b: resampler.process(b, sink), blocks, block_seconds)
+    bench("interp", lambda b: naive_interp(b, args.rate, 16000), blocks, block_seconds)
+
+    try:
+        from scipy.signal import resample_poly
+        up, down = resampler.up, resampler.down
+        bench("resample_poly", lambda b: resample_poly(b.mean(axis=1), up, down), blocks, block_seconds)
+    except ImportError:
+        print(f"{'resample_poly':>14}: skipped (scipy not installed)")
+
+if __name__ == "__main__":
+    main()
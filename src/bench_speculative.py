@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark speculative greedy decoding against plain greedy decoding.
+
+Loads Canary with a draft model and transcribes (or translates) the given
+files twice with the same model and the same greedy generator:
+
+  - greedy:       the model's own decoder generates every token
+  - speculative:  the draft model proposes --draft-tokens tokens per pass
+                  and the model verifies them in one pass
+
+and prints tokens per second for each, the speedup, how many tokens each
+pass of the large decoder produced, and whether the outputs are identical.
+"""
+
+import time
+import argparse
+
+from canary_model import load_model, transcribe, taskname_for
+
+def bench(name, model, generator, args):
+    """Run all files once per repeat; returns the texts of the last repeat"""
+    # The greedy run must not pay for the draft's encoder either
+    generator.enabled = name == "speculative"
+    generator.draft_encoder.active = generator.enabled
+    taskname = taskname_for(args.source_lang, args.target_lang)
+    run = lambda: transcribe(model, args.audio, taskname, args.source_lang, args.target_lang, args.pnc,
+                             batch_size=args.batch_size)
+    run()  # warm up
+    for key in generator.stats:
+        generator.stats[key] = 0
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        texts = run()
+    elapsed = time.perf_counter() - start
+    stats = dict(generator.stats)
+    line = f"{name:>12}: {elapsed:8.2f} s  {stats['tokens']:7d} tokens  {stats['tokens'] / elapsed:8.1f} tokens/s"
+    if generator.enabled:
+        line += f"  {stats['tokens'] / max(1, stats['target_passes']):.2f} tokens per model pass"
+    print(line)
+    return [getattr(t, "text", t) for t in texts], elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speculative greedy decoding against plain greedy")
+    parser.add_argument("audio", nargs="+", help="Audio files to decode")
+    parser.add_argument("--draft-model", type=str, required=True,
+                        help="Draft checkpoint sharing Canary's tokenizer")
+    parser.add_argument("--draft-tokens", type=int, default=4, help="Tokens the draft proposes per pass")
+    parser.add_argument("--model", type=str, default=None, help="Checkpoint to verify with (default: model.name)")
+    parser.add_argument("--source-lang", type=str, default="en", help="Source language")
+    parser.add_argument("--target-lang", type=str, default="de",
+                        help="Target language (the source language for plain ASR)")
+    parser.add_argument("--pnc", type=str, default="yes", help="Punctuation and capitalization (yes/no)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Batch size")
+    parser.add_argument("--repeats", type=int, default=3, help="Passes over the files per mode")
+
+    args = parser.parse_args()
+
+    import speculative
+
+    model = load_model(beam_size=1, model_name=args.model, draft_model=args.draft_model)
+    generator = speculative.enable(model, args.draft_model, args.draft_tokens)
+
+    print(f"{len(args.audio)} files, {args.source_lang}->{args.target_lang}, batch size {args.batch_size}, "
+          f"draft {args.draft_model} proposing {args.draft_tokens} tokens")
+    greedy_texts, greedy_time = bench("greedy", model, generator, args)
+    speculative_texts, speculative_time = bench("speculative", model, generator, args)
+
+    print(f"Speedup: {greedy_time / speculative_time:.2f}x")
+    differing = sum(a != b for a, b in zip(greedy_texts, speculative_texts))
+    if differing:
+        print(f"Outputs differ for {differing} of {len(greedy_texts)} files")
+    else:
+        print("Outputs identical")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Project configuration (config/config.local.yml, falling back to
+config/config.example.yml).
+
+The file is looked up at $CANARY_CONFIG, next to the repository root and
+under /workspace/config. A missing file or a missing PyYAML just means the
+built-in defaults are used.
+"""
+
+import os
+
+CONFIG_CANDIDATES = [
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config"),
+    "/workspace/config",
+]
+
+DEFAULTS = {
+    "model": {"name": "nvidia/canary-1b", "beam_size": 1},
+    "paths": {
+        "output_dir": "/workspace/transcripts",
+        "temp_dir": "/workspace/temp",
+        "model_dir": "/workspace/models",
+    },
+}
+
+_config = None
+
+def find_config_file():
+    """Return the path of the config file to use, or None"""
+    env_path = os.environ.get("CANARY_CONFIG")
+    if env_path:
+        return env_path
+    for config_dir in CONFIG_CANDIDATES:
+        for name in ("config.local.yml", "config.example.yml"):
+            path = os.path.join(config_dir, name)
+            if os.path.exists(path):
+                return path
+    return None
+
+def load_config():
+    """Load the config once, with DEFAULTS filled in for missing sections"""
+    global _config
+    if _config is not None:
+        return _config
+
+    loaded = {}
+    path = find_config_file()
+    if path:
+        try:
+            import yaml
+            with open(path) as f:
+                loaded = yaml.safe_load(f) or {}
+        except ImportError:
+            print(f"PyYAML not installed, ignoring {path}")
+
+    _config = {}
+    for section in set(DEFAULTS) | set(loaded):
+        _config[section] = dict(DEFAULTS.get(section, {}))
+        _config[section].update(loaded.get(section) or {})
+    return _config
+
+def get(section, key, default=None):
+    """Read a single setting, e.g. get("paths", "model_dir")"""
+    return load_config().get(section, {}).get(key, default)
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Persistent Canary inference daemon.
+
+Holds warmed models in memory and serves transcription/translation requests
+over a Unix domain socket, so short CLI jobs skip the model load. The CLIs
+call request_transcription() first and fall back to loading the model
+in-process when it raises DaemonUnavailable.
+
+Wire format (both directions): a 4-byte big-endian length followed by a JSON
+header. Requests with in-memory audio list the byte size of each buffer in
+header["buffers"]; the raw little-endian float32 samples (16 kHz mono)
+follow the header in that order. A header over MAX_HEADER_BYTES or a buffer
+over MAX_BUFFER_BYTES is refused before anything is allocated for it.
+
+The socket is created with mode 0600: only the user running the daemon can
+connect, as every client may load files the daemon's user can read.
+
+Requests carry a priority class: "live" for chunks of live sessions (with
+the session id, so sessions are served fairly) and "batch" for everything
+else. All inference goes through one InferenceScheduler, so batch work
+only fills the time live sessions leave free.
+
+Requests also name the role of the model that should serve them
+(canary_model.ROLES): "final" for live captions, "interim" for quick
+hypotheses shown while a live chunk is still open, "batch" for everything
+else. Roles mapped to the same checkpoint share one loaded model, and the
+models of every role run through the same scheduler.
+
+Live sessions ask to be admitted ("admit") before they start. The daemon
+measures the real-time factor of every live chunk it runs (interim decodes
+included) and refuses a session that would push the sessions it already
+serves past real time.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+
+from backends import Backend, load_backend, backend_name
+from canary_model import ROLES, model_name_for
+from inference_scheduler import InferenceScheduler, LIVE, BATCH
+from capacity import CapacityModel
+
+DEFAULT_SOCKET = os.environ.get("CANARY_SOCKET", "/tmp/canary-daemon.sock")
+SOCKET_MODE = 0o600
+# Largest JSON header, and largest audio buffer (about 4.6 hours at 16 kHz)
+MAX_HEADER_BYTES = 64 << 20
+MAX_BUFFER_BYTES = 1 << 30
+
+class DaemonUnavailable(Exception):
+    """Raised when no daemon is listening on the socket"""
+
+class DaemonError(Exception):
+    """Raised when the daemon accepted a request but failed to process it"""
+
+def _send_message(sock, header, buffers=()):
+    payload = json.dumps(header).encode()
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+    for buf in buffers:
+        sock.sendall(buf)
+
+def _recv_exactly(sock, size):
+    view = memoryview(bytearray(size))
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Connection closed mid-message")
+        received += n
+    return view.obj
+
+def _recv_message(sock):
+    (size,) = struct.unpack(">I", _recv_exactly(sock, 4))
+    if size > MAX_HEADER_BYTES:
+        raise ValueError(f"Message of {size} bytes exceeds the limit of {MAX_HEADER_BYTES}")
+    return json.loads(_recv_exactly(sock, size))
+
+def _recv_buffers(sock, sizes):
+    """The raw buffers that follow a header, checked against MAX_BUFFER_BYTES first"""
+    sizes = [int(size) for size in sizes]
+    if any(size < 0 or size > MAX_BUFFER_BYTES for size in sizes):
+        raise ValueError(f"Buffer sizes must be 0 to {MAX_BUFFER_BYTES} bytes")
+    return [_recv_exactly(sock, size) for size in sizes]
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def _connect(socket_path, timeout):
+    if not os.path.exists(socket_path):
+        raise DaemonUnavailable(f"No daemon socket at {socket_path}")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        sock.close()
+        raise DaemonUnavailable(f"Daemon not reachable at {socket_path}: {e}")
+    return sock
+
+def _call(header, buffers=(), socket_path=None, timeout=None):
+    sock = _connect(socket_path or DEFAULT_SOCKET, timeout)
+    try:
+        _send_message(sock, header, buffers)
+        response = _recv_message(sock)
+    finally:
+        sock.close()
+    if response.get("status") != "ok":
+        raise DaemonError(response.get("error", "unknown daemon error"))
+    return response
+
+def ping(socket_path=None):
+    """Return the daemon status, or raise DaemonUnavailable"""
+    return _call({"op": "ping"}, socket_path=socket_path, timeout=5)
+
+def request_transcription(audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes",
+                          beam_size=1, batch_size=1, socket_path=None, priority=BATCH, session=None,
+                          role=None):
+    """
+    Transcribe through the daemon
+
+    Args:
+        audio: List of audio file paths, or of 16 kHz mono float32 numpy arrays
+        taskname: asr or s2t_translation
+        source_lang: Source language
+        target_lang: Target language
+        pnc: Include punctuation and capitalization (yes/no)
+        beam_size: Beam size for decoding
+        batch_size: Batch size for processing
+        priority: live for chunks of a live session, batch otherwise
+        session: Live session id, so the daemon can share time fairly between sessions
+        role: final, interim or batch (default: final for live chunks, batch otherwise)
+
+    Returns:
+        List of result strings, one per input
+    """
+    header = {
+        "op": "transcribe",
+        "taskname": taskname,
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "pnc": pnc,
+        "beam_size": beam_size,
+        "batch_size": batch_size,
+        "priority": priority,
+        "session": session,
+        "role": role or ("final" if priority == LIVE else "batch")
+    }
+    buffers = []
+    if audio and not isinstance(audio[0], str):
+        buffers = [a.astype('<f4', copy=False).tobytes() for a in audio]
+        header["buffers"] = [len(b) for b in buffers]
+    else:
+        header["audio"] = [os.path.abspath(p) for p in audio]
+    return _call(header, buffers, socket_path=socket_path)["results"]
+
+def request_admission(session, chunk_seconds, beam_size=1, streams=1, replaces=None, interim=False,
+                      hop_seconds=None, socket_path=None):
+    """
+    Ask the daemon to admit a live session
+
+    interim says the session also sends interim decodes; they count only if
+    the daemon has an interim model. hop_seconds is the new audio per chunk;
+    the session's chunks are measured against it.
+
+    Returns:
+        Decision dict (see CapacityModel.admit); the session is registered if admitted
+    """
+    return _call({"op": "admit", "session": session, "chunk_seconds": chunk_seconds,
+                  "beam_size": beam_size, "streams": streams, "replaces": replaces, "interim": interim,
+                  "hop_seconds": hop_seconds},
+                 socket_path=socket_path, timeout=5)["decision"]
+
+def release_session(session, socket_path=None):
+    """Tell the daemon a live session ended"""
+    _call({"op": "release", "session": session}, socket_path=socket_path, timeout=5)
+
+class RemoteModel(Backend):
+    """
+    Backend that sends audio to the daemon
+
+    Live sessions use it so their chunks share the daemon's model (at live
+    priority) instead of loading a model of their own.
+    """
+
+    name = "daemon"
+
+    def __init__(self, session=None, beam_size=1, priority=LIVE, socket_path=None, role=None):
+        self.session = session
+        self.beam_size = beam_size
+        self.priority = priority
+        self.socket_path = socket_path
+        self.role = role
+        self.model_name = None
+
+    def load(self):
+        status = ping(self.socket_path)
+        role = self.role or ("final" if self.priority == LIVE else "batch")
+        self.model_name = status.get("roles", {}).get(role)
+        return self
+
+    def set_decoding(self, beam_size=1):
+        self.beam_size = beam_size
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        return request_transcription(list(audio), taskname=taskname, source_lang=source_lang,
+                                     target_lang=target_lang, pnc=pnc, beam_size=self.beam_size,
+                                     batch_size=batch_size, socket_path=self.socket_path,
+                                     priority=self.priority, session=self.session, role=self.role)
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class ModelPool:
+    """
+    One warm backend per checkpoint; all inference goes through one scheduler
+
+    The beam size is applied per scheduler unit, so requests with different
+    beam sizes share the checkpoint's single copy in memory.
+    """
+
+    def __init__(self, live_budget=1.0, max_load=0.9, backend=None):
+        self.backend = backend
+        self.models = {}
+        self.pool_lock = threading.Lock()
+        # One lock per checkpoint being loaded, so a load never blocks requests for loaded models
+        self.load_locks = {}
+        self.scheduler = InferenceScheduler(live_budget=live_budget)
+        self.capacity = CapacityModel(max_load=max_load)
+        self.requests_served = 0
+        self.started = time.time()
+
+    def roles(self):
+        """Checkpoint serving each role; roles without a model of their own are left out"""
+        names = {role: model_name_for(role) for role in ROLES}
+        return {role: name for role, name in names.items() if name}
+
+    def get(self, role="final"):
+        """Backend of the checkpoint serving role, loading it on first use"""
+        model_name = model_name_for(role)
+        if model_name is None:
+            raise ValueError(f"No model is configured for the {role} role (model.roles.{role})")
+        backend = self.models.get(model_name)
+        if backend is not None:
+            return backend
+        with self.pool_lock:
+            load_lock = self.load_locks.setdefault(model_name, threading.Lock())
+        with load_lock:
+            if model_name not in self.models:
+                print(f"Loading {model_name} on the {backend_name(self.backend)} backend...")
+                backend = load_backend(self.backend, model_name=model_name)
+                with self.pool_lock:
+                    self.models[model_name] = backend
+                print("Model loaded successfully!")
+        return self.models[model_name]
+
+    @staticmethod
+    def use_beam_size(backend, beam_size):
+        """Switch the decoding of a backend (scheduler thread only, between units)"""
+        if getattr(backend, "beam_size", None) != beam_size:
+            backend.set_decoding(beam_size)
+
+    def warmup(self, beam_size, role="final"):
+        """Load a model and run one second of silence through it"""
+        backend = self.get(role)
+
+        def warmup(items):
+            self.use_beam_size(backend, beam_size)
+            backend.warmup()
+            return items
+
+        self.scheduler.run([None], warmup)
+
+    def transcribe(self, header, buffers):
+        priority = header.get("priority") or BATCH
+        role = header.get("role") or ("final" if priority == LIVE else "batch")
+        beam_size = int(header.get("beam_size", 1))
+        backend = self.get(role)
+        if buffers:
+            import numpy as np
+            audio = [np.frombuffer(buf, dtype='<f4') for buf in buffers]
+        else:
+            audio = header["audio"]
+        batch_size = int(header.get("batch_size", 1))
+
+        def run(items):
+            start = time.monotonic()
+            self.use_beam_size(backend, beam_size)
+            results = backend.transcribe(items,
+                                         taskname=header.get("taskname", "asr"),
+                                         source_lang=header.get("source_lang", "en"),
+                                         target_lang=header.get("target_lang", "en"),
+                                         pnc=header.get("pnc", "yes"),
+                                         batch_size=min(batch_size, len(items)))
+            if priority == LIVE and buffers:
+                # Live chunks feed the capacity model used for admission; interim
+                # decodes count towards their session's next final chunk
+                elapsed = time.monotonic() - start
+                if role == "interim":
+                    self.capacity.record_interim(elapsed, session=header.get("session"))
+                else:
+                    chunk_seconds = max(len(a) for a in items) / 16000
+                    self.capacity.record(chunk_seconds, beam_size, len(items), elapsed,
+                                         session=header.get("session"))
+            return results
+
+        results = self.scheduler.run(audio, run, priority=priority,
+                                     tenant=header.get("session"), unit_size=batch_size)
+        self.requests_served += 1
+        return [str(r) for r in results]
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        pool = self.server.pool
+        try:
+            header = _recv_message(self.request)
+            buffers = _recv_buffers(self.request, header.get("buffers", []))
+            op = header.get("op")
+            if op == "ping":
+                response = {
+                    "status": "ok",
+                    "pid": os.getpid(),
+                    "backend": backend_name(pool.backend),
+                    "roles": pool.roles(),
+                    "models": [{"model": name, "beam_size": getattr(backend, "beam_size", None)}
+                               for name, backend in sorted(pool.models.items())],
+                    "requests_served": pool.requests_served,
+                    "uptime": time.time() - pool.started,
+                    "scheduler": pool.scheduler.snapshot(),
+                    "capacity": pool.capacity.snapshot()
+                }
+            elif op == "transcribe":
+                response = {"status": "ok", "results": pool.transcribe(header, buffers)}
+            elif op == "admit":
+                decision = pool.capacity.admit(header["session"], float(header["chunk_seconds"]),
+                                               int(header.get("beam_size", 1)),
+                                               int(header.get("streams", 1)), header.get("replaces"),
+                                               interim=bool(header.get("interim")
+                                                            and model_name_for("interim")),
+                                               hop_seconds=header.get("hop_seconds"))
+                response = {"status": "ok", "decision": decision}
+            elif op == "release":
+                pool.capacity.release(header.get("session"))
+                response = {"status": "ok"}
+            else:
+                response = {"status": "error", "error": f"Unknown op: {op}"}
+        except Exception as e:
+            response = {"status": "error", "error": str(e)}
+        try:
+            _send_message(self.request, response)
+        except OSError:
+            pass
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool):
+        self.pool = pool
+        super().__init__(socket_path, RequestHandler)
+
+    def server_bind(self):
+        # Create the socket without group/other access, so there is no window to connect in
+        old_umask = os.umask(0o777 & ~SOCKET_MODE)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+        os.chmod(self.server_address, SOCKET_MODE)
+
+def remove_stale_socket(socket_path):
+    """Remove a leftover socket file, refusing if a daemon still answers on it"""
+    if not os.path.exists(socket_path):
+        return
+    try:
+        ping(socket_path)
+    except (DaemonUnavailable, DaemonError, OSError):
+        os.remove(socket_path)
+        return
+    raise RuntimeError(f"A daemon is already running on {socket_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent Canary inference daemon")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET,
+                        help="Unix socket path to listen on")
+    parser.add_argument("--beam-size", type=int, nargs="+", default=[1],
+                        help="Beam sizes to warm up (one model serves all beam sizes)")
+    parser.add_argument("--live-budget", type=float, default=1.0,
+                        help="Longest a live chunk should wait behind batch work, in seconds")
+    parser.add_argument("--max-load", type=float, default=0.9,
+                        help="Admit live sessions while their measured real-time factor stays below this")
+    parser.add_argument("--backend", type=str, default=None,
+                        help="Inference backend (nemo, stub; default: $CANARY_BACKEND or model.backend)")
+    parser.add_argument("--status", action="store_true",
+                        help="Print the status of a running daemon and exit")
+
+    args = parser.parse_args()
+
+    if args.status:
+        try:
+            print(json.dumps(ping(args.socket), indent=2))
+        except DaemonUnavailable as e:
+            print(e)
+            sys.exit(1)
+        return
+
+    remove_stale_socket(args.socket)
+
+    pool = ModelPool(live_budget=args.live_budget, max_load=args.max_load, backend=args.backend)
+    for beam_size in args.beam_size:
+        pool.warmup(beam_size)
+    if model_name_for("interim"):
+        # Interim hypotheses are always greedy
+        pool.warmup(1, "interim")
+
+    server = DaemonServer(args.socket, pool)
+    print(f"Canary daemon listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+if __name__ == "__main__":
+    main()
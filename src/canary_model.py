@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Shared Canary model loading.
+
+NeMo (and through it torch/CUDA) is only imported inside the loaders, so the
+entry points can parse arguments, print --help or list audio devices without
+paying for the import. Keep heavy imports out of module level here.
+
+Models are loaded from an extracted checkpoint under paths.model_dir (see
+config/config.example.yml). The .nemo archive is fetched and unpacked there
+once; later loads work offline and memory-map the weights, so several
+processes on one node share the same page cache for them.
+"""
+
+import os
+import json
+import shutil
+import tarfile
+import zipfile
+import tempfile
+from pathlib import Path
+
+import canary_config
+
+MODEL_NAME = 'nvidia/canary-1b'
+# What a model is used for: final live captions, interim live hypotheses, batch output
+ROLES = ("final", "interim", "batch")
+WEIGHTS_FILE = "model_weights.ckpt"
+CONFIG_FILE = "model_config.yaml"
+
+def extracted_dir(model_name, model_dir=None):
+    """Directory holding the unpacked checkpoint of model_name"""
+    model_dir = model_dir or canary_config.get("paths", "model_dir")
+    return os.path.join(model_dir, Path(model_name).stem if model_name.endswith(".nemo")
+                        else model_name.replace("/", "--"))
+
+def fetch_nemo_file(model_name):
+    """Return a local .nemo file for model_name, downloading it from the hub if needed"""
+    if model_name.endswith(".nemo") and os.path.exists(model_name):
+        return model_name
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(repo_id=model_name, filename=f"{model_name.split('/')[-1]}.nemo")
+
+def _extract_archive(tar, path):
+    """
+    Extract a .nemo archive, refusing members that would land outside path
+
+    Uses tarfile's "data" filter where Python has it; otherwise rejects
+    absolute names, ".." components, links and special files up front.
+    """
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(path, filter="data")
+        return
+    for member in tar.getmembers():
+        name = member.name.replace("\\", "/")
+        if name.startswith("/") or os.path.isabs(name) or ".." in name.split("/"):
+            raise ValueError(f"Unsafe path in checkpoint archive: {member.name}")
+        if not (member.isfile() or member.isdir()):
+            raise ValueError(f"Link or special file in checkpoint archive: {member.name}")
+    tar.extractall(path)
+
+def extract_checkpoint(model_name, model_dir=None):
+    """
+    Unpack the .nemo archive of model_name into model_dir, once
+
+    The weights are rewritten in torch's zip format if needed, which is what
+    torch.load(mmap=True) requires. Extraction goes to a temporary directory
+    that is renamed into place, so concurrent workers never see a partial one.
+    """
+    target = extracted_dir(model_name, model_dir)
+    if os.path.exists(os.path.join(target, CONFIG_FILE)):
+        return target
+
+    nemo_file = fetch_nemo_file(model_name)
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".extract_", dir=parent)
+    try:
+        print(f"Extracting {nemo_file} to {target}...")
+        with tarfile.open(nemo_file, "r:*") as tar:
+            _extract_archive(tar, staging)
+
+        weights = os.path.join(staging, WEIGHTS_FILE)
+        if not zipfile.is_zipfile(weights):
+            import torch
+            torch.save(torch.load(weights, map_location="cpu"), weights)
+
+        try:
+            os.rename(staging, target)
+        except OSError:
+            # Another process finished first
+            shutil.rmtree(staging, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return target
+
+def _mmap_connector():
+    """SaveRestoreConnector that memory-maps the weights and adopts them in place"""
+    import torch
+    from nemo.core.connectors.save_restore_connector import SaveRestoreConnector
+
+    class MmapSaveRestoreConnector(SaveRestoreConnector):
+        @staticmethod
+        def _load_state_dict_from_disk(model_weights, map_location=None):
+            return torch.load(model_weights, map_location="cpu", mmap=True, weights_only=True)
+
+        def load_instance_with_state_dict(self, instance, state_dict, strict):
+            # assign=True keeps the mmap-backed tensors instead of copying them
+            instance.load_state_dict(state_dict, strict=strict, assign=True)
+            instance._set_model_restore_state(is_being_restored=False)
+
+    return MmapSaveRestoreConnector()
+
+def model_name_for(role=None):
+    """
+    Checkpoint for a role: model.roles.<role> from the config, else model.name
+
+    Returns None for the interim role when it has no model of its own, since
+    interim hypotheses are only worth making with a model faster than the final one.
+    """
+    if role is not None and role not in ROLES:
+        raise ValueError(f"Unknown model role: {role} (expected one of {', '.join(ROLES)})")
+    roles = canary_config.get("model", "roles") or {}
+    if role in roles and roles[role]:
+        return roles[role]
+    if role == "interim":
+        return None
+    return canary_config.get("model", "name", MODEL_NAME)
+
+def resolve_device(device=None):
+    """Default to the first GPU when there is one"""
+    import torch
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    return torch.device(device)
+
+def load_model(beam_size=1, model_name=None, model_dir=None, device=None, draft_model=None):
+    """
+    Load a Canary model and apply the decoding parameters
+
+    Args:
+        beam_size: Beam size for decoding
+        model_name: Pretrained model name or path to a .nemo file
+                    (default: model.name from the config; see model_name_for for roles)
+        model_dir: Where extracted checkpoints live (default: paths.model_dir)
+        device: torch device to run on (default: cuda if available)
+        draft_model: Draft checkpoint for speculative greedy decoding (see set_decoding)
+    """
+    from nemo.collections.asr.models import EncDecMultiTaskModel
+
+    model_name = model_name or model_name_for()
+    try:
+        checkpoint_dir = extract_checkpoint(model_name, model_dir)
+    except OSError as e:
+        # model_dir is not writable or the hub is unreachable; use NeMo's own cache
+        print(f"Could not prepare local checkpoint ({e}), falling back to from_pretrained")
+        checkpoint_dir = None
+
+    if checkpoint_dir:
+        connector = _mmap_connector()
+        connector.model_extracted_dir = checkpoint_dir
+        model = EncDecMultiTaskModel.restore_from(checkpoint_dir, map_location="cpu",
+                                                  save_restore_connector=connector)
+        device = resolve_device(device)
+        if device.type != "cpu":
+            model = model.to(device)
+    else:
+        model = EncDecMultiTaskModel.from_pretrained(model_name, map_location=device)
+    model.eval()
+    set_decoding(model, beam_size, draft_model)
+    return model
+
+def set_decoding(model, beam_size=1, draft_model=None):
+    """
+    Apply decoding parameters to a loaded model; the weights are untouched
+
+    With beam size 1 and a draft model (default: decoding.draft_model from
+    the config; "" for none), decoding is speculative greedy: same output as
+    greedy, with the draft proposing tokens (see speculative.py).
+    """
+    import speculative
+
+    if draft_model is None:
+        draft_model = canary_config.get("decoding", "draft_model") or ""
+    decode_cfg = model.cfg.decoding
+    # The checkpoint's own strategy, for when speculative decoding is off again
+    if not hasattr(model, "_checkpoint_strategy"):
+        model._checkpoint_strategy = decode_cfg.strategy
+    use_draft = beam_size == 1 and bool(draft_model)
+    decode_cfg.strategy = "greedy" if use_draft else model._checkpoint_strategy
+    decode_cfg.beam.beam_size = beam_size
+    model.change_decoding_strategy(decode_cfg)
+    if use_draft:
+        try:
+            speculative.enable(model, draft_model)
+        except (OSError, ValueError, ImportError, AttributeError) as e:
+            # Plain greedy gives the same output, only slower
+            print(f"Speculative decoding unavailable ({e}), decoding greedily")
+    else:
+        speculative.disable(model)
+
+def transcribe(model, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+    """
+    Run a list of inputs through the model with one prompt
+
+    Args:
+        model: Loaded Canary model
+        audio: List of audio file paths, or of 16 kHz mono float32 numpy arrays
+        taskname: asr or s2t_translation
+        source_lang: Source language
+        target_lang: Target language
+        pnc: Include punctuation and capitalization (yes/no)
+        batch_size: Batch size for processing
+    """
+    if audio and not isinstance(audio[0], str):
+        # In-memory audio carries the prompt as keyword arguments
+        return model.transcribe(audio=list(audio), batch_size=batch_size, taskname=taskname,
+                                source_lang=source_lang, target_lang=target_lang, pnc=pnc)
+
+    fd, manifest_path = tempfile.mkstemp(prefix="canary_manifest_", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for audio_path in audio:
+                entry = {
+                    "audio_filepath": os.path.abspath(audio_path),
+                    "duration": 1000,  # placeholder
+                    "taskname": taskname,
+                    "source_lang": source_lang,
+                    "target_lang": target_lang,
+                    "pnc": pnc,
+                    "answer": "na"
+                }
+                f.write(json.dumps(entry) + '\n')
+        return model.transcribe(manifest_path, batch_size=batch_size)
+    finally:
+        os.remove(manifest_path)
+
+def taskname_for(source_lang, target_lang):
+    """Canary task for a language pair"""
+    return "asr" if source_lang == target_lang else "s2t_translation"
+
+def _prompt_ids(model, source_lang, target_lang, pnc):
+    """Decoder prompt tokens for one language pair"""
+    from nemo.collections.common.prompts.canary import CANARY_SPECIAL_TOKENIZER
+    turns = [{
+        "role": "user",
+        "slots": {
+            "source_lang": source_lang,
+            "target_lang": target_lang,
+            "task": taskname_for(source_lang, target_lang),
+            "pnc": pnc,
+            model.prompt.PROMPT_LANGUAGE_SLOT: CANARY_SPECIAL_TOKENIZER
+        }
+    }]
+    return model.prompt.encode_dialog(turns)["context_ids"].tolist()
+
+def _decode_targets(model, audio, targets, source_lang, pnc):
+    """Run the encoder once and the decoder once per target"""
+    import torch
+    device = next(model.parameters()).device
+    lengths = torch.tensor([len(a) for a in audio], device=device)
+    signal = torch.zeros(len(audio), int(lengths.max()), device=device)
+    for i, a in enumerate(audio):
+        signal[i, :len(a)] = torch.from_numpy(a)
+
+    results = {}
+    with torch.inference_mode():
+        _, _, enc_states, enc_mask = model.forward(input_signal=signal, input_signal_length=lengths)
+        for target in targets:
+            prompt = _prompt_ids(model, source_lang, target, pnc)
+            decoder_input_ids = torch.tensor([prompt] * len(audio), device=device)
+            hypotheses = model.decoding.decode_predictions_tensor(
+                encoder_hidden_states=enc_states, encoder_input_mask=enc_mask,
+                decoder_input_ids=decoder_input_ids, return_hypotheses=False)
+            if isinstance(hypotheses, tuple):
+                hypotheses = hypotheses[0]
+            results[target] = [getattr(h, "text", h) for h in hypotheses]
+    return results
+
+_shared_encoder = True
+
+def transcribe_targets(model, audio, targets, source_lang="en", pnc="yes"):
+    """
+    Decode in-memory audio into several target languages
+
+    The encoder runs once per batch and only the decoder runs once per
+    target, so extra languages cost a decoder pass each rather than a full
+    pipeline. Models whose NeMo version lacks the prompt API used for this
+    fall back to one batched transcribe() per target.
+
+    Args:
+        model: Loaded Canary model
+        audio: List of 16 kHz mono float32 numpy arrays
+        targets: Target languages; the source language itself means plain ASR
+        source_lang: Source language
+        pnc: Include punctuation and capitalization (yes/no)
+
+    Returns:
+        Dict of target language -> list of texts, one per input
+    """
+    global _shared_encoder
+    audio = list(audio)
+    if not audio:
+        return {target: [] for target in targets}
+    if len(targets) > 1 and _shared_encoder and hasattr(model, "prompt"):
+        try:
+            return _decode_targets(model, audio, targets, source_lang, pnc)
+        except (ImportError, AttributeError, KeyError, TypeError) as e:
+            print(f"Shared-encoder decoding unavailable ({e}), decoding each target separately")
+            _shared_encoder = False
+    return {target: transcribe(model, audio, taskname_for(source_lang, target), source_lang,
+                               target, pnc, batch_size=len(audio))
+            for target in targets}
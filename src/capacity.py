@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Measured capacity model and admission control for live sessions.
+
+Every live chunk that runs on the model is recorded as a real-time factor
+(seconds of compute per second of new audio, per stream) keyed by chunk
+length and beam size. Chunks overlap, so a chunk runs once per hop (the
+new audio it adds), not once per chunk length; the factor is taken over
+the hop. A stream is one model input per chunk: an input channel in
+per-channel mode, times one decoder pass per target language.
+
+Before a session starts, its cost is estimated from recent measurements of
+the same configuration (or the nearest measured one) and added to the load
+of the sessions already admitted. If the total would pass max_load, the
+session is refused with the reason, so the running sessions keep up with
+real time instead of all falling behind together.
+
+Sessions with interim captions also decode each open chunk with the
+interim model. That time is added up per session between finals and kept
+as a separate real-time factor per chunk length, counted for sessions
+that use interims on top of the cost of their finals.
+"""
+
+import time
+import threading
+import collections
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CapacityModel:
+    def __init__(self, max_load=0.9, window=200, quantile=0.9, idle_timeout=300.0, history=50):
+        """
+        Initialize CapacityModel
+
+        Args:
+            max_load: Highest total real-time factor to admit sessions up to
+            window: Recent measurements kept per (chunk length, beam size)
+            quantile: Measurement quantile used as a session's cost
+            idle_timeout: Forget an admitted session that sent no chunk for this long, in seconds
+            history: Admission decisions kept for status
+        """
+        self.max_load = max_load
+        self.window = window
+        self.quantile = quantile
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.samples = {}
+        # Interim decoding per stream and second of audio, by chunk length
+        self.interim_samples = {}
+        # Interim time of each session since its last final chunk
+        self.pending_interim = collections.Counter()
+        # Admitted sessions: id -> {"chunk_seconds", "hop_seconds", "beam_size", "streams", "interim",
+        #                           "estimate", "last_seen"}
+        self.sessions = {}
+        self.decisions = collections.deque(maxlen=history)
+
+    @staticmethod
+    def key(chunk_seconds, beam_size):
+        return (round(float(chunk_seconds), 1), int(beam_size))
+
+    def record(self, chunk_seconds, beam_size, streams, elapsed, session=None, hop_seconds=None):
+        """
+        Add one measured chunk: streams inputs of chunk_seconds each took elapsed seconds
+
+        hop_seconds is the new audio in the chunk (default: the hop the
+        session was admitted with, else the whole chunk).
+        """
+        with self.lock:
+            entry = self.sessions.get(session)
+            if entry is not None:
+                entry["last_seen"] = time.monotonic()
+                hop_seconds = hop_seconds or entry["hop_seconds"]
+            hop_seconds = hop_seconds or chunk_seconds
+            interim = self.pending_interim.pop(session, None)
+            if chunk_seconds <= 0 or hop_seconds <= 0 or streams < 1:
+                return
+            key = self.key(chunk_seconds, beam_size)
+            if key not in self.samples:
+                self.samples[key] = collections.deque(maxlen=self.window)
+            self.samples[key].append(elapsed / hop_seconds / streams)
+            if interim is not None:
+                chunk = key[0]
+                if chunk not in self.interim_samples:
+                    self.interim_samples[chunk] = collections.deque(maxlen=self.window)
+                self.interim_samples[chunk].append(interim / hop_seconds / streams)
+
+    def record_interim(self, elapsed, session=None):
+        """Add the time of one interim decode; it counts towards the session's next final chunk"""
+        with self.lock:
+            if session is None:
+                return
+            if session in self.sessions:
+                self.sessions[session]["last_seen"] = time.monotonic()
+            self.pending_interim[session] += elapsed
+
+    def _interim_rtf(self, chunk_seconds):
+        """Interim real-time factor of one stream at the nearest measured chunk length, or 0.0; caller holds the lock"""
+        measured = {chunk: samples for chunk, samples in self.interim_samples.items() if samples}
+        if not measured:
+            return 0.0
+        chunk = self.key(chunk_seconds, 1)[0]
+        nearest = min(measured, key=lambda key: abs(key - chunk))
+        return _percentile(measured[nearest], self.quantile)
+
+    def _estimate(self, chunk_seconds, beam_size, streams, interim):
+        """Real-time factor of a session, or None before any measurement; caller holds the lock"""
+        rtf = self._stream_rtf(chunk_seconds, beam_size)
+        if rtf is None:
+            return None
+        if interim:
+            rtf += self._interim_rtf(chunk_seconds)
+        return rtf * streams
+
+    def stream_rtf(self, chunk_seconds, beam_size):
+        """
+        Estimated real-time factor of one stream, or None before any measurement
+
+        Uses the measurements of the same configuration, else the nearest chunk
+        length at the same beam size, else the nearest beam size scaled linearly
+        (which overestimates larger beams rather than underestimating them).
+        """
+        with self.lock:
+            return self._stream_rtf(chunk_seconds, beam_size)
+
+    def _stream_rtf(self, chunk_seconds, beam_size):
+        """stream_rtf(); caller holds the lock"""
+        chunk, beam = self.key(chunk_seconds, beam_size)
+        measured = {key: samples for key, samples in self.samples.items() if samples}
+        if not measured:
+            return None
+        if (chunk, beam) in measured:
+            return _percentile(measured[(chunk, beam)], self.quantile)
+        same_beam = [key for key in measured if key[1] == beam]
+        if same_beam:
+            nearest = min(same_beam, key=lambda key: abs(key[0] - chunk))
+            return _percentile(measured[nearest], self.quantile)
+        nearest = min(measured, key=lambda key: (abs(key[1] - beam), abs(key[0] - chunk)))
+        return _percentile(measured[nearest], self.quantile) * beam / nearest[1]
+
+    def _expire(self):
+        """Drop sessions that stopped sending chunks without being released; caller holds the lock"""
+        cutoff = time.monotonic() - self.idle_timeout
+        for session in [s for s, entry in self.sessions.items() if entry["last_seen"] < cutoff]:
+            del self.sessions[session]
+            self.pending_interim.pop(session, None)
+
+    def load(self, exclude=None):
+        """
+        Estimated real-time factor of the admitted sessions
+
+        Each session is re-estimated from the current measurements, so one
+        admitted before anything was measured counts once its chunks have run.
+        """
+        with self.lock:
+            return self._load(exclude)
+
+    def _load(self, exclude=None):
+        """load(); caller holds the lock"""
+        self._expire()
+        total = 0.0
+        for session, entry in self.sessions.items():
+            if session == exclude:
+                continue
+            estimate = self._estimate(entry["chunk_seconds"], entry["beam_size"], entry["streams"],
+                                      entry["interim"])
+            entry["estimate"] = estimate if estimate is not None else entry["estimate"]
+            total += entry["estimate"]
+        return total
+
+    def admit(self, session, chunk_seconds, beam_size, streams=1, replaces=None, interim=False,
+              hop_seconds=None):
+        """
+        Decide whether a new live session fits and register it if it does
+
+        Args:
+            session: Id of the new session
+            chunk_seconds: Chunk length the session transcribes
+            beam_size: Beam size it decodes with
+            streams: Model inputs per chunk (channels times target languages)
+            replaces: Id of a session the new one takes over from; its load is not counted
+            interim: The session also decodes interim captions
+            hop_seconds: New audio per chunk, less than chunk_seconds when chunks overlap
+
+        Returns:
+            Decision dict with admitted, reason, estimate, load, headroom and max_load
+        """
+        # Estimate, decide and register at once, so concurrent admissions see each other
+        with self.lock:
+            rtf = self._estimate(chunk_seconds, beam_size, streams, interim)
+            estimate = rtf if rtf is not None else 0.0
+            load = self._load(exclude=replaces)
+            admitted = load + estimate <= self.max_load
+            if admitted:
+                self.sessions.pop(replaces, None)
+                self.sessions[session] = {
+                    "chunk_seconds": chunk_seconds,
+                    "hop_seconds": hop_seconds or chunk_seconds,
+                    "beam_size": beam_size,
+                    "streams": streams,
+                    "interim": interim,
+                    "estimate": estimate,
+                    "last_seen": time.monotonic()
+                }
+
+        config = f"{chunk_seconds:g} s chunks, beam {beam_size}, {streams} stream{'s' if streams != 1 else ''}"
+        if rtf is None:
+            reason = f"No measurements yet; admitted unmeasured ({config})"
+        elif admitted:
+            reason = f"Estimated {estimate:.2f} of real time for {config}; load {load + estimate:.2f} of {self.max_load:.2f}"
+        else:
+            reason = (f"Host is at {load:.2f} of real time and this session needs about {estimate:.2f} "
+                      f"({config}), which would exceed the limit of {self.max_load:.2f}")
+
+        decision = {
+            "session": session,
+            "admitted": admitted,
+            "reason": reason,
+            "estimate": round(estimate, 3),
+            "load": round(load, 3),
+            "headroom": round(self.max_load - load - (estimate if admitted else 0.0), 3),
+            "max_load": self.max_load,
+            "time": time.time()
+        }
+        with self.lock:
+            self.decisions.append(decision)
+        return decision
+
+    def release(self, session):
+        """Forget a session that ended"""
+        with self.lock:
+            self.sessions.pop(session, None)
+            self.pending_interim.pop(session, None)
+
+    def snapshot(self):
+        """Load, headroom, admitted sessions, recent decisions and measurements"""
+        load = self.load()
+        with self.lock:
+            sessions = {session: {k: v for k, v in entry.items() if k != "last_seen"}
+                        for session, entry in self.sessions.items()}
+            measurements = [{"chunk_seconds": chunk, "beam_size": beam, "samples": len(samples),
+                             "stream_rtf": round(_percentile(samples, self.quantile), 4)}
+                            for (chunk, beam), samples in sorted(self.samples.items()) if samples]
+            interim = [{"chunk_seconds": chunk, "samples": len(samples),
+                        "stream_rtf": round(_percentile(samples, self.quantile), 4)}
+                       for chunk, samples in sorted(self.interim_samples.items()) if samples]
+            decisions = list(self.decisions)
+        return {
+            "max_load": self.max_load,
+            "load": round(load, 3),
+            "headroom": round(self.max_load - load, 3),
+            "sessions": sessions,
+            "measurements": measurements,
+            "interim_measurements": interim,
+            "decisions": decisions
+        }
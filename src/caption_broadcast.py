@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Coalescing caption broadcaster for live sessions.
+
+Each session has one broadcaster with one emitter thread. The processing
+thread only records new and changed captions; every tick the emitter turns
+what changed in each room into a single compact delta, serializes it once
+and emits it to the whole room, however many viewers are in it.
+
+Deltas are sent as the 'captions' event, a JSON string:
+
+    {"l": "de", "q": 12, "a": [[index, text, speaker], ...], "r": [[index, text], ...], "st": {...}}
+
+    l   language (room) the delta belongs to
+    q   per-room sequence number; a gap means the viewer missed a delta
+    a   captions appended since the last tick (speaker may be null)
+    r   earlier captions whose text was replaced
+    st  latest session status, only when it changed
+
+A viewer that joins (or sees a gap) gets a snapshot of the recent captions
+in the same format with "full": true.
+"""
+
+import json
+import threading
+import collections
+
+def _encode(message):
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class _Room:
+    def __init__(self, tail_size):
+        self.seq = 0
+        self.next_index = 0
+        # Recent captions for snapshots: index -> [index, text, speaker]
+        self.tail = collections.OrderedDict()
+        self.tail_size = tail_size
+        self.appended = []
+        self.replaced = {}
+
+class CaptionBroadcaster:
+    def __init__(self, socketio, tick=0.1, tail_size=200, event='captions'):
+        """
+        Initialize CaptionBroadcaster
+
+        Args:
+            socketio: Flask-SocketIO server to emit on
+            tick: Seconds between emits; updates within a tick are coalesced
+            tail_size: Captions per room kept for snapshots
+            event: Socket.IO event name
+        """
+        self.socketio = socketio
+        self.tick = tick
+        self.tail_size = tail_size
+        self.event = event
+        self.rooms = {}
+        self.status = None
+        self.status_changed = False
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _room(self, room):
+        if room not in self.rooms:
+            self.rooms[room] = _Room(self.tail_size)
+        return self.rooms[room]
+
+    def append(self, room, text, speaker=None):
+        """Queue a new caption for a room; returns its index"""
+        with self.lock:
+            state = self._room(room)
+            index = state.next_index
+            state.next_index += 1
+            entry = [index, text, speaker]
+            state.appended.append(entry)
+            state.tail[index] = entry
+            if len(state.tail) > state.tail_size:
+                state.tail.popitem(last=False)
+            return index
+
+    def replace(self, room, index, text):
+        """Queue a new text for an earlier caption (e.g. an interim caption made final)"""
+        with self.lock:
+            state = self._room(room)
+            entry = state.tail.get(index)
+            if entry is None:
+                return
+            entry[1] = text
+            # Still waiting in this tick's appends: the append carries the new text
+            if not any(pending is entry for pending in state.appended):
+                state.replaced[index] = text
+
+    def set_status(self, **status):
+        """Replace the session status; only the latest one per tick is sent"""
+        with self.lock:
+            self.status = status
+            self.status_changed = True
+
+    def snapshot(self, room):
+        """Serialized snapshot of the recent captions of a room"""
+        with self.lock:
+            state = self._room(room)
+            message = {"l": room, "q": state.seq, "full": True, "a": list(state.tail.values())}
+            if self.status is not None:
+                message["st"] = self.status
+            return _encode(message)
+
+    def flush(self):
+        """Emit one delta per room that changed since the last flush"""
+        with self.lock:
+            status = self.status if self.status_changed else None
+            self.status_changed = False
+            payloads = []
+            for name, state in self.rooms.items():
+                if not (state.appended or state.replaced or status):
+                    continue
+                state.seq += 1
+                message = {"l": name, "q": state.seq}
+                if state.appended:
+                    message["a"] = state.appended
+                    state.appended = []
+                if state.replaced:
+                    message["r"] = [[index, text] for index, text in state.replaced.items()]
+                    state.replaced = {}
+                if status:
+                    message["st"] = status
+                payloads.append((name, _encode(message)))
+
+        # Emit outside the lock so a slow transport never blocks the producer
+        for name, payload in payloads:
+            self.socketio.emit(self.event, payload, to=name)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the emitter after a final flush"""
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while not self.stopped.wait(self.tick):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error emitting captions: {str(e)}")
+        self.flush()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Streaming audio file discovery for batch_process.py.
+
+A directory tree is walked by several threads with os.scandir, so listings
+of a network share overlap instead of running one after another, and files
+are handed to the consumer as they are found: inference starts on the first
+batch while the walk goes on. Found files wait in a bounded queue, so a walk
+that runs ahead of inference blocks instead of holding the whole listing in
+memory. Directories are visited depth-first, and unvisited ones shared
+between the threads are bounded as well: when that queue is full, a thread
+walks the subdirectories it finds itself.
+"""
+
+import os
+import time
+import queue
+import threading
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.m4a')
+
+class DirectoryWalker:
+    def __init__(self, root, workers=8, max_pending=4096, max_directories=4096, extensions=AUDIO_EXTENSIONS):
+        """
+        Initialize DirectoryWalker and start walking root
+
+        Args:
+            root: Directory to walk
+            workers: Threads listing directories concurrently
+            max_pending: Found files held before the walkers wait for the consumer
+            max_directories: Unvisited directories shared between the threads
+            extensions: File suffixes to yield (lowercase)
+        """
+        self.extensions = extensions
+        self.files = queue.Queue(maxsize=max_pending)
+        self.directories = queue.LifoQueue(maxsize=max(1, max_directories))
+        self.stopped = threading.Event()
+        self.errors = []
+        self.done = False
+        self.directories.put(root)
+        self.threads = [threading.Thread(target=self._walk, daemon=True) for _ in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+        threading.Thread(target=self._finish, daemon=True).start()
+
+    def _put(self, item):
+        """Queue a found file, giving up if the consumer stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.files.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    def _walk(self):
+        while True:
+            directory = self.directories.get()
+            if directory is None:
+                return
+            try:
+                self._list(directory)
+            finally:
+                self.directories.task_done()
+
+    def _list(self, directory):
+        """List directory, walking subdirectories here while the shared queue is full"""
+        stack = [directory]
+        while stack and not self.stopped.is_set():
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            try:
+                                self.directories.put_nowait(entry.path)
+                            except queue.Full:
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions):
+                            self._put(entry.path)
+            except OSError as e:
+                self.errors.append(f"{current}: {e}")
+
+    def _finish(self):
+        """Signal the end once every queued directory has been listed"""
+        self.directories.join()
+        for _ in self.threads:
+            self.directories.put(None)
+        self._put(None)
+
+    def take(self, max_items, wait=1.0):
+        """
+        Next files found, waiting for the first one
+
+        Returns up to max_items files, without waiting more than wait seconds
+        for the rest once there is at least one, so a slow walk still keeps
+        the model busy. Returns an empty list when the walk is done.
+        """
+        if self.done:
+            return []
+        batch = []
+        deadline = None
+        while len(batch) < max_items:
+            try:
+                if deadline is None:
+                    item = self.files.get()
+                else:
+                    item = self.files.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self.done = True
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + wait
+        return batch
+
+    def __iter__(self):
+        while True:
+            batch = self.take(1)
+            if not batch:
+                return
+            yield batch[0]
+
+    def stop(self):
+        """Stop walking; files not yet taken are dropped"""
+        self.stopped.set()
@@ -4,16 +4,20 @@ import os
 import sys
 import argparse
 import time
-import json
 import datetime
 import threading
-import queue
+import collections
 import numpy as np
 import sounddevice as sd
 from pathlib import Path
 import soundfile as sf
-from nemo.collections.asr.models import EncDecMultiTaskModel
-import curses
+import canary_config
+from backends import load_backend
+from canary_model import model_name_for
+from audio_ring import AudioRing
+from resample import StreamResampler, device_format
+from multichannel import SpeakerChannels
+from transcript_journal import TranscriptJournal
 import textwrap
 from rich.console import Console
 from rich.panel import Panel
@@ -21,10 +25,103 @@ from rich.text import Text
 from rich.live import Live
 from rich.layout import Layout
 
+class TranscriptRenderer:
+    """
+    Draws the Rich display on its own thread
+
+    The inference thread only calls publish(), which queues the new segment
+    and swaps in a small state dict; it never waits on the terminal. The
+    render thread redraws at most refresh_per_second times, and only the
+    last wrapped line is re-wrapped when text is appended.
+    """
+    
+    def __init__(self, rtc, width=80, max_lines=500, refresh_per_second=4):
+        self.rtc = rtc
+        self.width = width
+        self.refresh_interval = 1.0 / refresh_per_second
+        self.lines = collections.deque(maxlen=max_lines)
+        self.pending = collections.deque()
+        self.state = {'chunk_index': 0, 'processing_time': 0.0, 'metrics': {}}
+        self.updated = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def publish(self, text=None, new_line=False, **state):
+        """Hand a finished segment and the latest counters to the render thread"""
+        if text:
+            self.pending.append((text, new_line))
+        self.state = {**self.state, **state}
+        self.updated.set()
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.stopped.set()
+        self.updated.set()
+        if self.thread:
+            self.thread.join()
+    
+    def _wrap_pending(self):
+        """Wrap newly added text, reusing all but the last line already wrapped"""
+        while self.pending:
+            text, new_line = self.pending.popleft()
+            tail = self.lines.pop() if self.lines and not new_line else ""
+            self.lines.extend(textwrap.wrap(f"{tail} {text}" if tail else text, width=self.width))
+    
+    def get_header(self):
+        rtc = self.rtc
+        mode = f"[{rtc.source_lang}->{rtc.target_lang}]" if rtc.task == "translation" else f"[{rtc.source_lang}]"
+        return Panel(
+            f"Real-Time Canary {rtc.task.upper()} {mode} - Buffer: {rtc.buffer_size}s - Press Ctrl+C to stop",
+            style="bold blue on black"
+        )
+    
+    def get_footer(self):
+        state = self.state
+        metrics = state['metrics']
+        return Panel(
+            f"Session: {self.rtc.session_id} | Chunks processed: {state['chunk_index']} | "
+            f"Last chunk: {state['processing_time']:.2f}s | "
+            f"Overflows: {metrics.get('overflows', 0) + metrics.get('input_overflows', 0)}",
+            style="bold white on black"
+        )
+    
+    def get_main(self):
+        # Only the lines that fit in the panel are joined
+        visible = max(1, self.rtc.console.height - 8)
+        lines = list(self.lines)[-visible:] if self.lines else ["Listening..."]
+        return Panel("\n".join(lines), title="Transcript", border_style="green")
+    
+    def _run(self):
+        layout = Layout()
+        layout.split(
+            Layout(name="header", size=3),
+            Layout(name="main"),
+            Layout(name="footer", size=3)
+        )
+        layout["header"].update(self.get_header())
+        
+        with Live(layout, console=self.rtc.console, auto_refresh=False) as live:
+            while True:
+                self.updated.wait()
+                self.updated.clear()
+                self._wrap_pending()
+                layout["main"].update(self.get_main())
+                layout["footer"].update(self.get_footer())
+                live.refresh()
+                if self.stopped.is_set():
+                    break
+                # Coalesce bursts of updates into one redraw per interval
+                self.stopped.wait(self.refresh_interval)
+
 class RealTimeCanary:
     def __init__(self, device=None, samplerate=16000, channels=1, 
                  source_lang="en", target_lang="en", task="asr", 
-                 pnc="yes", beam_size=1, buffer_size=3):
+                 pnc="yes", beam_size=1, buffer_size=3, headless=False,
+                 capture_rate=None, capture_channels=None, per_channel=False, speakers=None,
+                 backend=None):
         """
         Initialize RealTimeCanary
         
@@ -38,6 +135,12 @@ class RealTimeCanary:
             pnc: Include punctuation and capitalization (yes/no)
             beam_size: Beam size for decoding
             buffer_size: Size of audio buffer in seconds
+            headless: Print finished segments as plain lines instead of the live display
+            capture_rate: Rate to open the device at (default: its native rate)
+            capture_channels: Channels to open the device with (default: its native count, up to 2)
+            per_channel: Treat each input channel as a separate speaker (default: all native channels)
+            speakers: Speaker name per channel when per_channel is set
+            backend: Inference backend name (default: $CANARY_BACKEND or model.backend)
         """
         self.device = device
         self.samplerate = samplerate
@@ -49,152 +152,163 @@ class RealTimeCanary:
         self.pnc = pnc
         self.beam_size = beam_size
         self.buffer_size = buffer_size
-        self.audio_queue = queue.Queue()
+        # Capture at the device's native format and convert to samplerate/channels
+        if not (capture_rate and capture_channels):
+            native_rate, native_channels = device_format(device, max_channels=None if per_channel else 2)
+            capture_rate = capture_rate or native_rate
+            capture_channels = capture_channels or native_channels
+        self.capture_rate = capture_rate
+        self.capture_channels = capture_channels
+        # Per-channel mode keeps every channel, one speaker each
+        self.speaker_channels = None
+        if per_channel:
+            channels = self.channels = capture_channels
+            self.speaker_channels = SpeakerChannels(channels, speakers, samplerate)
+        self.resampler = StreamResampler(capture_rate, capture_channels, samplerate, channels)
+        # Room for several chunks so a slow inference never blocks the audio thread
+        self.ring = AudioRing(int(samplerate * max(buffer_size * 4, 10)), channels, samplerate)
         self.stop_event = threading.Event()
-        self.transcript_buffer = []
-        self.current_transcript = ""
         self.session_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         self.console = Console()
+        self.renderer = None if headless else TranscriptRenderer(self)
         
         # Create necessary directories
-        self.transcript_dir = "/workspace/transcripts"
+        self.transcript_dir = canary_config.get("paths", "output_dir")
         self.temp_dir = "/workspace/temp_audio"
         os.makedirs(self.transcript_dir, exist_ok=True)
         os.makedirs(self.temp_dir, exist_ok=True)
         
-        # Load Canary model
-        self.console.print("[bold blue]Loading Canary-1B model...[/bold blue]")
-        self.model = EncDecMultiTaskModel.from_pretrained('nvidia/canary-1b')
+        # Segments go to an append-only journal as they are produced
+        self.journal = TranscriptJournal(self.transcript_basename(), metadata={
+            'session_id': self.session_id,
+            'task': task,
+            'source_lang': source_lang,
+            'target_lang': target_lang,
+            'pnc': pnc,
+            'beam_size': beam_size,
+            'buffer_size': buffer_size,
+            'speakers': self.speaker_channels.labels if per_channel else None
+        })
         
-        # Update decode params
-        decode_cfg = self.model.cfg.decoding
-        decode_cfg.beam.beam_size = beam_size
-        self.model.change_decoding_strategy(decode_cfg)
+        # Load Canary model
+        self.console.print(f"[bold blue]Loading {model_name_for('final')}...[/bold blue]")
+        self.backend = load_backend(backend, role="final", beam_size=beam_size)
         self.console.print("[bold green]Model loaded successfully![/bold green]")
     
     def audio_callback(self, indata, frames, time, status):
         """Callback for sounddevice to capture audio"""
         if status:
-            print(status, file=sys.stderr)
-        # Add the audio data to the queue
-        self.audio_queue.put(indata.copy())
+            self.ring.record_status(status)
+        # Resample to the model format straight into the ring; no locks or
+        # allocations in the audio thread
+        self.resampler.process(indata, self.ring.write)
     
-    def create_manifest(self, audio_file):
-        """Create a manifest file for the audio file"""
-        manifest_path = f"{self.temp_dir}/manifest_{self.session_id}_{int(time.time())}.json"
+    def transcribe_chunk(self, buffer, chunk_index):
+        """
+        Transcribe one full chunk buffer
+
+        Returns:
+            List of (text, extra journal fields); in per-channel mode there is one
+            entry per speaker with speech, all from a single batched model call
+        """
+        if self.speaker_channels:
+            segments = self.speaker_channels.transcribe(self.backend, buffer, self.taskname,
+                                                        self.source_lang, self.target_lang, self.pnc)
+            return [(text, {'speaker': speaker, 'channel': channel})
+                    for channel, speaker, text in segments]
         
-        entry = {
-            "audio_filepath": os.path.abspath(audio_file),
-            "duration": self.buffer_size,
-            "taskname": self.taskname,
-            "source_lang": self.source_lang,
-            "target_lang": self.target_lang,
-            "pnc": self.pnc,
-            "answer": "na"
-        }
+        if self.backend.capabilities["in_memory_audio"]:
+            result = self.backend.transcribe([np.ascontiguousarray(buffer[:, 0])], self.taskname,
+                                             self.source_lang, self.target_lang, self.pnc)
+        else:
+            # Save audio to temporary file for backends that only read files
+            audio_file = f"{self.temp_dir}/chunk_{self.session_id}_{chunk_index}.wav"
+            sf.write(audio_file, buffer, self.samplerate)
+            try:
+                result = self.backend.transcribe([audio_file], self.taskname, self.source_lang,
+                                                 self.target_lang, self.pnc)
+            finally:
+                # Clean up temporary files
+                os.remove(audio_file)
         
-        with open(manifest_path, 'w') as f:
-            f.write(json.dumps(entry))
-            
-        return manifest_path
+        text = result[0] if result and len(result) > 0 else None
+        return [(text, {})] if text else []
     
     def process_audio(self):
-        """Process audio chunks from the queue and transcribe"""
-        buffer = np.array([]).reshape(0, self.channels)
+        """Process audio chunks from the ring and transcribe"""
         buffer_samples = int(self.samplerate * self.buffer_size)
         overlap_samples = int(buffer_samples * 0.25)  # 25% overlap for context
+        buffer = np.zeros((buffer_samples, self.channels), dtype=np.float32)
+        filled = 0
         chunk_index = 0
+        stream_frames = 0
         
-        # Setup rich display
-        layout = Layout()
-        layout.split(
-            Layout(name="header", size=3),
-            Layout(name="main"),
-            Layout(name="footer", size=3)
-        )
-        
-        def get_header():
-            mode = f"[{self.source_lang}->{self.target_lang}]" if self.task == "translation" else f"[{self.source_lang}]"
-            return Panel(
-                f"Real-Time Canary {self.task.upper()} {mode} - Buffer: {self.buffer_size}s - Press Ctrl+C to stop",
-                style="bold blue on black"
-            )
-            
-        def get_footer():
-            return Panel(
-                f"Session: {self.session_id} | Chunks processed: {chunk_index}",
-                style="bold white on black"
-            )
-            
-        def get_main():
-            lines = textwrap.wrap(self.current_transcript, width=80) if self.current_transcript else ["Listening..."]
-            content = "\n".join(lines)
-            return Panel(content, title="Transcript", border_style="green")
+        # Rendering runs on its own thread so a slow terminal never delays inference
+        if self.renderer:
+            self.renderer.start()
         
-        with Live(layout, refresh_per_second=4) as live:
-            layout["header"].update(get_header())
-            layout["footer"].update(get_footer())
-            layout["main"].update(get_main())
-            
+        try:
             while not self.stop_event.is_set():
                 try:
-                    # Get audio chunk from queue with timeout
-                    chunk = self.audio_queue.get(timeout=0.1)
-                    buffer = np.vstack((buffer, chunk))
+                    # Fill the chunk buffer from the ring
+                    frames = self.ring.read_into(buffer[filled:], timeout=0.1)
+                    filled += frames
+                    stream_frames += frames
                     
                     # Process when buffer is full
-                    if len(buffer) >= buffer_samples:
-                        # Save audio to temporary file
-                        audio_file = f"{self.temp_dir}/chunk_{self.session_id}_{chunk_index}.wav"
-                        sf.write(audio_file, buffer, self.samplerate)
-                        
-                        # Create manifest for processing
-                        manifest_path = self.create_manifest(audio_file)
+                    if filled == buffer_samples:
+                        start_time = time.time()
+                        segments = self.transcribe_chunk(buffer, chunk_index)
+                        processing_time = time.time() - start_time
                         
-                        # Process with manifest
-                        result = self.model.transcribe(manifest_path, batch_size=1)
+                        # Append to the journal with the chunk's position in the stream
+                        chunk_end = stream_frames / self.samplerate
+                        for text, extra in segments:
+                            self.journal.append(text, chunk_end - self.buffer_size, chunk_end,
+                                                chunk_index=chunk_index, **extra)
                         
-                        if result and len(result) > 0:
-                            # Add to transcript buffer
-                            self.transcript_buffer.append(result[0])
-                            
-                            # Update current transcript (last 3 chunks)
-                            self.current_transcript = " ".join(self.transcript_buffer[-3:])
-                            layout["main"].update(get_main())
-                            layout["footer"].update(get_footer())
-                        
-                        # Reset buffer with overlap for context
-                        buffer = buffer[-overlap_samples:] if overlap_samples > 0 else np.array([]).reshape(0, self.channels)
-                        
-                        # Clean up temporary files
-                        os.remove(audio_file)
-                        os.remove(manifest_path)
+                        # Keep the tail of the buffer as overlap for context
+                        if overlap_samples > 0:
+                            buffer[:overlap_samples] = buffer[buffer_samples - overlap_samples:]
+                        filled = overlap_samples
                         
                         chunk_index += 1
+                        for text, extra in segments:
+                            speaker = extra.get('speaker')
+                            line = f"{speaker}: {text}" if speaker else text
+                            if self.renderer:
+                                self.renderer.publish(line, new_line=bool(speaker))
+                            else:
+                                print(line, flush=True)
+                        if self.renderer:
+                            self.renderer.publish(chunk_index=chunk_index,
+                                                  processing_time=processing_time,
+                                                  metrics=self.ring.metrics())
                 
-                except queue.Empty:
-                    continue
                 except KeyboardInterrupt:
                     break
                 except Exception as e:
                     self.console.print(f"[bold red]Error processing audio: {str(e)}[/bold red]")
+        finally:
+            self.stream_seconds = stream_frames / self.samplerate
+            if self.renderer:
+                self.renderer.stop()
         
-        return self.transcript_buffer
+        return self.journal
     
-    def save_transcript(self, transcript_buffer):
-        """Save complete transcript to file"""
-        if not transcript_buffer:
-            return
-            
-        # Create filename based on task
+    def transcript_basename(self):
+        """Output path without extension, based on task"""
         if self.task == "asr":
-            filename = f"{self.transcript_dir}/realtime_{self.source_lang}_transcription_{self.session_id}.txt"
-        else:
-            filename = f"{self.transcript_dir}/realtime_{self.source_lang}_to_{self.target_lang}_{self.session_id}.txt"
-        
-        # Write transcript to file
-        with open(filename, 'w') as f:
-            f.write("\n".join(transcript_buffer))
+            return f"{self.transcript_dir}/realtime_{self.source_lang}_transcription_{self.session_id}"
+        return f"{self.transcript_dir}/realtime_{self.source_lang}_to_{self.target_lang}_{self.session_id}"
+    
+    def save_transcript(self):
+        """Assemble the transcript files from the journal"""
+        if self.journal.closed:
+            return
+        filename = self.journal.finish()
+        if not filename:
+            return
             
         self.console.print(f"\n[bold green]Transcript saved to {filename}[/bold green]")
         return filename
@@ -203,26 +317,30 @@ class RealTimeCanary:
         """Run real-time transcription"""
         try:
             # Start audio capture thread
-            with sd.InputStream(device=self.device, channels=self.channels,
-                               samplerate=self.samplerate, callback=self.audio_callback):
+            with sd.InputStream(device=self.device, channels=self.capture_channels,
+                               samplerate=self.capture_rate, callback=self.audio_callback):
                 
                 # Process audio in main thread
-                transcript_buffer = self.process_audio()
+                journal = self.process_audio()
                 
                 # Save complete transcript
-                filename = self.save_transcript(transcript_buffer)
+                filename = self.save_transcript()
                 
                 # Print summary
                 if filename:
-                    word_count = sum(len(line.split()) for line in transcript_buffer)
                     self.console.print(f"[bold]Session Summary:[/bold]")
-                    self.console.print(f"- Duration: {len(transcript_buffer) * self.buffer_size:.1f} seconds (approx)")
-                    self.console.print(f"- Words transcribed: {word_count}")
-                    self.console.print(f"- Chunks processed: {len(transcript_buffer)}")
+                    self.console.print(f"- Duration: {self.stream_seconds:.1f} seconds")
+                    self.console.print(f"- Words transcribed: {journal.word_count}")
+                    self.console.print(f"- Chunks processed: {journal.count}")
+                    metrics = self.ring.metrics()
+                    self.console.print(f"- Audio overflows: {metrics['overflows']} ring "
+                                       f"({metrics['dropped_frames']} frames dropped), "
+                                       f"{metrics['input_overflows']} device")
                 
         except KeyboardInterrupt:
             self.stop_event.set()
             self.console.print("\n[bold yellow]Stopping...[/bold yellow]")
+            self.save_transcript()
         except Exception as e:
             self.console.print(f"[bold red]Error: {str(e)}[/bold red]")
 
@@ -250,6 +368,16 @@ def main():
     parser.add_argument("--buffer-size", type=float, default=3.0, 
                         help="Audio buffer size in seconds")
     parser.add_argument("--beam-size", type=int, default=1, help="Beam size for decoding")
+    parser.add_argument("--headless", action="store_true",
+                        help="Print finished segments as plain lines instead of the live display")
+    parser.add_argument("--capture-rate", type=int, default=None,
+                        help="Rate to open the device at (default: its native rate; resampled to 16 kHz)")
+    parser.add_argument("--capture-channels", type=int, default=None,
+                        help="Channels to open the device with (default: its native count)")
+    parser.add_argument("--per-channel", action="store_true",
+                        help="Transcribe each input channel as a separate speaker, batched together")
+    parser.add_argument("--speakers", type=str, default=None,
+                        help="Comma-separated speaker names, one per channel (with --per-channel)")
     
     args = parser.parse_args()
     
@@ -271,7 +399,12 @@ def main():
         task=args.task,
         pnc=args.pnc,
         buffer_size=args.buffer_size,
-        beam_size=args.beam_size
+        beam_size=args.beam_size,
+        headless=args.headless,
+        capture_rate=args.capture_rate,
+        capture_channels=args.capture_channels,
+        per_channel=args.per_channel,
+        speakers=args.speakers.split(",") if args.speakers else None
     )
     
     rtc.run()
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Priority inference scheduler for one device.
+
+All inference on the device goes through one worker thread. Work is
+submitted as jobs of a priority class:
+
+    live   chunks from live sessions; always run first, and sessions are
+           served round-robin so a busy one cannot starve the others
+    batch  file batches; run only when no live work is waiting, in units
+           sized so that a live chunk arriving meanwhile waits well within
+           the live latency budget
+
+A unit is never interrupted, so live work takes over at the next unit
+boundary. Unit sizes for batch work are derived from the measured time per
+item, and shrink when live wait times approach the budget.
+"""
+
+import time
+import threading
+import collections
+
+LIVE = "live"
+BATCH = "batch"
+PRIORITIES = (LIVE, BATCH)
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Job:
+    def __init__(self, items, run, priority, tenant, unit_size):
+        self.items = items
+        self.run = run
+        self.priority = priority
+        self.tenant = tenant
+        self.unit_size = max(1, unit_size)
+        self.results = []
+        self.next = 0
+        self.error = None
+        self.submitted = time.monotonic()
+        self.started = None
+        self.done = threading.Event()
+
+    def wait(self):
+        """Block until the job finishes; returns its results or raises its error"""
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.results
+
+class ClassMetrics:
+    def __init__(self, window=1000):
+        self.jobs = 0
+        self.items = 0
+        self.busy = 0.0
+        self.waits = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=window)
+        self.item_time = None  # EWMA of seconds per item
+
+    def record_unit(self, items, elapsed):
+        self.items += items
+        self.busy += elapsed
+        per_item = elapsed / max(items, 1)
+        self.item_time = per_item if self.item_time is None else 0.8 * self.item_time + 0.2 * per_item
+
+    def snapshot(self, uptime):
+        return {
+            "jobs": self.jobs,
+            "items": self.items,
+            "items_per_second": round(self.items / uptime, 3) if uptime else 0.0,
+            "busy_fraction": round(self.busy / uptime, 3) if uptime else 0.0,
+            "wait_p50": round(_percentile(self.waits, 0.5), 4),
+            "wait_p99": round(_percentile(self.waits, 0.99), 4),
+            "latency_p99": round(_percentile(self.latencies, 0.99), 4)
+        }
+
+class InferenceScheduler:
+    def __init__(self, live_budget=1.0):
+        """
+        Initialize InferenceScheduler
+
+        Args:
+            live_budget: Longest a live chunk should wait for the device, in seconds
+        """
+        self.live_budget = live_budget
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        # Live jobs per session, served round-robin; batch jobs in arrival order
+        self.live = collections.OrderedDict()
+        self.batch = collections.deque()
+        self.metrics = {priority: ClassMetrics() for priority in PRIORITIES}
+        self.started = time.monotonic()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, items, run, priority=BATCH, tenant=None, unit_size=None):
+        """
+        Queue work for the device
+
+        Args:
+            items: List of inputs
+            run: Called on the worker thread with a slice of items; returns one result per item
+            priority: live or batch
+            tenant: Live session the work belongs to, for fair queuing
+            unit_size: Largest slice to run at once (default: all items)
+
+        Returns:
+            Job; call wait() for the results
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        job = Job(list(items), run, priority, tenant, unit_size or len(items))
+        with self.lock:
+            self.metrics[priority].jobs += 1
+            if not job.items:
+                job.done.set()
+                return job
+            if priority == LIVE:
+                self.live.setdefault(tenant, collections.deque()).append(job)
+            else:
+                self.batch.append(job)
+            self.wakeup.notify()
+        return job
+
+    def run(self, items, run, priority=BATCH, tenant=None, unit_size=None):
+        """Submit and wait; returns the results in input order"""
+        return self.submit(items, run, priority, tenant, unit_size).wait()
+
+    def batch_unit(self, job):
+        """Items of a batch job to run next without holding live work up past the budget"""
+        item_time = self.metrics[BATCH].item_time
+        if item_time is None:
+            return 1  # measure one item before committing to more
+        budget = self.live_budget
+        live_p99 = _percentile(self.metrics[LIVE].waits, 0.99)
+        if live_p99 > 0.5 * self.live_budget:
+            # Live work is already waiting a lot; leave it more of the budget
+            budget = max(self.live_budget - live_p99, 0.1 * self.live_budget)
+        return max(1, min(job.unit_size, int(0.5 * budget / item_time)))
+
+    def _next_unit(self):
+        """Pick the next (job, start, end) to run; caller holds the lock"""
+        if self.live:
+            # Round-robin: take the first session's head job, then move it to the back
+            tenant, jobs = next(iter(self.live.items()))
+            job = jobs[0]
+            end = min(len(job.items), job.next + job.unit_size)
+            if end == len(job.items):
+                jobs.popleft()
+            if jobs:
+                self.live.move_to_end(tenant)
+            else:
+                del self.live[tenant]
+            return job, job.next, end
+        if self.batch:
+            job = self.batch[0]
+            end = min(len(job.items), job.next + self.batch_unit(job))
+            if end == len(job.items):
+                self.batch.popleft()
+            return job, job.next, end
+        return None
+
+    def _run(self):
+        while True:
+            with self.lock:
+                unit = self._next_unit()
+                while unit is None:
+                    self.wakeup.wait()
+                    unit = self._next_unit()
+            job, start, end = unit
+            job.next = end
+            metrics = self.metrics[job.priority]
+
+            now = time.monotonic()
+            if job.started is None:
+                job.started = now
+                metrics.waits.append(now - job.submitted)
+            try:
+                job.results.extend(job.run(job.items[start:end]))
+            except Exception as e:
+                job.error = e
+            metrics.record_unit(end - start, time.monotonic() - now)
+
+            if job.error is not None or end == len(job.items):
+                if job.error is not None:
+                    self._discard(job)
+                metrics.latencies.append(time.monotonic() - job.submitted)
+                job.done.set()
+
+    def _discard(self, job):
+        """Drop the rest of a failed job from the queues"""
+        with self.lock:
+            if job in self.batch:
+                self.batch.remove(job)
+            jobs = self.live.get(job.tenant)
+            if jobs and job in jobs:
+                jobs.remove(job)
+                if not jobs:
+                    del self.live[job.tenant]
+
+    def snapshot(self):
+        """Per-class throughput and wait times, plus queue depths"""
+        uptime = time.monotonic() - self.started
+        with self.lock:
+            queued = {
+                LIVE: sum(len(jobs) for jobs in self.live.values()),
+                BATCH: len(self.batch)
+            }
+            live_sessions = len(self.live)
+        classes = {priority: {**metrics.snapshot(uptime), "queued": queued[priority]}
+                   for priority, metrics in self.metrics.items()}
+        return {
+            "live_budget": self.live_budget,
+            "live_within_budget": classes[LIVE]["wait_p99"] <= self.live_budget,
+            "live_sessions_waiting": live_sessions,
+            "classes": classes
+        }
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Load test for the streaming server (streaming-rtc.py).
+
+Simulated clients connect over Socket.IO, start a session fed by their own
+audio (source "client"), stream audio files in real time and record:
+
+    ttft       seconds from the session start to its first caption
+    latency    per-chunk end-to-end latency: from sending the last sample of
+               a chunk to receiving the status that reports it transcribed
+    dropped    clients that were disconnected during the run
+
+The run steps through increasing client counts and prints latency
+percentiles for each, so the knee shows where the server stops keeping up.
+To measure the server's own overhead without a GPU, start it with the stub
+model:
+
+    python streaming-rtc.py --stub-model --max-load 100
+    python load_test.py --audio samples/ --clients 1 2 4 8 16 32 --duration 30
+"""
+
+import os
+import sys
+import json
+import time
+import bisect
+import argparse
+import threading
+
+import numpy as np
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg', '.m4a')
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def load_audio(paths):
+    """(samples, samplerate) of every audio file, as float32 (frames, channels)"""
+    import soundfile as sf
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    audio = []
+    for path in files:
+        samples, samplerate = sf.read(path, dtype='float32', always_2d=True)
+        audio.append((samples, samplerate))
+    return audio
+
+class SimulatedClient:
+    def __init__(self, url, audio, samplerate, duration, block_seconds=0.1, session_options=None):
+        """
+        Initialize SimulatedClient
+
+        Args:
+            url: Server URL
+            audio: float32 (frames, channels) samples, looped for the whole duration
+            samplerate: Sampling rate of audio
+            duration: Seconds of audio to stream
+            block_seconds: Audio per 'audio' event
+            session_options: Extra start_transcription fields (buffer_size, target_langs, ...)
+        """
+        self.url = url
+        self.audio = audio
+        self.samplerate = samplerate
+        self.duration = duration
+        self.block = max(1, int(samplerate * block_seconds))
+        self.session_options = session_options or {}
+        self.started = None
+        self.status = None
+        self.ttft = None
+        self.latencies = []
+        self.dropped = False
+        self.error = None
+        # Stream position (seconds) after each block, and when it was sent
+        self.sent_positions = []
+        self.sent_times = []
+        self.closing = False
+
+    def on_captions(self, payload):
+        now = time.time()
+        message = json.loads(payload)
+        if self.ttft is None and message.get("a") and self.started:
+            self.ttft = now - self.started
+        stream_end = (message.get("st") or {}).get("stream_end")
+        if stream_end is not None:
+            # The first block whose end reaches the chunk's end carried its last sample
+            i = bisect.bisect_left(self.sent_positions, stream_end - 1e-6)
+            if i < len(self.sent_times):
+                self.latencies.append(now - self.sent_times[i])
+
+    def on_disconnect(self):
+        if not self.closing:
+            self.dropped = True
+
+    def run(self):
+        import socketio
+        client = socketio.Client(reconnection=False)
+        client.on('captions', self.on_captions)
+        client.on('disconnect', self.on_disconnect)
+        try:
+            client.connect(self.url, transports=['websocket'])
+            response = client.call('start_transcription', {
+                'source': 'client',
+                'samplerate': self.samplerate,
+                'channels': self.audio.shape[1],
+                'device': 'default',
+                **self.session_options
+            }, timeout=120)
+            self.status = response.get('status')
+            if self.status != 'started':
+                self.error = response.get('message')
+                return
+            self.started = time.time()
+
+            # Stream in real time, pacing against the start so delays do not accumulate
+            total = int(self.duration * self.samplerate)
+            sent = 0
+            while sent < total and client.connected:
+                start = sent % len(self.audio)
+                block = self.audio[start:start + min(self.block, total - sent)]
+                client.emit('audio', np.ascontiguousarray(block, dtype='<f4').tobytes())
+                sent += len(block)
+                self.sent_positions.append(sent / self.samplerate)
+                self.sent_times.append(time.time())
+                delay = self.started + sent / self.samplerate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            # Let the last chunk come back
+            time.sleep(float(self.session_options.get('buffer_size', 2.0)) + 1.0)
+            self.closing = True
+            if client.connected:
+                client.call('stop_transcription', timeout=60)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.closing = True
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+def run_step(url, audio, clients, duration, ramp, session_options):
+    """Run clients simultaneous clients and summarize them"""
+    sims = []
+    for i in range(clients):
+        samples, samplerate = audio[i % len(audio)]
+        sims.append(SimulatedClient(url, samples, samplerate, duration, session_options=session_options))
+    threads = [threading.Thread(target=sim.run, daemon=True) for sim in sims]
+    for thread in threads:
+        thread.start()
+        time.sleep(ramp)
+    for thread in threads:
+        thread.join()
+
+    started = [sim for sim in sims if sim.status == 'started']
+    latencies = [latency for sim in started for latency in sim.latencies]
+    ttfts = [sim.ttft for sim in started if sim.ttft is not None]
+    summary = {
+        "clients": clients,
+        "started": len(started),
+        "rejected": sum(1 for sim in sims if sim.status in ('rejected', 'error')),
+        "failed": sum(1 for sim in sims if sim.status is None),
+        "dropped": sum(1 for sim in sims if sim.dropped),
+        "chunks": len(latencies),
+        "ttft_p50": _percentile(ttfts, 0.5),
+        "ttft_p95": _percentile(ttfts, 0.95),
+        "latency_p50": _percentile(latencies, 0.5),
+        "latency_p95": _percentile(latencies, 0.95),
+        "latency_p99": _percentile(latencies, 0.99),
+        "errors": sorted({sim.error for sim in sims if sim.error})
+    }
+    return summary
+
+def find_knee(steps, factor=2.0):
+    """First client count whose p95 latency is factor times that of the first step, or None"""
+    measured = [step for step in steps if step["latency_p95"] is not None]
+    if len(measured) < 2:
+        return None
+    baseline = measured[0]["latency_p95"]
+    for step in measured[1:]:
+        if step["latency_p95"] > factor * baseline or step["dropped"] or step["rejected"]:
+            return step["clients"]
+    return None
+
+def format_seconds(value):
+    return f"{value:7.3f}" if value is not None else "      -"
+
+def print_report(steps, knee):
+    print(f"\n{'clients':>7} {'started':>7} {'rejected':>8} {'dropped':>7} {'chunks':>6} "
+          f"{'ttft p50':>8} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for step in steps:
+        print(f"{step['clients']:>7} {step['started']:>7} {step['rejected']:>8} {step['dropped']:>7} "
+              f"{step['chunks']:>6} {format_seconds(step['ttft_p50']):>8} {format_seconds(step['latency_p50'])} "
+              f"{format_seconds(step['latency_p95'])} {format_seconds(step['latency_p99'])}")
+    if knee:
+        print(f"\nKnee: latency degrades from {knee} clients")
+    else:
+        print("\nNo knee within the tested client counts")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the streaming server with simulated clients")
+    parser.add_argument("--url", type=str, default="http://localhost:5000", help="Server URL")
+    parser.add_argument("--audio", type=str, nargs="+", required=True,
+                        help="Audio files or directories to stream (looped; one file per client, round-robin)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="Client counts to step through")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of audio each client streams")
+    parser.add_argument("--ramp", type=float, default=0.2, help="Seconds between client connects")
+    parser.add_argument("--buffer-size", type=float, default=2.0, help="Chunk size of each session")
+    parser.add_argument("--target-langs", type=str, default=None, help="Caption languages per session")
+    parser.add_argument("--output", type=str, help="Write the report as JSON")
+
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio)
+    if not audio:
+        print(f"No audio files found in {args.audio}")
+        sys.exit(1)
+
+    session_options = {'buffer_size': args.buffer_size}
+    if args.target_langs:
+        session_options['target_langs'] = args.target_langs
+
+    steps = []
+    for clients in args.clients:
+        print(f"Running {clients} client{'s' if clients != 1 else ''} for {args.duration:g} s...")
+        steps.append(run_step(args.url, audio, clients, args.duration, args.ramp, session_options))
+        for error in steps[-1]["errors"]:
+            print(f"  {error}")
+
+    knee = find_knee(steps)
+    print_report(steps, knee)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"steps": steps, "knee": knee, "options": vars(args)}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-channel speaker streams for multi-mic capture.
+
+With several lavalier mics on one interface, each input channel is one
+speaker. The capture path keeps all channels in one (frames, channels)
+ring and chunk buffer; at every step SpeakerChannels runs a small energy
+VAD per channel, picks the channels with speech and transcribes their
+chunks in a single batched model call. Silent channels cost nothing.
+"""
+
+import numpy as np
+
+class EnergyVAD:
+    """
+    Energy gate for one channel
+
+    A chunk counts as speech when enough of its short frames rise
+    threshold_db above the channel's noise floor. The floor follows the
+    quietest frames of each chunk: it drops at once and rises slowly, so
+    it adapts to the room without being pulled up by the speaker. After
+    speech, the next hangover chunks pass too, so trailing words are kept.
+    """
+
+    def __init__(self, samplerate=16000, frame_ms=30, threshold_db=9.0,
+                 min_speech=0.1, hangover=1, rise=0.1, floor_db=-70.0):
+        self.frame = int(samplerate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.min_speech = min_speech
+        self.hangover = hangover
+        self.rise = rise
+        self.floor_db = floor_db
+        self.noise_db = None
+        self.hold = 0
+        self.level_db = floor_db
+
+    def __call__(self, chunk):
+        usable = len(chunk) // self.frame * self.frame
+        if usable == 0:
+            return False
+        frames = chunk[:usable].reshape(-1, self.frame)
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+
+        quiet = float(np.percentile(energy_db, 10))
+        if self.noise_db is None or quiet < self.noise_db:
+            self.noise_db = quiet
+
+        gate = max(self.noise_db, self.floor_db) + self.threshold_db
+        loud = energy_db > gate
+        # Level of the voiced frames, used to reject crosstalk between mics
+        self.level_db = float(energy_db[loud].mean()) if loud.any() else self.floor_db
+        speech = loud.mean() >= self.min_speech
+
+        # Rise much more slowly during speech so a long monologue is not gated out
+        if quiet > self.noise_db:
+            self.noise_db += (self.rise / 10 if speech else self.rise) * (quiet - self.noise_db)
+
+        if speech:
+            self.hold = self.hangover
+            return True
+        if self.hold:
+            self.hold -= 1
+            return True
+        return False
+
+class SpeakerChannels:
+    def __init__(self, count, labels=None, samplerate=16000, crosstalk_db=15.0):
+        """
+        Initialize SpeakerChannels
+
+        Args:
+            count: Number of input channels, one speaker each
+            labels: Speaker name per channel (default: "Speaker 1", "Speaker 2", ...)
+            samplerate: Sampling rate of the chunks
+            crosstalk_db: Ignore a channel whose speech is this much quieter than the
+                          loudest channel in the same chunk (None to keep all)
+        """
+        labels = list(labels or [])
+        self.labels = labels[:count] + [f"Speaker {i + 1}" for i in range(len(labels), count)]
+        self.vads = [EnergyVAD(samplerate) for _ in range(count)]
+        self.crosstalk_db = crosstalk_db
+        self.skipped = [0] * count
+        self.active = []
+
+    def voiced(self, buffer):
+        """Indices of the channels in a (frames, channels) chunk that carry speech"""
+        active = [c for c, vad in enumerate(self.vads) if vad(buffer[:, c])]
+        if self.crosstalk_db is not None and len(active) > 1:
+            loudest = max(self.vads[c].level_db for c in active)
+            active = [c for c in active if self.vads[c].level_db >= loudest - self.crosstalk_db]
+        for c in range(len(self.vads)):
+            if c not in active:
+                self.skipped[c] += 1
+        self.active = active
+        return active
+
+    def transcribe(self, backend, buffer, taskname="asr", source_lang="en", target_lang="en", pnc="yes"):
+        """
+        Transcribe the voiced channels of a chunk in one batched call
+
+        Returns:
+            List of (channel, label, text) for channels that produced text
+        """
+        active = self.voiced(buffer)
+        if not active:
+            return []
+        chunks = [np.ascontiguousarray(buffer[:, c]) for c in active]
+        results = backend.transcribe(chunks, taskname=taskname, source_lang=source_lang,
+                                     target_lang=target_lang, pnc=pnc, batch_size=len(chunks))
+        return [(c, self.labels[c], text) for c, text in zip(active, results or []) if text]
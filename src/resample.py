@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Streaming polyphase resampler with downmix.
+
+Lets capture run at the device's native rate and channel count (e.g. 48 kHz
+stereo) while the model gets 16 kHz mono. Blocks are processed one at a time
+with the filter history carried across blocks, and every working array is
+allocated up front, so process() can be called from the audio callback.
+"""
+
+from math import gcd, ceil
+
+import numpy as np
+
+class StreamResampler:
+    def __init__(self, in_rate, in_channels, out_rate=16000, out_channels=1,
+                 max_block=4096, taps_per_phase=None):
+        """
+        Initialize StreamResampler
+
+        Args:
+            in_rate: Capture sampling rate
+            in_channels: Capture channel count
+            out_rate: Model sampling rate
+            out_channels: 1 to downmix, or in_channels to resample each channel separately
+            max_block: Largest block processed in one pass; longer blocks are split
+            taps_per_phase: Filter length per polyphase branch (default scales with the
+                            decimation factor)
+        """
+        if out_channels not in (1, in_channels):
+            raise ValueError("out_channels must be 1 or in_channels")
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.max_block = max_block
+
+        g = gcd(self.out_rate, self.in_rate)
+        self.up = self.out_rate // g
+        self.down = self.in_rate // g
+        self.passthrough = self.up == self.down and in_channels == out_channels
+
+        self.taps = taps_per_phase or 24 * max(1, ceil(self.down / self.up))
+        self.phases = self._design_filter()
+
+        # Input history plus room for one block, in output channel layout
+        history = self.taps - 1
+        self.history = history
+        self.x = np.zeros((history + max_block, out_channels), dtype=np.float32)
+        self.in_count = 0    # input frames consumed so far
+        self.out_count = 0   # output frames produced so far
+
+        # Work buffers for the largest possible block
+        max_out = max_block * self.up // self.down + 2
+        self.positions = np.arange(max_out, dtype=np.int64)
+        self.offsets = np.arange(self.taps, dtype=np.int64)
+        self.nm = np.empty(max_out, dtype=np.int64)
+        self.index = np.empty(max_out, dtype=np.int64)
+        self.phase = np.empty(max_out, dtype=np.int64)
+        self.gather = np.empty((max_out, self.taps), dtype=np.int64)
+        self.coefs = np.empty((max_out, self.taps), dtype=np.float32)
+        self.samples = np.empty((max_out, self.taps, out_channels), dtype=np.float32)
+        self.out = np.empty((max_out, out_channels), dtype=np.float32)
+
+    def _design_filter(self):
+        """Kaiser-windowed sinc low-pass, split into one filter per phase"""
+        length = self.taps * self.up
+        cutoff = 0.5 / max(self.up, self.down) * 0.9  # cycles per upsampled sample
+        t = np.arange(length) - (length - 1) / 2
+        h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(length, 8.0)
+        h *= self.up / h.sum()
+        # phases[p, k] multiplies input sample i - k for output phase p
+        return h.reshape(self.taps, self.up).T.astype(np.float32).copy()
+
+    def reset(self):
+        self.x[:] = 0
+        self.in_count = 0
+        self.out_count = 0
+
+    def process(self, block, sink):
+        """
+        Resample one capture block and pass the output to sink
+
+        Args:
+            block: Array of shape (frames, in_channels)
+            sink: Called with each output array of shape (frames, out_channels);
+                  the array is reused, so sink must copy what it keeps
+
+        Returns:
+            Number of output frames produced
+        """
+        if self.passthrough:
+            sink(block)
+            return len(block)
+        produced = 0
+        for start in range(0, len(block), self.max_block):
+            produced += self._process_block(block[start:start + self.max_block], sink)
+        return produced
+
+    def _process_block(self, block, sink):
+        frames = len(block)
+        h = self.history
+        new = self.x[h:h + frames]
+        if self.out_channels == 1 and self.in_channels > 1:
+            np.mean(block, axis=1, out=new[:, 0])
+        else:
+            new[:] = block
+
+        # Outputs whose newest input sample is now available
+        in_end = self.in_count + frames
+        out_end = (in_end * self.up + self.down - 1) // self.down
+        count = out_end - self.out_count
+        if count > 0:
+            nm = self.nm[:count]
+            np.add(self.positions[:count], self.out_count, out=nm)
+            np.multiply(nm, self.down, out=nm)
+            index = self.index[:count]
+            phase = self.phase[:count]
+            np.floor_divide(nm, self.up, out=index)
+            np.remainder(nm, self.up, out=phase)
+            # Position of each output's newest input sample within self.x
+            np.subtract(index, self.in_count - h, out=index)
+
+            gather = self.gather[:count]
+            np.subtract(index[:, None], self.offsets, out=gather)
+            samples = self.samples[:count]
+            coefs = self.coefs[:count]
+            np.take(self.x, gather, axis=0, out=samples)
+            np.take(self.phases, phase, axis=0, out=coefs)
+            np.multiply(samples, coefs[:, :, None], out=samples)
+            out = self.out[:count]
+            np.sum(samples, axis=1, out=out)
+            sink(out)
+            self.out_count = out_end
+
+        # Keep the last taps-1 inputs as history for the next block
+        if h:
+            self.x[:h] = self.x[frames:frames + h]
+        self.in_count = in_end
+        return max(count, 0)
+
+def device_format(device=None, max_channels=2):
+    """
+    Native (samplerate, channels) of an input device
+
+    Virtual devices (e.g. PulseAudio's "default") report dozens of input
+    channels, most of them silent, which would dilute a downmix, so the
+    channel count is capped at max_channels (None for no cap).
+    """
+    import sounddevice as sd
+    info = sd.query_devices(device, 'input')
+    channels = int(info['max_input_channels'])
+    if max_channels:
+        channels = min(channels, max_channels)
+    return int(info['default_samplerate']), max(channels, 1)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Raw audio archive of a live session, and its high-accuracy re-decode.
+
+While a session runs, the 16 kHz audio it transcribes is also written to
+FLAC segments of about segment_seconds each. Segments are cut at the
+quietest moment near the target length, so words are rarely split. Each
+finished segment is recorded in index.jsonl with its position in the
+stream and the prompt (source language, target languages, pnc) it was
+decoded with live, so an archive left behind by a crash is still usable.
+A prompt change mid-session cuts the segment where the new prompt starts.
+
+Once the session is over, redecode() runs the segments through the batch
+path with a larger beam, each segment with its own prompt. It then atomically replaces the session's
+transcript files with the result. By hand:
+
+    python session_archive.py <paths.output_dir>/realtime_<session_id>.audio --beam-size 4
+"""
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+
+import numpy as np
+
+from transcript_journal import TranscriptJournal, assemble
+
+INDEX_FILE = "index.jsonl"
+
+class AudioArchive:
+    def __init__(self, directory, samplerate=16000, channels=1, segment_seconds=20, search_seconds=3,
+                 metadata=None, prompt=None):
+        """
+        Initialize AudioArchive
+
+        Args:
+            directory: Where the segments and index.jsonl go
+            samplerate: Sampling rate of the audio written
+            channels: Channels per frame
+            segment_seconds: Target segment length
+            search_seconds: How far back from the target length to look for a quiet cut point
+            metadata: Session details stored at the top of the index
+            prompt: Dict with source_lang, target_langs and pnc the audio is decoded with
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.samplerate = samplerate
+        self.channels = channels
+        self.segment_frames = int(samplerate * segment_seconds)
+        self.search_frames = min(int(samplerate * search_seconds), self.segment_frames // 2)
+        self.frame = int(samplerate * 0.03)
+        self.buffer = np.zeros((self.segment_frames, channels), dtype=np.float32)
+        self.filled = 0
+        self.start_frame = 0
+        self.segments = 0
+        self.prompt = dict(prompt or {})
+        self.closed = False
+
+        self.index = open(os.path.join(directory, INDEX_FILE), 'a')
+        self.index.write(json.dumps({"metadata": {**(metadata or {}), "samplerate": samplerate,
+                                                  "channels": channels}}) + '\n')
+        self.index.flush()
+
+    def write(self, frames):
+        """Add frames of shape (n, channels) to the archive"""
+        while len(frames):
+            take = min(len(frames), self.segment_frames - self.filled)
+            self.buffer[self.filled:self.filled + take] = frames[:take]
+            self.filled += take
+            frames = frames[take:]
+            if self.filled == self.segment_frames:
+                self._cut(self._quiet_point())
+
+    def set_prompt(self, prompt, frame=None):
+        """
+        Record a new prompt for the audio from stream frame `frame` on (default: from now)
+
+        The open segment is cut there, so every segment has a single prompt.
+        """
+        if prompt == self.prompt:
+            return
+        cut = self.filled if frame is None else min(max(frame - self.start_frame, 0), self.filled)
+        self._cut(cut)
+        self.prompt = dict(prompt)
+
+    def _quiet_point(self):
+        """Frame index in the last search_frames of the buffer with the least energy"""
+        start = self.segment_frames - self.search_frames
+        usable = self.search_frames // self.frame * self.frame
+        if usable == 0:
+            return self.segment_frames
+        window = self.buffer[start:start + usable].mean(axis=1).reshape(-1, self.frame)
+        energy = np.mean(window * window, axis=1)
+        return start + int(np.argmin(energy)) * self.frame + self.frame // 2
+
+    def _cut(self, length):
+        """Write the first length frames as a segment and keep the rest"""
+        import soundfile as sf
+        if length == 0:
+            return
+        name = f"{self.segments:05d}.flac"
+        sf.write(os.path.join(self.directory, name), self.buffer[:length], self.samplerate,
+                 format="FLAC", subtype="PCM_16")
+        start = self.start_frame / self.samplerate
+        self.index.write(json.dumps({"file": name, "start": round(start, 3),
+                                     "end": round(start + length / self.samplerate, 3),
+                                     **self.prompt}) + '\n')
+        self.index.flush()
+
+        rest = self.filled - length
+        self.buffer[:rest] = self.buffer[length:self.filled]
+        self.filled = rest
+        self.start_frame += length
+        self.segments += 1
+
+    def close(self):
+        """Write the last partial segment and close the index"""
+        if not self.closed:
+            self._cut(self.filled)
+            self.index.close()
+            self.closed = True
+
+def read_index(directory):
+    """(metadata, segments) of an archive"""
+    metadata = {}
+    segments = []
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "metadata" in entry:
+                metadata = entry["metadata"]
+            else:
+                segments.append(entry)
+    return metadata, segments
+
+def redecode(directory, transcripts, source_lang="en", pnc="yes", beam_size=4, batch_size=8,
+             use_daemon=True, workers=None, devices=None, backend=None):
+    """
+    Re-decode an archive and replace the transcripts made from it
+
+    Args:
+        directory: Archive directory
+        transcripts: Dict of target language -> transcript path without extension
+        source_lang: Language spoken in segments archived without a prompt
+        pnc: Include punctuation and capitalization (yes/no) for those segments
+        beam_size: Beam size for the re-decode
+        batch_size: Segments per batch
+        use_daemon, workers, devices: Passed on to the batch path
+        backend: Loaded backend to decode on (e.g. the live session's model) instead
+            of opening one; its beam size is set back afterwards
+
+    The model (or daemon connection) is opened once and decodes every
+    language; with workers or devices each language is sharded over them.
+    A language's transcript is made from the segments decoded into it live,
+    each with the source language and pnc it was decoded with.
+
+    Returns:
+        Dict of target language -> replaced .txt path
+    """
+    from batch_process import transcribe_files, open_backend, transcribe_with_backend
+    from canary_model import taskname_for
+
+    metadata, segments = read_index(directory)
+    if not segments:
+        return {}
+    audio_files = [os.path.join(directory, segment["file"]) for segment in segments]
+
+    borrowed_beam = None
+    if backend is not None:
+        borrowed_beam = getattr(backend, "beam_size", 1)
+        backend.set_decoding(beam_size)
+    elif not (workers or devices):
+        backend = open_backend(beam_size, use_daemon)
+    replaced = {}
+    try:
+        for target_lang, basename in transcripts.items():
+            # Segments decoded into this language, by the prompt they were decoded with
+            runs = {}
+            for i, segment in enumerate(segments):
+                if target_lang in segment.get("target_langs", [target_lang]):
+                    prompt = (segment.get("source_lang", source_lang), segment.get("pnc", pnc))
+                    runs.setdefault(prompt, []).append(i)
+            if not runs:
+                continue
+
+            results = {}
+            for (segment_source, segment_pnc), indices in runs.items():
+                files = [audio_files[i] for i in indices]
+                taskname = taskname_for(segment_source, target_lang)
+                if backend is None:
+                    texts = transcribe_files(files, taskname, segment_source, target_lang, segment_pnc,
+                                             batch_size, beam_size, workers=workers, devices=devices)
+                else:
+                    texts = transcribe_with_backend(backend, files, taskname, segment_source, target_lang,
+                                                    segment_pnc, batch_size)
+                results.update(zip(indices, texts))
+
+            # Keep the live session's metadata and record how the text was made
+            session_metadata = metadata
+            if os.path.exists(basename + ".json"):
+                with open(basename + ".json") as f:
+                    session_metadata = json.load(f).get("metadata", metadata)
+
+            journal = TranscriptJournal(basename + ".redecode", metadata={
+                **session_metadata, 'redecoded': True, 'redecode_beam_size': beam_size})
+            for i in sorted(results):
+                segment = segments[i]
+                if results[i]:
+                    journal.append(results[i], segment["start"], segment["end"], file=segment["file"])
+            journal.close()
+
+            # Assemble next to the live transcript, then swap it in
+            assemble(journal.path, basename)
+            os.remove(journal.path)
+            replaced[target_lang] = basename + ".txt"
+    finally:
+        if borrowed_beam is not None:
+            backend.set_decoding(borrowed_beam)
+    return replaced
+
+class RedecodeQueue:
+    """
+    Runs re-decode jobs one at a time on a background thread
+
+    A job waits until is_idle() returns True (e.g. no live session is
+    running), so re-decoding only uses capacity live work does not need.
+    """
+
+    def __init__(self, is_idle=None, on_done=None, poll_interval=5.0):
+        self.is_idle = is_idle or (lambda: True)
+        self.on_done = on_done
+        self.poll_interval = poll_interval
+        self.jobs = queue.Queue()
+        self.thread = None
+
+    def submit(self, directory, transcripts, **options):
+        """Queue an archive for re-decoding; options are passed to redecode()"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.jobs.put((directory, transcripts, options))
+
+    def _run(self):
+        while True:
+            directory, transcripts, options = self.jobs.get()
+            while not self.is_idle():
+                time.sleep(self.poll_interval)
+            try:
+                replaced = redecode(directory, transcripts, **options)
+                if self.on_done:
+                    self.on_done(directory, replaced)
+            except Exception as e:
+                print(f"Error re-decoding {directory}: {str(e)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-decode the audio archive of a live session")
+    parser.add_argument("archive", type=str, help="Archive directory (<session>.audio)")
+    parser.add_argument("--transcript", type=str, action="append", default=[],
+                        help="LANG=BASENAME of a transcript to replace (repeatable; default: from the index)")
+    parser.add_argument("--beam-size", type=int, default=4, help="Beam size for decoding")
+    parser.add_argument("--batch-size", type=int, default=8, help="Segments per batch")
+    parser.add_argument("--no-daemon", action="store_true", help="Load the model in this process")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.archive, INDEX_FILE)):
+        parser.error(f"Not an archive: {args.archive}")
+
+    metadata, _ = read_index(args.archive)
+    transcripts = dict(item.split("=", 1) for item in args.transcript) or metadata.get("transcripts", {})
+    if not transcripts:
+        parser.error("No transcripts recorded in the index; pass --transcript LANG=BASENAME")
+
+    replaced = redecode(args.archive, transcripts, source_lang=metadata.get("source_lang", "en"),
+                        pnc=metadata.get("pnc", "yes"), beam_size=args.beam_size,
+                        batch_size=args.batch_size, use_daemon=not args.no_daemon)
+    for path in replaced.values():
+        print(f"Transcript replaced: {path}")
+
+if __name__ == "__main__":
+    main()
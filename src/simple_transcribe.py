@@ -2,9 +2,11 @@
 
 import os
 import argparse
-from nemo.collections.asr.models import EncDecMultiTaskModel
+from backends import load_backend
+from canary_model import model_name_for
+from canary_daemon import request_transcription, DaemonUnavailable
 
-def transcribe_audio(audio_path, source_lang="en", target_lang="en", task="asr"):
+def transcribe_audio(audio_path, source_lang="en", target_lang="en", task="asr", use_daemon=True):
     """Transcribe audio file using Canary model"""
     
     # Check if file exists
@@ -12,49 +14,39 @@ def transcribe_audio(audio_path, source_lang="en", target_lang="en", task="asr")
         print(f"Error: File not found - {audio_path}")
         return
     
-    # Load model
-    print(f"Loading Canary-1B model...")
-    model = EncDecMultiTaskModel.from_pretrained('nvidia/canary-1b')
+    # Use the warm model of a running daemon when there is one
+    if use_daemon:
+        try:
+            result = request_transcription(
+                [audio_path],
+                taskname="s2t_translation" if task == "translation" else "asr",
+                source_lang=source_lang,
+                target_lang=target_lang,
+                pnc="yes"
+            )
+            print("\nTranslation result:" if task == "translation" else "\nTranscription result:")
+            print(result[0])
+            return result[0]
+        except DaemonUnavailable:
+            pass
     
-    # Update decode params
-    decode_cfg = model.cfg.decoding
-    decode_cfg.beam.beam_size = 1
-    model.change_decoding_strategy(decode_cfg)
+    # Load model
+    print(f"Loading {model_name_for('batch')}...")
+    backend = load_backend(role="batch", beam_size=1)
     
     if task == "asr" and source_lang == target_lang:
         # Simple transcription
         print(f"\nTranscribing audio in {source_lang}...")
-        result = model.transcribe(audio=[audio_path], batch_size=1)
+        result = backend.transcribe([audio_path], "asr", source_lang, target_lang, "yes")
         print("\nTranscription result:")
         print(result[0])
         return result[0]
     else:
-        # Create manifest file for translation
         print(f"\nTranslating from {source_lang} to {target_lang}...")
-        manifest_path = "/workspace/temp_manifest.json"
-        
-        import json
-        with open(manifest_path, 'w') as f:
-            entry = {
-                "audio_filepath": os.path.abspath(audio_path),
-                "duration": 1000,  # placeholder
-                "taskname": "s2t_translation" if task == "translation" else "asr",
-                "source_lang": source_lang,
-                "target_lang": target_lang,
-                "pnc": "yes",
-                "answer": "na"
-            }
-            f.write(json.dumps(entry))
-        
-        # Transcribe with manifest
-        result = model.transcribe(manifest_path, batch_size=1)
+        result = backend.transcribe([audio_path], "s2t_translation" if task == "translation" else "asr",
+                                    source_lang, target_lang, "yes")
         print("\nTranslation result:")
         print(result[0])
-        
-        # Clean up
-        if os.path.exists(manifest_path):
-            os.remove(manifest_path)
-            
         return result[0]
 
 def main():
@@ -66,10 +58,13 @@ def main():
                         help="Source language")
     parser.add_argument("--target-lang", choices=["en", "de", "es", "fr"], default="en",
                         help="Target language")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Always load the model in-process, even if the daemon is running")
     
     args = parser.parse_args()
     
-    transcribe_audio(args.audio, args.source_lang, args.target_lang, args.task)
+    transcribe_audio(args.audio, args.source_lang, args.target_lang, args.task,
+                     use_daemon=not args.no_daemon)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Speculative greedy decoding for Canary.
+
+A small draft model that shares Canary's tokenizer (e.g. a smaller Canary
+checkpoint) proposes the next draft_tokens tokens one at a time, and the
+large decoder scores the whole proposal in a single pass. The longest
+prefix of the proposal that matches the large decoder's own argmax is
+kept, followed by the large decoder's token at the first mismatch. Every
+kept token is the large decoder's greedy choice given the tokens before
+it, so the output is that of plain greedy decoding; a pass in which n
+draft tokens are accepted emits n + 1 tokens for one large-decoder call.
+
+Both decoders keep their per-layer states, so each pass only runs the new
+positions. The draft decoder attends to the draft model's own encoder
+output: enable() wraps the model's forward so every batch is also encoded
+by the draft, and replaces the greedy generator of the model's decoding.
+
+set_decoding() in canary_model turns this on for beam size 1 when
+decoding.draft_model is set in the config.
+"""
+
+DRAFT_TOKENS = 4
+
+class DraftEncoder:
+    """Wrapper of a model's forward that also runs the draft model's encoder on the same audio"""
+
+    def __init__(self, forward, draft, draft_name):
+        self.forward = forward
+        self.draft = draft
+        self.draft_name = draft_name
+        # Off while the model decodes without the draft (e.g. beam search)
+        self.active = True
+        # (encoder states, encoder mask) of the draft for the last batch
+        self.encoded = None
+
+    def __call__(self, *args, **kwargs):
+        outputs = self.forward(*args, **kwargs)
+        self.encoded = None
+        signal = kwargs.get("input_signal")
+        if self.active and signal is not None:
+            _, _, states, mask = self.draft.forward(input_signal=signal,
+                                                    input_signal_length=kwargs.get("input_signal_length"))
+            self.encoded = (states, mask)
+        return outputs
+
+class _DecoderStack:
+    """Embedding, transformer decoder and output layer of a Canary model, run with cached states"""
+
+    def __init__(self, model):
+        self.embedding = model.transf_decoder.embedding
+        self.decoder = model.transf_decoder.decoder
+        self.log_softmax = model.log_softmax
+
+    def extend(self, ids, mems, encoder_states, encoder_attn_mask, key_mask=None):
+        """
+        Run new positions through the decoder
+
+        Like TransformerDecoder.forward(..., return_mems=True), except that
+        several new positions can follow the cached ones: each attends to the
+        cached positions and to the new ones before it.
+
+        Args:
+            ids: New tokens, (batch, n)
+            mems: Per-layer states of the cached positions, or None
+            key_mask: Valid positions among cached + new (default: all)
+
+        Returns:
+            (log-probabilities after each new position, (batch, n, vocab), updated mems)
+        """
+        import torch
+        from nemo.collections.common.parts import form_attention_mask
+
+        cached = mems[0].shape[1] if mems else 0
+        if key_mask is None:
+            key_mask = torch.ones(ids.shape[0], cached + ids.shape[1], dtype=torch.long, device=ids.device)
+        # Causal mask over cached + new positions, rows of the new positions only
+        attn_mask = form_attention_mask(key_mask, diagonal=self.decoder.diagonal)[:, :, cached:, :]
+
+        def memory(states, i):
+            return torch.cat((mems[i], states), dim=1) if mems else states
+
+        states = self.embedding(ids, start_pos=cached)
+        new_mems = [memory(states, 0)]
+        for i, layer in enumerate(self.decoder.layers):
+            states = layer(states, attn_mask, new_mems[-1], encoder_states, encoder_attn_mask)
+            new_mems.append(memory(states, i + 1))
+        if self.decoder.final_layer_norm is not None:
+            states = self.decoder.final_layer_norm(states)
+            new_mems.append(memory(states, len(new_mems)))
+        return self.log_softmax(hidden_states=states), new_mems
+
+def _truncate(mems, length):
+    return [m[:, :length] for m in mems]
+
+def accepted_tokens(choices, draft, finished):
+    """
+    Draft tokens to keep after one verification pass
+
+    Args:
+        choices: Per row, the large decoder's argmax after each draft position
+        draft: Per row, the proposed tokens
+        finished: Per row, True once it produced <eos> (its tokens do not matter)
+
+    Returns:
+        Length of the longest prefix of the proposal that matches the large
+        decoder's choices in every unfinished row
+    """
+    accepted = len(draft[0]) if draft else 0
+    for row_choices, row_draft, done in zip(choices, draft, finished):
+        if done:
+            continue
+        matched = 0
+        while matched < accepted and row_choices[matched] == row_draft[matched]:
+            matched += 1
+        accepted = matched
+    return accepted
+
+class SpeculativeGreedy:
+    """
+    Drop-in for the greedy generator of a Canary model's decoding
+    (model.decoding.decoding.greedy_search); see enable()
+
+    Falls back to the wrapped generator for batches the draft did not
+    encode, for sampling, and while enabled is False. stats counts the
+    generated tokens and decoder passes of every call.
+    """
+
+    def __init__(self, greedy, model, draft, draft_encoder, draft_tokens=DRAFT_TOKENS):
+        self.greedy = greedy
+        self.target = _DecoderStack(model)
+        self.draft = _DecoderStack(draft)
+        self.draft_encoder = draft_encoder
+        self.draft_tokens = max(1, int(draft_tokens))
+        self.enabled = True
+        self.stats = {"tokens": 0, "target_passes": 0, "draft_steps": 0, "accepted": 0}
+
+    def _result(self, tgt):
+        # Newer NeMo generators also return per-step confidences
+        if hasattr(self.greedy, "preserve_step_confidence"):
+            return tgt, None, None
+        return tgt, None
+
+    def _count(self, tgt, prompt_length):
+        generated = tgt[:, prompt_length:]
+        self.stats["tokens"] += int((generated != self.greedy.pad).sum())
+
+    def __call__(self, encoder_hidden_states=None, encoder_input_mask=None, decoder_input_ids=None, **kwargs):
+        encoded = self.draft_encoder.encoded
+        if (not self.enabled or encoded is None or encoder_hidden_states is None
+                or encoded[0].shape[0] != encoder_hidden_states.shape[0]
+                or getattr(self.greedy, "temperature", None) is not None):
+            output = self.greedy(encoder_hidden_states=encoder_hidden_states,
+                                 encoder_input_mask=encoder_input_mask,
+                                 decoder_input_ids=decoder_input_ids, **kwargs)
+            prompt_length = decoder_input_ids.shape[1] if decoder_input_ids is not None else 1
+            self._count(output[0] if isinstance(output, tuple) else output, prompt_length)
+            return output
+
+        import torch
+        with torch.inference_mode():
+            tgt, prompt_length = self._generate(encoder_hidden_states, encoder_input_mask,
+                                                decoder_input_ids, *encoded)
+        self._count(tgt, prompt_length)
+        return self._result(tgt)
+
+    def _generate(self, encoder_states, encoder_mask, decoder_input_ids, draft_states, draft_mask):
+        import torch
+        from nemo.collections.common.parts import form_attention_mask
+
+        greedy = self.greedy
+        tgt, batch_size, max_generation_length = greedy._prepare_for_search(decoder_input_ids, encoder_states)
+        prompt_length = tgt.shape[1]
+        encoder_attn_mask = form_attention_mask(encoder_mask)
+        draft_attn_mask = form_attention_mask(draft_mask)
+
+        # The prompt through both decoders; the large one gives the first token
+        prompt_mask = (tgt != greedy.pad).long()
+        log_probs, target_mems = self.target.extend(tgt, None, encoder_states, encoder_attn_mask, prompt_mask)
+        _, draft_mems = self.draft.extend(tgt, None, draft_states, draft_attn_mask, prompt_mask)
+        self.stats["target_passes"] += 1
+        self.stats["draft_steps"] += 1
+        pad_profile = torch.zeros(batch_size, dtype=torch.long, device=tgt.device)
+
+        def commit(tgt, tokens, pad_profile):
+            # Same end-of-sequence handling as greedy decoding: pad after <eos>
+            for token in tokens.unbind(1):
+                token = greedy.pad * pad_profile + token * (1 - pad_profile)
+                pad_profile = torch.max(pad_profile, (token == greedy.eos).long())
+                tgt = torch.cat((tgt, token.unsqueeze(1)), dim=-1)
+                if pad_profile.sum() == batch_size:
+                    break
+            return tgt, pad_profile
+
+        if max_generation_length < 1:
+            return tgt, prompt_length
+        tgt, pad_profile = commit(tgt, log_probs[:, -1:].argmax(dim=-1), pad_profile)
+        while pad_profile.sum() < batch_size and tgt.shape[1] - prompt_length < max_generation_length:
+            # All committed tokens but the last are in the large decoder's states
+            proposals = min(self.draft_tokens, max_generation_length - (tgt.shape[1] - prompt_length) - 1)
+            if proposals < 1:
+                log_probs, target_mems = self.target.extend(tgt[:, -1:], target_mems, encoder_states,
+                                                            encoder_attn_mask)
+                self.stats["target_passes"] += 1
+                tgt, pad_profile = commit(tgt, log_probs[:, -1:].argmax(dim=-1), pad_profile)
+                continue
+
+            # Draft: catch up on the committed tokens it has not seen, then propose
+            draft = []
+            pending = tgt[:, draft_mems[0].shape[1]:]
+            for _ in range(proposals):
+                draft_log_probs, draft_mems = self.draft.extend(pending, draft_mems, draft_states, draft_attn_mask)
+                pending = draft_log_probs[:, -1:].argmax(dim=-1)
+                draft.append(pending)
+                self.stats["draft_steps"] += 1
+            draft = torch.cat(draft, dim=1)
+
+            # Large decoder: the last committed token and the proposal in one pass
+            log_probs, target_mems = self.target.extend(torch.cat((tgt[:, -1:], draft), dim=1), target_mems,
+                                                        encoder_states, encoder_attn_mask)
+            self.stats["target_passes"] += 1
+            choices = log_probs.argmax(dim=-1)
+
+            # Accept the proposal up to the first mismatch in any unfinished sequence;
+            # up to there the large decoder chose the same tokens, so commit its choices
+            accepted = accepted_tokens(choices[:, :-1].tolist(), draft.tolist(), (pad_profile != 0).tolist())
+            self.stats["accepted"] += accepted
+            tgt, pad_profile = commit(tgt, choices[:, :accepted + 1], pad_profile)
+            committed = tgt.shape[1] - 1
+            target_mems = _truncate(target_mems, committed)
+            draft_mems = _truncate(draft_mems, min(committed, draft_mems[0].shape[1]))
+        return tgt, prompt_length
+
+def _check_tokenizers(model, draft):
+    """Draft tokens are only meaningful to the model if both use the same vocabulary"""
+    target_vocab = model.tokenizer.vocab_size
+    draft_vocab = draft.tokenizer.vocab_size
+    if target_vocab != draft_vocab:
+        raise ValueError(f"The draft model's vocabulary ({draft_vocab} tokens) differs from the model's "
+                         f"({target_vocab} tokens); speculative decoding needs a shared tokenizer")
+
+def enable(model, draft_model, draft_tokens=None):
+    """
+    Decode greedily with a draft model proposing tokens
+
+    Call after model.change_decoding_strategy() with the greedy strategy,
+    since that replaces the generator. The draft model is loaded once per
+    model and kept on it, also while disabled.
+
+    Args:
+        model: Loaded Canary model
+        draft_model: Checkpoint name or .nemo path of the draft model
+        draft_tokens: Tokens proposed per pass (default: decoding.draft_tokens, else 4)
+
+    Returns:
+        The SpeculativeGreedy generator now used by the model
+    """
+    import canary_config
+    from canary_model import load_model
+
+    if draft_tokens is None:
+        draft_tokens = canary_config.get("decoding", "draft_tokens", DRAFT_TOKENS)
+    draft_encoder = model.__dict__.get("forward")
+    if not isinstance(draft_encoder, DraftEncoder) or draft_encoder.draft_name != draft_model:
+        print(f"Loading draft model {draft_model} for speculative decoding...")
+        device = str(next(model.parameters()).device)
+        draft = load_model(beam_size=1, model_name=draft_model, device=device, draft_model="")
+        _check_tokenizers(model, draft)
+        forward = draft_encoder.forward if isinstance(draft_encoder, DraftEncoder) else model.forward
+        draft_encoder = DraftEncoder(forward, draft, draft_model)
+        model.forward = draft_encoder
+    draft_encoder.active = True
+
+    generator = model.decoding.decoding
+    greedy = generator.greedy_search
+    if isinstance(greedy, SpeculativeGreedy):
+        greedy = greedy.greedy
+    generator.greedy_search = SpeculativeGreedy(greedy, model, draft_encoder.draft, draft_encoder, draft_tokens)
+    return generator.greedy_search
+
+def disable(model):
+    """Stop encoding with the draft model (change_decoding_strategy() already replaced the generator)"""
+    draft_encoder = model.__dict__.get("forward")
+    if isinstance(draft_encoder, DraftEncoder):
+        draft_encoder.active = False
+        draft_encoder.encoded = None
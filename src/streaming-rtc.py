@@ -7,199 +7,674 @@ import argparse
 import time
 import datetime
 import threading
-import queue
 import numpy as np
 import sounddevice as sd
 import soundfile as sf
 import socket
-from nemo.collections.asr.models import EncDecMultiTaskModel
+import collections
+import canary_config
+from backends import load_backend
+from canary_model import model_name_for
+from canary_daemon import (RemoteModel, DaemonUnavailable, DaemonError, ping,
+                           request_admission, release_session)
+from capacity import CapacityModel
+from audio_ring import AudioRing
+from resample import StreamResampler, device_format
+from multichannel import SpeakerChannels
+from transcript_journal import TranscriptJournal
+from caption_broadcast import CaptionBroadcaster
+from session_archive import AudioArchive, RedecodeQueue
+from transcript_index import default_index
 from flask import Flask, render_template, Response, jsonify
-from flask_socketio import SocketIO
+from flask import request
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from pathlib import Path
 
 # Initialize Flask app
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Fraction of each chunk carried into the next one for context
+CHUNK_OVERLAP = 0.15
+
 # Global variables
-transcription_queue = queue.Queue()
-stop_event = threading.Event()
 current_session = None
+# Sessions fed with audio streamed by a Socket.IO client, by client sid
+client_sessions = {}
+# Start requests waiting for capacity, by client sid: (options, session_id, sid, deadline)
+pending_starts = {}
+# Measured capacity of this process, for sessions that load their own model
+capacity = CapacityModel()
+admissions = collections.deque(maxlen=50)
+# Backend given to every session instead of loading one (--stub-model)
+shared_backend = None
+# Interim backend given to every session with it (--stub-model with --stub-interim-rtf)
+shared_interim_backend = None
+# Seconds of new audio between interim hypotheses; 0 turns them off (--interim-interval)
+interim_interval = 0.5
+session_ids = collections.Counter()
+session_ids_lock = threading.Lock()
+
+TASKS = ("asr", "translation")
+LANGUAGES = ("en", "de", "es", "fr")
+# Formats a client may stream its own audio in
+CLIENT_CHANNELS = range(1, 65)
+CLIENT_SAMPLERATES = range(8000, 192001)
 
 class TranscriptionSession:
     def __init__(self, device=None, samplerate=16000, channels=1, 
                  source_lang="en", target_lang="en", task="asr", 
-                 pnc="yes", beam_size=1, buffer_size=2):
-        """Initialize a transcription session with Canary model"""
+                 pnc="yes", beam_size=1, buffer_size=2,
+                 capture_rate=None, capture_channels=None, per_channel=False, speakers=None,
+                 target_langs=None, archive_audio=False, redecode_beam_size=4, use_daemon=True,
+                 session_id=None, client_sid=None, backend=None, interim_backend=None,
+                 interim_interval=0.5):
+        """
+        Initialize a transcription session with Canary model
+
+        With per_channel, every input channel is a separate speaker: each gets
+        its own VAD and transcript, and their chunks share one model call.
+
+        With several target_langs, each chunk is encoded once and decoded once
+        per language; every language has its own transcript and Socket.IO room.
+
+        With archive_audio, the audio is also kept as FLAC segments, and once the
+        session ends the transcripts are re-decoded from them with
+        redecode_beam_size and replaced.
+
+        With use_daemon and an inference daemon running, chunks are sent to the
+        daemon at live priority instead of loading a model in this process.
+        A loaded backend (e.g. the stub) is used as given.
+
+        When a model is configured for the interim role (model.roles.interim),
+        every interim_interval seconds of new audio the open chunk is decoded
+        with it and shown as an interim caption, which the final decode of the
+        chunk replaces. Journals and transcripts only hold finals. Per-channel
+        sessions have no interim captions.
+
+        With client_sid, the audio is streamed by that Socket.IO client (see
+        feed()) at capture_rate/capture_channels instead of captured from a
+        device; the session's captions and events go to that client only.
+        """
+        if archive_audio and per_channel:
+            raise ValueError("Audio archiving is only supported for single-channel sessions")
         self.device = device
         self.samplerate = samplerate
         self.channels = channels
         self.source_lang = source_lang
-        self.target_lang = target_lang
+        self.target_langs = list(target_langs or [target_lang])
+        self.target_lang = target_lang = self.target_langs[0]
         self.task = task
         self.taskname = "asr" if task == "asr" else "s2t_translation"
         self.pnc = pnc
         self.beam_size = beam_size
         self.buffer_size = buffer_size
-        self.audio_queue = queue.Queue()
-        self.transcript_buffer = []
-        self.session_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.client_sid = client_sid
+        if client_sid:
+            capture_rate = capture_rate or samplerate
+            capture_channels = capture_channels or 1
+        # Capture at the device's native format and convert to samplerate/channels
+        if not (capture_rate and capture_channels):
+            native_rate, native_channels = device_format(device, max_channels=None if per_channel else 2)
+            capture_rate = capture_rate or native_rate
+            capture_channels = capture_channels or native_channels
+        self.capture_rate = capture_rate
+        self.capture_channels = capture_channels
+        # Per-channel mode keeps every channel, one speaker each
+        self.speaker_channels = None
+        if per_channel:
+            channels = self.channels = capture_channels
+            self.speaker_channels = SpeakerChannels(channels, speakers, samplerate)
+        self.resampler = StreamResampler(capture_rate, capture_channels, samplerate, channels)
+        # Room for several chunks so a slow inference never blocks the audio thread
+        self.ring = AudioRing(int(samplerate * max(buffer_size * 4, 10)), channels, samplerate)
+        self.session_id = session_id or new_session_id()
+        self.stop_event = threading.Event()
+        self.processing_thread = None
+        self.saved_filename = None
+        # Prompt/decoding changes from update_session, applied between chunks
+        self.update_lock = threading.Lock()
+        self.pending_update = {}
+        self.segment_tags = {}
+        # Client that started the session; it follows all of the session's languages
+        self.owner_sid = client_sid
+        # One emitter per session, shared by all viewers
+        self.broadcaster = CaptionBroadcaster(socketio)
         
         # Create necessary directories
-        self.transcript_dir = "/workspace/transcripts"
+        self.transcript_dir = canary_config.get("paths", "output_dir")
         self.temp_dir = "/workspace/temp_audio"
         os.makedirs(self.transcript_dir, exist_ok=True)
         os.makedirs(self.temp_dir, exist_ok=True)
         
-        # Load model
-        print(f"Loading Canary-1B model for {task} ({source_lang}->{target_lang})...")
-        self.model = EncDecMultiTaskModel.from_pretrained('nvidia/canary-1b')
+        # Segments go to an append-only journal per target language as they are produced
+        self.metadata = {
+            'session_id': self.session_id,
+            'task': task,
+            'source_lang': source_lang,
+            'target_lang': target_lang,
+            'pnc': pnc,
+            'beam_size': beam_size,
+            'buffer_size': buffer_size,
+            'speakers': self.speaker_channels.labels if per_channel else None
+        }
+        self.journals = {}
+        self.journal = self.journal_for(target_lang)
+        
+        # Raw audio for the high-accuracy re-decode after the session
+        self.archive = None
+        self.redecode_beam_size = redecode_beam_size
+        if archive_audio:
+            self.archive = AudioArchive(f"{self.transcript_dir}/realtime_{self.session_id}.audio",
+                                        samplerate, channels, metadata={
+                                            **self.metadata,
+                                            'transcripts': {lang: self.transcript_basename(lang)
+                                                            for lang in self.target_langs}
+                                        }, prompt=self.archive_prompt())
+        
+        # Share the daemon's model when one is running; otherwise load our own
+        self.remote = False
+        self.backend = backend
+        if self.backend is None and use_daemon:
+            try:
+                ping()
+                self.backend = RemoteModel(session=self.session_id, beam_size=beam_size)
+                self.remote = True
+                print("Sending chunks to the inference daemon")
+            except DaemonUnavailable:
+                pass
+        if self.backend is None:
+            print(f"Loading {model_name_for('final')} for {task} ({source_lang}->{target_lang})...")
+            self.backend = load_backend(role="final", beam_size=beam_size)
+            print("Model loaded successfully!")
         
-        # Update decode params
-        decode_cfg = self.model.cfg.decoding
-        decode_cfg.beam.beam_size = beam_size
-        self.model.change_decoding_strategy(decode_cfg)
-        print("Model loaded successfully!")
+        # Interim hypotheses come from the faster model, always decoded greedily
+        self.interim_backend = None
+        self.interim_interval = interim_interval
+        # Interim caption shown per room, replaced by the chunk's final
+        self.interim_captions = {}
+        if interim_interval > 0 and not per_channel:
+            if interim_backend is not None:
+                self.interim_backend = interim_backend
+            elif self.remote:
+                interim = RemoteModel(session=self.session_id, role="interim").load()
+                if interim.model_name:
+                    self.interim_backend = interim
+            elif backend is None and model_name_for("interim"):
+                print(f"Loading {model_name_for('interim')} for interim captions...")
+                self.interim_backend = load_backend(role="interim", beam_size=1)
         
     def audio_callback(self, indata, frames, time, status):
         """Callback for sounddevice to capture audio"""
         if status:
-            print(status, file=sys.stderr)
-        # Add the audio data to the queue
-        self.audio_queue.put(indata.copy())
+            self.ring.record_status(status)
+        # Resample to the model format straight into the ring; no locks or
+        # allocations in the audio thread
+        self.resampler.process(indata, self.ring.write)
+    
+    def feed(self, block):
+        """Add audio streamed by the client: float32 frames of shape (n, capture_channels)"""
+        self.resampler.process(block, self.ring.write)
+    
+    def emit(self, event, data):
+        """Send a session event to its client, or to everyone for the device session"""
+        socketio.emit(event, data, to=self.client_sid)
+    
+    def room(self, target_lang):
+        """Caption room of one language; client sessions get rooms of their own"""
+        room = language_room(target_lang)
+        return f"{room}:{self.session_id}" if self.client_sid else room
     
-    def create_manifest(self, audio_file):
-        """Create a manifest file for the audio file"""
-        manifest_path = f"{self.temp_dir}/manifest_{self.session_id}_{int(time.time())}.json"
+    def journal_for(self, target_lang):
+        """Journal of one target language, opened on first use"""
+        if target_lang not in self.journals:
+            self.journals[target_lang] = TranscriptJournal(
+                self.transcript_basename(target_lang), metadata={**self.metadata, 'target_lang': target_lang})
+        return self.journals[target_lang]
+    
+    def follow_languages(self, old_rooms=()):
+        """Put the owning client in the rooms of the current languages, and take it out of old ones"""
+        if not self.owner_sid:
+            return
+        rooms = {self.room(lang) for lang in self.target_langs}
+        for room in set(old_rooms) - rooms:
+            socketio.server.leave_room(self.owner_sid, room, namespace='/')
+        for room in rooms:
+            socketio.server.enter_room(self.owner_sid, room, namespace='/')
+    
+    def update(self, **changes):
+        """
+        Change the decode prompt or decoding config of the running session
+
+        The changes are queued and picked up by the processing thread before
+        the next chunk, so capture keeps running and the model stays loaded.
+        """
+        with self.update_lock:
+            self.pending_update.update(changes)
+    
+    def archive_prompt(self):
+        """Prompt recorded with the archived audio, so the re-decode uses the same one"""
+        return {'source_lang': self.source_lang, 'target_langs': list(self.target_langs), 'pnc': self.pnc}
+    
+    def apply_update(self, frame=None):
+        """
+        Apply queued changes (processing thread only)
+
+        Args:
+            frame: Stream frame the new prompt applies from, for the audio archive
+        """
+        with self.update_lock:
+            changes, self.pending_update = self.pending_update, {}
+        if not changes:
+            return
+        
+        for key in ('task', 'source_lang', 'pnc'):
+            if key in changes:
+                setattr(self, key, changes[key])
+        if 'target_langs' in changes:
+            old_rooms = {self.room(lang) for lang in self.target_langs}
+            self.target_langs = list(changes['target_langs'])
+            self.target_lang = self.target_langs[0]
+            self.follow_languages(old_rooms)
+        self.taskname = "asr" if self.task == "asr" else "s2t_translation"
+        if changes.get('beam_size', self.beam_size) != self.beam_size:
+            self.beam_size = changes['beam_size']
+            self.backend.set_decoding(self.beam_size)
+        if self.archive:
+            self.archive.set_prompt(self.archive_prompt(), frame)
         
-        entry = {
-            "audio_filepath": os.path.abspath(audio_file),
-            "duration": self.buffer_size,
-            "taskname": self.taskname,
-            "source_lang": self.source_lang,
-            "target_lang": self.target_lang,
-            "pnc": self.pnc,
-            "answer": "na"
+        # Segments from now on record the prompt they were decoded with
+        self.segment_tags = {
+            'task': self.task,
+            'source_lang': self.source_lang,
+            'target_lang': self.target_lang,
+            'pnc': self.pnc,
+            'beam_size': self.beam_size
         }
+        self.emit('session_updated', {'session_id': self.session_id,
+                                          'target_langs': self.target_langs, **self.segment_tags})
+    
+    def transcribe_chunk(self, buffer, chunk_index, backend=None):
+        """
+        Transcribe one chunk buffer (with the session's backend unless another is given)
+
+        Returns:
+            List of (text, extra journal fields); in per-channel mode there is one
+            entry per speaker with speech, all from a single batched model call
+        """
+        backend = backend or self.backend
+        if len(self.target_langs) > 1:
+            return self.transcribe_targets(buffer, backend)
         
-        with open(manifest_path, 'w') as f:
-            f.write(json.dumps(entry))
-            
-        return manifest_path
+        if self.speaker_channels:
+            segments = self.speaker_channels.transcribe(backend, buffer, self.taskname,
+                                                        self.source_lang, self.target_lang, self.pnc)
+            return [(text, {'speaker': speaker, 'channel': channel})
+                    for channel, speaker, text in segments]
+        
+        if backend.capabilities["in_memory_audio"]:
+            result = backend.transcribe([np.ascontiguousarray(buffer[:, 0])], self.taskname,
+                                        self.source_lang, self.target_lang, self.pnc)
+        else:
+            # Save audio to temporary file for backends that only read files
+            audio_file = f"{self.temp_dir}/chunk_{self.session_id}_{chunk_index}.wav"
+            sf.write(audio_file, buffer, self.samplerate)
+            try:
+                result = backend.transcribe([audio_file], self.taskname, self.source_lang,
+                                            self.target_lang, self.pnc)
+            finally:
+                # Clean up temporary files
+                try:
+                    os.remove(audio_file)
+                except:
+                    pass
+        
+        text = result[0] if result and len(result) > 0 else None
+        return [(text, {})] if text else []
+    
+    def transcribe_targets(self, buffer, backend=None):
+        """Encode the chunk (or its voiced channels) once and decode it into every target language"""
+        backend = backend or self.backend
+        if self.speaker_channels:
+            active = self.speaker_channels.voiced(buffer)
+            sources = [{'speaker': self.speaker_channels.labels[c], 'channel': c} for c in active]
+        else:
+            active = [0]
+            sources = [{}]
+        chunks = [np.ascontiguousarray(buffer[:, c]) for c in active]
+        
+        results = backend.transcribe_targets(chunks, self.target_langs, self.source_lang, self.pnc)
+        segments = []
+        for target_lang in self.target_langs:
+            for text, extra in zip(results[target_lang], sources):
+                if text:
+                    segments.append((text, {**extra, 'target_lang': target_lang}))
+        return segments
+    
+    def show_interim(self, buffer, filled, chunk_index):
+        """Decode the open part of a chunk with the interim model and show it as interim captions"""
+        start_time = time.time()
+        try:
+            segments = self.transcribe_chunk(buffer[:filled], chunk_index, self.interim_backend)
+        except Exception as e:
+            print(f"Error making interim captions: {str(e)}")
+            return
+        if not self.remote:
+            capacity.record_interim(time.time() - start_time, session=self.session_id)
+        for text, extra in segments:
+            room = self.room(extra.get('target_lang', self.target_lang))
+            if room in self.interim_captions:
+                self.broadcaster.replace(room, self.interim_captions[room], text)
+            else:
+                self.interim_captions[room] = self.broadcaster.append(room, text)
+    
+    def show_final(self, room, text, speaker=None):
+        """Show a final caption, in place of the room's interim caption if there is one"""
+        if room in self.interim_captions:
+            self.broadcaster.replace(room, self.interim_captions.pop(room), text)
+        else:
+            self.broadcaster.append(room, text, speaker)
+    
+    def clear_interim(self):
+        """Remove interim captions that no final replaced"""
+        for room, index in self.interim_captions.items():
+            self.broadcaster.replace(room, index, "")
+        self.interim_captions = {}
     
     def process_audio_thread(self):
-        """Process audio chunks from the queue and transcribe"""
-        buffer = np.array([]).reshape(0, self.channels)
+        """Process audio chunks from the ring and transcribe"""
         buffer_samples = int(self.samplerate * self.buffer_size)
-        overlap_samples = int(buffer_samples * 0.15)  # 15% overlap for context
+        overlap_samples = int(buffer_samples * CHUNK_OVERLAP)  # overlap for context
+        interim_samples = int(self.samplerate * self.interim_interval)
+        buffer = np.zeros((buffer_samples, self.channels), dtype=np.float32)
+        filled = 0
+        interim_filled = 0
         chunk_index = 0
+        stream_frames = 0
         
-        while not stop_event.is_set():
+        while not self.stop_event.is_set():
             try:
-                # Get audio chunk from queue with timeout
-                chunk = self.audio_queue.get(timeout=0.1)
-                buffer = np.vstack((buffer, chunk))
+                # Fill the chunk buffer from the ring
+                frames = self.ring.read_into(buffer[filled:], timeout=0.1)
+                if self.archive and frames:
+                    self.archive.write(buffer[filled:filled + frames])
+                filled += frames
+                stream_frames += frames
+                
+                # Interim hypothesis of the open chunk, unless the final is already due
+                if (self.interim_backend and filled < buffer_samples
+                        and filled - interim_filled >= interim_samples
+                        and self.ring.available() < buffer_samples - filled):
+                    interim_filled = filled
+                    self.show_interim(buffer, filled, chunk_index)
                 
                 # Process when buffer is full
-                if len(buffer) >= buffer_samples:
-                    # Save audio to temporary file
-                    audio_file = f"{self.temp_dir}/chunk_{self.session_id}_{chunk_index}.wav"
-                    sf.write(audio_file, buffer, self.samplerate)
-                    
-                    # Create manifest for processing
-                    manifest_path = self.create_manifest(audio_file)
-                    
-                    # Process with manifest
+                if filled == buffer_samples:
+                    # The new audio of this chunk starts after the overlap kept from the last one
+                    self.apply_update(stream_frames - buffer_samples + (overlap_samples if chunk_index else 0))
                     start_time = time.time()
-                    result = self.model.transcribe(manifest_path, batch_size=1)
+                    segments = self.transcribe_chunk(buffer, chunk_index)
                     end_time = time.time()
+                    if not self.remote:
+                        # The daemon measures the chunks it runs; here we measure our own
+                        inputs = len(self.speaker_channels.active) if self.speaker_channels else 1
+                        capacity.record(self.buffer_size, self.beam_size, inputs * len(self.target_langs),
+                                        end_time - start_time, session=self.session_id,
+                                        hop_seconds=(buffer_samples - overlap_samples) / self.samplerate)
                     
-                    if result and len(result) > 0:
-                        # Add to transcript buffer
-                        self.transcript_buffer.append(result[0])
+                    chunk_end = stream_frames / self.samplerate
+                    for text, extra in segments:
+                        # Append to the journal with the chunk's position in the stream
+                        target_lang = extra.get('target_lang', self.target_lang)
+                        self.journal_for(target_lang).append(text, chunk_end - self.buffer_size, chunk_end,
+                                                             chunk_index=chunk_index,
+                                                             **{**self.segment_tags, **extra})
                         
-                        # Send to web UI
-                        processing_time = end_time - start_time
-                        transcription_data = {
-                            'text': result[0],
-                            'chunk_index': chunk_index,
-                            'processing_time': f"{processing_time:.2f}s",
-                            'source_lang': self.source_lang,
-                            'target_lang': self.target_lang,
-                            'task': self.task
-                        }
-                        transcription_queue.put(transcription_data)
+                        # Send to the web UI clients following this language
+                        self.show_final(self.room(target_lang), text, extra.get('speaker'))
+                    # Interim captions the final found no speech for
+                    self.clear_interim()
                     
-                    # Reset buffer with overlap for context
-                    buffer = buffer[-overlap_samples:] if overlap_samples > 0 else np.array([]).reshape(0, self.channels)
+                    self.broadcaster.set_status(
+                        chunk_index=chunk_index,
+                        stream_end=round(chunk_end, 3),
+                        processing_time=f"{end_time - start_time:.2f}s",
+                        source_lang=self.source_lang,
+                        task=self.task,
+                        audio_metrics=self.ring.metrics()
+                    )
                     
-                    # Clean up temporary files
-                    try:
-                        os.remove(audio_file)
-                        os.remove(manifest_path)
-                    except:
-                        pass
+                    # Keep the tail of the buffer as overlap for context
+                    if overlap_samples > 0:
+                        buffer[:overlap_samples] = buffer[buffer_samples - overlap_samples:]
+                    filled = interim_filled = overlap_samples
                     
                     chunk_index += 1
             
-            except queue.Empty:
-                continue
             except Exception as e:
                 print(f"Error processing audio: {str(e)}")
         
+        # The open chunk never got its final
+        self.clear_interim()
+        
         # Save final transcript
         self.save_transcript()
     
+    def transcript_basename(self, target_lang=None):
+        """Output path without extension, based on task"""
+        target_lang = target_lang or self.target_lang
+        if target_lang == self.source_lang:
+            return f"{self.transcript_dir}/realtime_{self.source_lang}_transcription_{self.session_id}"
+        return f"{self.transcript_dir}/realtime_{self.source_lang}_to_{target_lang}_{self.session_id}"
+    
     def save_transcript(self):
-        """Save complete transcript to file"""
-        if not self.transcript_buffer:
+        """Assemble the transcript files from the journals (once per session)"""
+        if all(journal.closed for journal in self.journals.values()):
+            return self.saved_filename
+        
+        files = {}
+        for target_lang, journal in self.journals.items():
+            filename = journal.finish()
+            if filename:
+                files[target_lang] = filename
+                print(f"Transcript saved to {filename}")
+        if self.archive:
+            self.archive.close()
+        if not files:
             return
-            
-        # Create filename based on task
-        if self.task == "asr":
-            filename = f"{self.transcript_dir}/realtime_{self.source_lang}_transcription_{self.session_id}.txt"
-        else:
-            filename = f"{self.transcript_dir}/realtime_{self.source_lang}_to_{self.target_lang}_{self.session_id}.txt"
+        self.saved_filename = files.get(self.target_lang) or next(iter(files.values()))
         
-        # Write transcript to file
-        with open(filename, 'w') as f:
-            f.write("\n".join(self.transcript_buffer))
-            
-        print(f"Transcript saved to {filename}")
+        if self.archive:
+            redecoder.submit(self.archive.directory,
+                             {lang: self.journals[lang].basename for lang in files},
+                             source_lang=self.source_lang, pnc=self.pnc,
+                             beam_size=self.redecode_beam_size,
+                             backend=None if self.remote else self.backend)
         
         # Send to UI
-        socketio.emit('transcript_saved', {
-            'filename': filename,
-            'count': len(self.transcript_buffer),
-            'word_count': sum(len(line.split()) for line in self.transcript_buffer)
+        self.emit('transcript_saved', {
+            'filename': self.saved_filename,
+            'files': files,
+            'count': sum(journal.count for journal in self.journals.values()),
+            'word_count': sum(journal.word_count for journal in self.journals.values()),
+            'audio_metrics': self.ring.metrics(),
+            'redecode_pending': bool(self.archive)
         })
         
-        return filename
+        return self.saved_filename
     
     def start(self):
         """Start the transcription session"""
+        self.broadcaster.start()
+        
         # Create and start processing thread
-        processing_thread = threading.Thread(target=self.process_audio_thread)
-        processing_thread.daemon = True
-        processing_thread.start()
+        self.processing_thread = threading.Thread(target=self.process_audio_thread)
+        self.processing_thread.daemon = True
+        self.processing_thread.start()
         
-        # Start audio capture thread
-        self.stream = sd.InputStream(
-            device=self.device, 
-            channels=self.channels,
-            samplerate=self.samplerate, 
-            callback=self.audio_callback
-        )
-        self.stream.start()
+        # Start audio capture thread; a client session is fed by its client instead
+        if not self.client_sid:
+            self.stream = sd.InputStream(
+                device=self.device, 
+                channels=self.capture_channels,
+                samplerate=self.capture_rate, 
+                callback=self.audio_callback
+            )
+            self.stream.start()
         
-        return processing_thread
+        return self.processing_thread
     
-    def stop(self):
-        """Stop the transcription session"""
+    def stop(self, release=True):
+        """
+        Stop the transcription session; the processing thread saves the transcript
+
+        With release, the session's capacity is given back. A session replaced by
+        a newly admitted one is not released, as the admission already took it over.
+        """
+        self.stop_event.set()
         if hasattr(self, 'stream') and self.stream.active:
             self.stream.stop()
             self.stream.close()
-        self.save_transcript()
+        if self.processing_thread:
+            self.processing_thread.join()
+        self.broadcaster.stop()
+        if release:
+            release_admission(self.session_id)
+
+def on_redecoded(directory, files):
+    for path in files.values():
+        print(f"Transcript replaced with re-decode: {path}")
+    socketio.emit('transcript_redecoded', {'archive': directory, 'files': files})
+
+def running_sessions():
+    """Live sessions that have not been stopped"""
+    sessions = [current_session] + list(client_sessions.values())
+    return [session for session in sessions if session and not session.stop_event.is_set()]
+
+# Archived sessions are re-decoded while no live session is running
+redecoder = RedecodeQueue(is_idle=lambda: not running_sessions(), on_done=on_redecoded)
+
+def new_session_id():
+    """Timestamp id, with a suffix when several sessions start in the same second"""
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    with session_ids_lock:
+        session_ids[stamp] += 1
+        count = session_ids[stamp]
+    return stamp if count == 1 else f"{stamp}_{count}"
+
+def replaced_session(options):
+    """Session a new one with these options takes over: the client's own, or the device session"""
+    if options.get('client_sid'):
+        return client_sessions.get(options['client_sid'])
+    return current_session
+
+def admit_session(session_id, options, replaces=None):
+    """
+    Admission decision for a new session
+
+    Asked of the daemon when one is running, since its model is shared with
+    every other session and batch job; otherwise from this process's own
+    measurements. Cost is counted per stream: each input channel in
+    per-channel mode, for each target language, and per hop of new audio,
+    since overlapping chunks run more often than once per chunk length.
+    """
+    hop_seconds = options['buffer_size'] * (1 - CHUNK_OVERLAP)
+    streams = len(options['target_langs'])
+    if options['per_channel']:
+        streams *= options.get('capture_channels') or device_format(options['device'], max_channels=None)[1]
+    interim = interim_interval > 0 and not options['per_channel']
+    try:
+        decision = request_admission(session_id, options['buffer_size'], options['beam_size'],
+                                     streams, replaces, interim=interim, hop_seconds=hop_seconds)
+        decision['host'] = 'daemon'
+    except (DaemonUnavailable, DaemonError):
+        interim = interim and (shared_interim_backend is not None
+                               or (shared_backend is None and bool(model_name_for("interim"))))
+        decision = capacity.admit(session_id, options['buffer_size'], options['beam_size'],
+                                  streams, replaces, interim=interim, hop_seconds=hop_seconds)
+        decision['host'] = 'local'
+    admissions.append(decision)
+    return decision
+
+def release_admission(session_id):
+    """Give back the capacity taken by admit_session()"""
+    capacity.release(session_id)
+    try:
+        release_session(session_id)
+    except (DaemonUnavailable, DaemonError):
+        pass
+
+def start_session(options, session_id, sid):
+    """Start a new (admitted) session followed by client sid, replacing the one it takes over"""
+    global current_session
+    client_sid = options.get('client_sid')
+    
+    # Stop the session this one replaces
+    previous = replaced_session(options)
+    if previous:
+        previous.stop(release=False)
+        time.sleep(0.5)
+    
+    session = None
+    try:
+        session = TranscriptionSession(session_id=session_id, backend=shared_backend,
+                                       interim_backend=shared_interim_backend,
+                                       interim_interval=interim_interval, **options)
+        if client_sid:
+            client_sessions[client_sid] = session
+        else:
+            current_session = session
+        
+        # The client that started the session follows all of its languages, also as they change
+        session.owner_sid = sid
+        session.follow_languages()
+        session.start()
+    except Exception:
+        # However far it got, forget the session and give its admission back
+        if client_sid:
+            client_sessions.pop(client_sid, None)
+        else:
+            current_session = None
+        if session is not None:
+            session.stop(release=False)
+        release_admission(session_id)
+        raise
+    return session
+
+def wait_for_capacity(entry, poll_interval=2.0):
+    """Start a queued session once there is room for it, or give up at its deadline"""
+    options, session_id, sid, deadline = entry
+    while pending_starts.get(sid) is entry:
+        time.sleep(poll_interval)
+        if pending_starts.get(sid) is not entry:
+            break
+        previous = replaced_session(options)
+        decision = admit_session(session_id, options, replaces=previous.session_id if previous else None)
+        if pending_starts.get(sid) is not entry:
+            # Cancelled or replaced while we asked
+            if decision['admitted']:
+                release_admission(session_id)
+            break
+        if decision['admitted']:
+            pending_starts.pop(sid, None)
+            try:
+                start_session(options, session_id, sid)
+                socketio.emit('session_started', {'session_id': session_id, 'admission': decision}, to=sid)
+            except Exception as e:
+                socketio.emit('admission_rejected', {'message': str(e), 'admission': decision}, to=sid)
+        elif time.time() > deadline:
+            pending_starts.pop(sid, None)
+            socketio.emit('admission_rejected', {'message': decision['reason'], 'admission': decision}, to=sid)
+
+def language_room(target_lang):
+    """Socket.IO room of the viewers following one caption language"""
+    return f"lang:{target_lang}"
+
+def parse_languages(value):
+    """Target languages from a list or a comma-separated string"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [lang.strip() for lang in value or [] if lang and lang.strip()]
 
 # Define Socket.IO events
 @socketio.on('connect')
@@ -209,20 +684,53 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
+    # A client session has no audio once its client is gone
+    pending_starts.pop(request.sid, None)
+    session = client_sessions.pop(request.sid, None)
+    if session:
+        session.stop()
+
+def session_of_room(room):
+    """Running session whose captions go to room, or None"""
+    for session in running_sessions():
+        if any(session.room(lang) == room for lang in session.target_langs):
+            return session
+    return None
+
+@socketio.on('join_language')
+def handle_join_language(data):
+    """
+    Follow the captions of one target language, or rejoin a caption room
+    by name (a client rejoins its own session's rooms this way after a gap)
+    """
+    room = data.get('room')
+    if room:
+        session = session_of_room(room)
+        if session is None or (session.client_sid and session.owner_sid != request.sid):
+            return {'status': 'error', 'message': f'Unknown room: {room}'}
+    else:
+        target_lang = data.get('target_lang')
+        if target_lang not in LANGUAGES:
+            return {'status': 'error', 'message': f'Unknown language: {target_lang}'}
+        room = language_room(target_lang)
+        session = current_session
+    join_room(room)
+    # Catch the viewer up on recent captions
+    if session:
+        emit('captions', session.broadcaster.snapshot(room))
+    return {'status': 'joined', 'room': room}
+
+@socketio.on('leave_language')
+def handle_leave_language(data):
+    leave_room(language_room(data.get('target_lang')))
+    return {'status': 'left'}
     
 @socketio.on('start_transcription')
 def handle_start_transcription(data):
-    global current_session, stop_event
-    
-    # Stop any existing session
-    if current_session:
-        stop_event.set()
-        current_session.stop()
-        time.sleep(0.5)
-    
-    # Reset stop event
-    stop_event.clear()
-    
+    """
+    Start a session on the server's input device, or with source "client" a
+    session fed by this client through 'audio' events (at samplerate/channels)
+    """
     # Extract parameters
     device = data.get('device')
     if device == 'default':
@@ -230,49 +738,134 @@ def handle_start_transcription(data):
     else:
         device = int(device)
     
-    task = data.get('task', 'asr')
-    source_lang = data.get('source_lang', 'en')
     target_lang = data.get('target_lang', 'en')
-    pnc = data.get('pnc', 'yes')
-    buffer_size = float(data.get('buffer_size', 2.0))
-    beam_size = int(data.get('beam_size', 1))
-    
-    # Create and start new session
-    current_session = TranscriptionSession(
+    speakers = data.get('speakers') or None
+    if isinstance(speakers, str):
+        speakers = [name.strip() for name in speakers.split(',') if name.strip()]
+    options = dict(
         device=device,
-        source_lang=source_lang,
+        source_lang=data.get('source_lang', 'en'),
         target_lang=target_lang,
-        task=task,
-        pnc=pnc,
-        buffer_size=buffer_size,
-        beam_size=beam_size
+        task=data.get('task', 'asr'),
+        pnc=data.get('pnc', 'yes'),
+        buffer_size=float(data.get('buffer_size', 2.0)),
+        beam_size=int(data.get('beam_size', 1)),
+        per_channel=bool(data.get('per_channel', False)),
+        speakers=speakers,
+        target_langs=parse_languages(data.get('target_langs')) or [target_lang],
+        archive_audio=bool(data.get('archive_audio', False))
     )
+    if data.get('source') == 'client':
+        try:
+            capture_rate, capture_channels = int(data.get('samplerate', 16000)), int(data.get('channels', 1))
+        except (TypeError, ValueError):
+            capture_rate = capture_channels = 0
+        if capture_rate not in CLIENT_SAMPLERATES or capture_channels not in CLIENT_CHANNELS:
+            return {'status': 'error', 'message': 'Invalid samplerate or channels'}
+        options.update(client_sid=request.sid, capture_rate=capture_rate, capture_channels=capture_channels)
+    if any(lang not in LANGUAGES for lang in options['target_langs']):
+        return {'status': 'error', 'message': 'Unknown target language'}
+    if options['per_channel'] and options['archive_audio']:
+        return {'status': 'error', 'message': 'Audio archiving is only supported for single-channel sessions'}
     
-    current_session.start()
+    # Only start what the host can keep up with; the current session keeps running otherwise
+    pending_starts.pop(request.sid, None)
+    session_id = new_session_id()
+    previous = replaced_session(options)
+    decision = admit_session(session_id, options, replaces=previous.session_id if previous else None)
+    if not decision['admitted']:
+        if data.get('queue'):
+            # Retry as capacity frees up, for up to queue_timeout seconds
+            deadline = time.time() + float(data.get('queue_timeout', 120))
+            entry = pending_starts[request.sid] = (options, session_id, request.sid, deadline)
+            threading.Thread(target=wait_for_capacity, args=(entry,), daemon=True).start()
+            return {'status': 'queued', 'message': decision['reason'], 'admission': decision}
+        return {'status': 'rejected', 'message': decision['reason'], 'admission': decision}
     
-    # Start emitting transcriptions
-    def send_transcriptions():
-        while not stop_event.is_set():
-            try:
-                data = transcription_queue.get(timeout=0.5)
-                socketio.emit('transcription', data)
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"Error emitting transcription: {str(e)}")
+    # Create and start new session
+    try:
+        session = start_session(options, session_id, request.sid)
+    except Exception as e:
+        return {'status': 'error', 'message': str(e)}
+    
+    return {'status': 'started', 'session_id': session.session_id, 'admission': decision}
+    
+@socketio.on('update_session')
+def handle_update_session(data):
+    """Switch task, languages, pnc or beam size of the running session in place"""
+    session = client_sessions.get(request.sid) or current_session
+    if not session:
+        return {'status': 'no_session'}
+    
+    task = data.get('task', session.task)
+    source_lang = data.get('source_lang', session.source_lang)
+    target_lang = data.get('target_lang', session.target_lang)
+    pnc = data.get('pnc', session.pnc)
+    try:
+        beam_size = int(data.get('beam_size', session.beam_size))
+    except (TypeError, ValueError):
+        beam_size = 0
+    
+    target_langs = parse_languages(data.get('target_langs')) or [target_lang]
     
-    threading.Thread(target=send_transcriptions, daemon=True).start()
+    if task not in TASKS or source_lang not in LANGUAGES \
+            or any(lang not in LANGUAGES for lang in target_langs) \
+            or pnc not in ("yes", "no") or beam_size < 1:
+        return {'status': 'error', 'message': 'Invalid task, language, pnc or beam size'}
+    if task == "asr":
+        target_langs = [source_lang]
     
-    return {'status': 'started', 'session_id': current_session.session_id}
+    changes = dict(task=task, source_lang=source_lang, pnc=pnc, beam_size=beam_size)
+    # A multi-language session keeps its languages unless new ones are given
+    if 'target_langs' in data or 'target_lang' in data or task == "asr":
+        changes['target_langs'] = target_langs
+
+    # A bigger beam or more languages costs more; admit the session again in place
+    langs = changes.get('target_langs', session.target_langs)
+    decision = None
+    if beam_size != session.beam_size or len(langs) != len(session.target_langs):
+        options = dict(buffer_size=session.buffer_size, beam_size=beam_size, target_langs=langs,
+                       per_channel=session.speaker_channels is not None,
+                       capture_channels=session.capture_channels, device=None)
+        decision = admit_session(session.session_id, options, replaces=session.session_id)
+        if not decision['admitted']:
+            return {'status': 'rejected', 'message': decision['reason'], 'admission': decision}
+    session.update(**changes)
+    return {'status': 'updated', 'session_id': session.session_id, 'admission': decision}
     
 @socketio.on('stop_transcription')
 def handle_stop_transcription():
-    global current_session, stop_event
-    if current_session:
-        stop_event.set()
-        current_session.stop()
+    cancelled = pending_starts.pop(request.sid, None)
+    session = client_sessions.pop(request.sid, None)
+    # Cancelling a queued client session leaves the device session alone
+    if session is None and not (cancelled and cancelled[0].get('client_sid')):
+        session = current_session
+    if session:
+        session.stop()
         return {'status': 'stopped'}
-    return {'status': 'no_session'}
+    return {'status': 'cancelled' if cancelled else 'no_session'}
+
+@socketio.on('audio')
+def handle_audio(data):
+    """Audio for this client's session: interleaved little-endian float32 frames"""
+    session = client_sessions.get(request.sid)
+    if session is None or session.stop_event.is_set():
+        return
+    channels = session.capture_channels
+    # Whole frames only; a bad block is reported and dropped, the session keeps running
+    frame_bytes = 4 * channels
+    if not isinstance(data, (bytes, bytearray)):
+        problem = f"got {type(data).__name__}"
+    elif len(data) % frame_bytes:
+        problem = f"got {len(data)} bytes"
+    else:
+        problem = None
+    if problem:
+        emit('audio_error', {'session_id': session.session_id,
+                             'message': f"Expected float32 frames of {channels} channel{'s' if channels != 1 else ''} "
+                                        f"({frame_bytes} bytes each), {problem}"})
+        return
+    session.feed(np.frombuffer(data, dtype='<f4').reshape(-1, channels))
 
 # Define Flask routes
 @app.route('/')
@@ -295,6 +888,92 @@ def get_devices():
     
     return jsonify({'devices': device_list})
 
+@app.route('/status')
+def get_status():
+    """Current session, capacity headroom and recent admission decisions"""
+    try:
+        host = ping().get('capacity')
+        source = 'daemon'
+    except (DaemonUnavailable, DaemonError):
+        host = None
+    if host is None:
+        host = capacity.snapshot()
+        source = 'local'
+    
+    session = None
+    if current_session and not current_session.stop_event.is_set():
+        session = {
+            'session_id': current_session.session_id,
+            'task': current_session.task,
+            'source_lang': current_session.source_lang,
+            'target_langs': current_session.target_langs,
+            'buffer_size': current_session.buffer_size,
+            'beam_size': current_session.beam_size,
+            'remote': current_session.remote,
+            'audio_metrics': current_session.ring.metrics()
+        }
+    
+    return jsonify({
+        'session': session,
+        'client_sessions': sorted(s.session_id for s in list(client_sessions.values())),
+        'queued': sorted(entry[1] for entry in list(pending_starts.values())),
+        'capacity': {'host': source, **host},
+        'admissions': list(admissions)
+    })
+
+def _page_size(name, default, maximum):
+    """Integer query parameter clamped to 1..maximum"""
+    return max(1, min(request.args.get(name, default, type=int), maximum))
+
+def _index_filters():
+    return {key: request.args.get(key) or None for key in ('lang', 'task', 'kind')}
+
+@app.route('/transcripts/search')
+def search_transcripts():
+    """Segments matching every word of q, newest first (or order=relevance); paged with limit and offset"""
+    index = default_index()
+    if index is None:
+        return jsonify({'error': 'Transcript index is not available'}), 503
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing q'}), 400
+    limit = _page_size('limit', 20, 100)
+    offset = max(0, request.args.get('offset', 0, type=int))
+    order = request.args.get('order', 'recent')
+    if order not in ('recent', 'relevance'):
+        return jsonify({'error': 'order must be recent or relevance'}), 400
+    start = time.perf_counter()
+    hits = index.search(query, limit=limit, offset=offset, order=order, **_index_filters())
+    return jsonify({
+        'query': query,
+        'hits': hits,
+        'offset': offset,
+        'next_offset': offset + limit if len(hits) == limit else None,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2)
+    })
+
+@app.route('/transcripts/history')
+def transcript_history():
+    """Transcripts newest first; pass the returned next as before for the following page"""
+    index = default_index()
+    if index is None:
+        return jsonify({'error': 'Transcript index is not available'}), 503
+    documents, next_page = index.history(limit=_page_size('limit', 20, 200),
+                                         before=request.args.get('before', type=int), **_index_filters())
+    return jsonify({'documents': documents, 'next': next_page})
+
+@app.route('/transcripts/<int:document_id>')
+def transcript_document(document_id):
+    """One transcript with a page of its segments"""
+    index = default_index()
+    if index is None:
+        return jsonify({'error': 'Transcript index is not available'}), 503
+    document = index.document(document_id, limit=_page_size('limit', 100, 1000),
+                              offset=max(0, request.args.get('offset', 0, type=int)))
+    if document is None:
+        return jsonify({'error': 'No such transcript'}), 404
+    return jsonify(document)
+
 def get_ip_address():
     """Get the current machine's IP address"""
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -312,5 +991,37 @@ def create_templates():
     """Create template directory and HTML file"""
     templates_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
     os.makedirs(templates_dir, exist_ok=True)
-    
-    
\ No newline at end of file
+
+def main():
+    global shared_backend, shared_interim_backend, interim_interval
+    parser = argparse.ArgumentParser(description="Live transcription web server")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=5000, help="Port to listen on")
+    parser.add_argument("--max-load", type=float, default=capacity.max_load,
+                        help="Admit sessions while their measured real-time factor stays below this "
+                             "(when no inference daemon is running)")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="Serve every session from a stub model instead of Canary, to load-test the server")
+    parser.add_argument("--stub-rtf", type=float, default=0.05,
+                        help="Simulated compute time of the stub model per second of audio")
+    parser.add_argument("--stub-interim-rtf", type=float, default=None,
+                        help="With --stub-model, also make interim captions with a stub of this real-time factor")
+    parser.add_argument("--interim-interval", type=float, default=interim_interval,
+                        help="Seconds of new audio between interim captions, when a model is configured "
+                             "for the interim role (0 turns them off)")
+
+    args = parser.parse_args()
+
+    capacity.max_load = args.max_load
+    if args.stub_model:
+        shared_backend = load_backend("stub", rtf=args.stub_rtf)
+        print(f"Using the stub model (real-time factor {args.stub_rtf})")
+        if args.stub_interim_rtf is not None:
+            shared_interim_backend = load_backend("stub", rtf=args.stub_interim_rtf)
+    interim_interval = args.interim_interval
+
+    print(f"Open http://{get_ip_address()}:{args.port} in a browser")
+    socketio.run(app, host=args.host, port=args.port, allow_unsafe_werkzeug=True)
+
+if __name__ == "__main__":
+    main()
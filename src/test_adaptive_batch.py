@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Behaviour of adaptive batch sizing: batches that run out of memory are
+split, the profile keeps the best size that worked below the smallest that
+failed, and a bucket grows past an old failure after enough clean batches.
+Run with pytest or directly.
+"""
+
+import sys
+import json
+
+import pytest
+
+import adaptive_batch
+from adaptive_batch import BatchProfile, transcribe_adaptive
+
+OPTIONS = {"taskname": "asr", "source_lang": "en", "target_lang": "en", "pnc": "yes", "batch_size": 4}
+
+class LimitedBackend:
+    """Runs out of memory on batches larger than limit, or on the next `failures` calls"""
+
+    device = "cpu"
+
+    def __init__(self, limit=1000, failures=0):
+        self.limit = limit
+        self.failures = failures
+        self.sizes = []
+
+    def transcribe(self, audio, batch_size=1, **prompt):
+        self.sizes.append(len(audio))
+        if self.failures or len(audio) > self.limit:
+            self.failures = max(0, self.failures - 1)
+            raise RuntimeError("CUDA out of memory. Tried to allocate 2.00 GiB")
+        return [f"text of {path}" for path in audio]
+
+@pytest.fixture(autouse=True)
+def room_to_grow(monkeypatch):
+    monkeypatch.setattr(adaptive_batch, "_host_available_fraction", lambda: 1.0)
+
+def run(backend, count, profile_path, max_batch_size=16):
+    files = [f"{i}.wav" for i in range(count)]
+    results = transcribe_adaptive(backend, files, [5.0] * count, OPTIONS, max_batch_size=max_batch_size,
+                                  profile_path=str(profile_path))
+    assert results == [f"text of {path}" for path in files]
+    return BatchProfile(str(profile_path)).sizes["<=10s"]
+
+def with_profile(tmp_path, **sizes):
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps({"cpu": {"<=10s": sizes}}))
+    return path
+
+def test_grows_and_splits_at_the_limit(tmp_path):
+    backend = LimitedBackend(limit=8)
+    sizes = run(backend, 60, tmp_path / "profile.json")
+    assert backend.sizes[:5] == [4, 8, 16, 8, 8]
+    assert sizes["best"] == 8 and sizes["oom"] > 8
+
+def test_failure_does_not_lower_best_below_sizes_that_worked(tmp_path):
+    backend = LimitedBackend(failures=1)
+    sizes = run(backend, 40, with_profile(tmp_path, best=16))
+    # Sixteen failed once; fifteen worked afterwards, so best is not halved to eight
+    assert backend.sizes[:5] == [16, 8, 8, 8, 15]
+    assert sizes == {"best": 15, "oom": 16, "clean": 5}
+
+def test_small_run_keeps_the_stored_best(tmp_path):
+    assert run(LimitedBackend(), 3, with_profile(tmp_path, best=8))["best"] == 8
+
+def test_clean_batches_are_counted_across_runs(tmp_path):
+    sizes = run(LimitedBackend(), 12, with_profile(tmp_path, best=4, oom=8, clean=0))
+    assert sizes == {"best": 7, "oom": 8, "clean": 3}
+
+def test_reprobes_past_an_old_failure_after_clean_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(adaptive_batch, "REPROBE_AFTER", 3)
+    backend = LimitedBackend()
+    sizes = run(backend, 32, with_profile(tmp_path, best=4, oom=8, clean=1))
+    # Two more clean batches lift the ceiling of eight, then the bucket grows past it
+    assert backend.sizes == [4, 7, 14, 7]
+    assert sizes == {"best": 14}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the audio ring: order across the wrap-around, and overflow
+that drops and counts the frames that do not fit. Run with pytest or directly.
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+from audio_ring import AudioRing
+
+def frames(start, count, channels=1):
+    return np.arange(start, start + count, dtype=np.float32).repeat(channels).reshape(count, channels)
+
+def test_wrap_around_keeps_order():
+    ring = AudioRing(8, channels=2)
+    out = np.zeros((8, 2), dtype=np.float32)
+    written = 0
+    for count in (5, 6, 7, 3, 8):
+        assert ring.write(frames(written, count, 2)) == count
+        assert ring.read_into(out[:count], timeout=0) == count
+        assert np.array_equal(out[:count], frames(written, count, 2))
+        written += count
+    assert ring.available() == 0
+    assert ring.metrics()['overflows'] == 0
+
+def test_partial_reads_span_the_end_of_the_buffer():
+    ring = AudioRing(6)
+    out = np.zeros((4, 1), dtype=np.float32)
+    ring.write(frames(0, 4))
+    ring.read_into(out, timeout=0)
+    ring.write(frames(4, 5))
+    assert ring.read_into(out[:3], timeout=0) == 3
+    assert ring.read_into(out, timeout=0) == 2
+    assert np.array_equal(out[:2, 0], [7, 8])
+
+def test_overflow_drops_the_frames_that_do_not_fit():
+    ring = AudioRing(4)
+    assert ring.write(frames(0, 3)) == 3
+    assert ring.write(frames(3, 3)) == 1
+    assert ring.write(frames(6, 2)) == 0
+    metrics = ring.metrics()
+    assert metrics['overflows'] == 2
+    assert metrics['dropped_frames'] == 4
+    assert metrics['fill'] == 1.0
+
+    # The oldest frames are kept; the ones that did not fit are lost
+    out = np.zeros((4, 1), dtype=np.float32)
+    assert ring.read_into(out, timeout=0) == 4
+    assert np.array_equal(out[:, 0], [0, 1, 2, 3])
+
+def test_empty_read_times_out_and_counts_an_underflow():
+    ring = AudioRing(4)
+    out = np.zeros((4, 1), dtype=np.float32)
+    assert ring.read_into(out, timeout=0.01) == 0
+    assert ring.metrics()['underflows'] == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the decoded-audio store: a file is decoded once, read back from
+the pack on later runs, and decoded again only when its content changed.
+Most cases decode raw float32 files so they run without soundfile; the
+last ones go through the real decoder. Run with pytest or directly.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+import audio_store
+from audio_store import AudioStore
+
+def raw_decode(path):
+    """Stand-in decoder: the file holds float32 samples, or starts with b"bad" when undecodable"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(b"bad"):
+        raise ValueError("not audio")
+    return np.frombuffer(data, dtype=np.float32).copy()
+
+@pytest.fixture
+def raw(monkeypatch):
+    monkeypatch.setattr(audio_store, "decode_file", raw_decode)
+
+def write_samples(path, frequency, frames=8000):
+    samples = (0.5 * np.sin(2 * np.pi * frequency * np.arange(frames) / 16000)).astype(np.float32)
+    samples.tofile(path)
+    return samples
+
+def touch(path, seconds_later):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(seconds_later * 1e9)))
+
+def test_file_is_decoded_once_and_read_from_the_pack(tmp_path, raw):
+    path = str(tmp_path / "tone.raw")
+    samples = write_samples(path, 440)
+    store = AudioStore(str(tmp_path / "store"), dtype="float32")
+    np.testing.assert_array_equal(store.get(path), samples)
+    np.testing.assert_array_equal(store.get(path), samples)
+    assert (store.decoded, store.hits) == (1, 1)
+
+    # A later run reads the index instead of decoding
+    again = AudioStore(str(tmp_path / "store"), dtype="float32")
+    np.testing.assert_array_equal(again.get(path), samples)
+    assert (again.decoded, again.hits) == (0, 1)
+
+def test_changed_content_is_decoded_again(tmp_path, raw):
+    path = str(tmp_path / "tone.raw")
+    write_samples(path, 440)
+    store = AudioStore(str(tmp_path / "store"))
+    store.get(path)
+    changed = write_samples(path, 880)
+    touch(path, 5)
+    np.testing.assert_array_equal(store.get(path), changed)
+    assert store.decoded == 2
+
+def test_new_mtime_with_same_content_keeps_the_entry(tmp_path, raw):
+    path = str(tmp_path / "tone.raw")
+    samples = write_samples(path, 440)
+    store = AudioStore(str(tmp_path / "store"))
+    store.get(path)
+    touch(path, 5)
+    np.testing.assert_array_equal(store.get(path), samples)
+    assert store.decoded == 1
+    assert store.sources[os.path.abspath(path)]["mtime_ns"] == os.stat(path).st_mtime_ns
+
+def test_another_process_sees_new_entries(tmp_path, raw):
+    first = str(tmp_path / "a.raw")
+    second = str(tmp_path / "b.raw")
+    write_samples(first, 440)
+    expected = write_samples(second, 660, frames=3000)
+    writer = AudioStore(str(tmp_path / "store"))
+    reader = AudioStore(str(tmp_path / "store"))
+    writer.get(first)
+    writer.get(second)
+    np.testing.assert_array_equal(reader.get(second), expected)
+    assert reader.decoded == 0
+
+def test_copies_share_one_entry(tmp_path, raw):
+    first = str(tmp_path / "a.raw")
+    write_samples(first, 440)
+    second = str(tmp_path / "b.raw")
+    with open(first, "rb") as src, open(second, "wb") as dst:
+        dst.write(src.read())
+    store = AudioStore(str(tmp_path / "store"))
+    store.get(first)
+    store.get(second)
+    assert store.decoded == 1
+    assert len(store.entries) == 1
+
+def test_int16_store_is_close_to_the_source(tmp_path, raw):
+    path = str(tmp_path / "tone.raw")
+    samples = write_samples(path, 440)
+    store = AudioStore(str(tmp_path / "store"), dtype="int16")
+    stored = store.get(path)
+    assert stored.dtype == np.float32
+    np.testing.assert_allclose(stored, samples, atol=1e-4)
+    assert os.path.getsize(store.pack_path) < samples.nbytes
+
+def test_undecodable_file_is_left_to_the_model(tmp_path, raw):
+    path = str(tmp_path / "broken.raw")
+    with open(path, "wb") as f:
+        f.write(b"bad audio")
+    store = AudioStore(str(tmp_path / "store"))
+    assert store.get(path) is None
+    assert store.entries == {}
+
+def test_unknown_dtype_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        AudioStore(str(tmp_path / "store"), dtype="float64")
+
+def test_wav_is_decoded_to_16k_mono(tmp_path):
+    sf = pytest.importorskip("soundfile")
+    path = str(tmp_path / "tone.wav")
+    t = np.arange(24000) / 48000
+    tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    sf.write(path, np.stack([tone, tone], axis=1), 48000, subtype="FLOAT")
+    stored = AudioStore(str(tmp_path / "store")).get(path)
+    assert len(stored) == 8000
+    expected = (0.5 * np.sin(2 * np.pi * 440 * np.arange(8000) / 16000)).astype(np.float32)
+    np.testing.assert_allclose(stored[100:-100], expected[100:-100], atol=0.02)
+
+def test_file_soundfile_cannot_open_is_left_to_the_model(tmp_path):
+    pytest.importorskip("soundfile")
+    path = str(tmp_path / "broken.wav")
+    with open(path, "wb") as f:
+        f.write(b"not audio")
+    assert AudioStore(str(tmp_path / "store")).get(path) is None
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
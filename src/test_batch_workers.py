@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the duration-balanced sharding used for worker processes.
+Run with pytest or directly.
+"""
+
+import sys
+import random
+
+import pytest
+
+from batch_workers import shard_by_duration
+
+def totals(durations, shards):
+    return [sum(durations[i] for i in shard) for shard in shards]
+
+def test_every_file_lands_in_exactly_one_shard_in_input_order():
+    durations = [random.Random(n).uniform(1, 600) for n in range(101)]
+    shards = shard_by_duration(durations, 4)
+    assert len(shards) == 4
+    assert sorted(i for shard in shards for i in shard) == list(range(101))
+    assert all(shard == sorted(shard) for shard in shards)
+
+def test_shards_are_balanced_by_duration_not_count():
+    # One long recording and many short ones: the long one gets a shard to itself
+    durations = [3600.0] + [60.0] * 60
+    shards = shard_by_duration(durations, 2)
+    assert shards[0] == [0] or shards[1] == [0]
+    assert totals(durations, shards) == [3600.0, 3600.0]
+
+def test_greedy_split_is_within_one_file_of_even():
+    durations = [random.Random(7 * n).uniform(1, 300) for n in range(200)]
+    shards = shard_by_duration(durations, 3)
+    spread = max(totals(durations, shards)) - min(totals(durations, shards))
+    assert spread <= max(durations)
+
+def test_more_shards_than_files_leaves_some_empty():
+    shards = shard_by_duration([5.0, 10.0], 4)
+    assert sorted(map(len, shards)) == [0, 0, 1, 1]
+    assert shard_by_duration([], 2) == [[], []]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
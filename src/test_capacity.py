@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the capacity model: sessions are admitted while their measured
+cost fits under max_load and refused past it. Run with pytest or directly.
+"""
+
+import sys
+import threading
+
+import pytest
+
+from capacity import CapacityModel
+
+def measured(rtf, chunk_seconds=2.0, beam_size=1, samples=10, **kwargs):
+    """CapacityModel with samples chunks measured at the given per-stream real-time factor"""
+    capacity = CapacityModel(**kwargs)
+    for _ in range(samples):
+        capacity.record(chunk_seconds, beam_size, 1, rtf * chunk_seconds)
+    return capacity
+
+def test_sessions_are_admitted_up_to_max_load():
+    capacity = measured(0.3, max_load=0.9)
+    decisions = [capacity.admit(f"s{i}", 2.0, 1) for i in range(4)]
+    assert [d["admitted"] for d in decisions] == [True, True, True, False]
+    assert decisions[2]["headroom"] == pytest.approx(0.0)
+    assert "exceed the limit" in decisions[3]["reason"]
+    assert capacity.load() == pytest.approx(0.9)
+
+    capacity.release("s0")
+    assert capacity.admit("s4", 2.0, 1)["admitted"]
+
+def test_streams_multiply_the_cost():
+    capacity = measured(0.25, max_load=0.9)
+    assert not capacity.admit("stereo-3-langs", 2.0, 1, streams=6)["admitted"]
+    assert capacity.admit("mono-3-langs", 2.0, 1, streams=3)["admitted"]
+
+def test_unmeasured_host_admits_and_counts_later():
+    capacity = CapacityModel(max_load=0.9)
+    decision = capacity.admit("first", 2.0, 1)
+    assert decision["admitted"] and decision["estimate"] == 0.0
+    for _ in range(5):
+        capacity.record(2.0, 1, 1, 1.2, session="first")
+    assert capacity.load() == pytest.approx(0.6)
+    assert not capacity.admit("second", 2.0, 1)["admitted"]
+
+def test_replacing_a_session_does_not_count_it_twice():
+    capacity = measured(0.5, max_load=0.9)
+    assert capacity.admit("old", 2.0, 1)["admitted"]
+    assert not capacity.admit("other", 2.0, 1)["admitted"]
+    assert capacity.admit("new", 2.0, 1, replaces="old")["admitted"]
+    assert set(capacity.sessions) == {"new"}
+
+def test_nearest_measurement_stands_in_for_a_new_configuration():
+    capacity = measured(0.2, chunk_seconds=2.0, beam_size=1)
+    capacity.record(5.0, 1, 1, 0.5)
+    assert capacity.stream_rtf(2.5, 1) == pytest.approx(0.2)
+    # Unmeasured beam: scaled from the nearest one
+    assert capacity.stream_rtf(2.0, 4) == pytest.approx(0.8)
+
+def test_overlapping_chunks_are_measured_per_hop():
+    capacity = CapacityModel(max_load=0.9)
+    assert capacity.admit("live", 2.0, 1, hop_seconds=1.5)["admitted"]
+    # 0.6 s per 2 s chunk, but a chunk runs every 1.5 s of new audio
+    for _ in range(5):
+        capacity.record(2.0, 1, 1, 0.6, session="live")
+    assert capacity.stream_rtf(2.0, 1) == pytest.approx(0.4)
+    capacity.record(3.0, 1, 1, 0.6, hop_seconds=2.0)
+    assert capacity.stream_rtf(3.0, 1) == pytest.approx(0.3)
+    # Measured per chunk length this would fit (0.3 + 0.6); per hop it does not
+    assert not capacity.admit("next", 2.0, 1, streams=2, hop_seconds=1.5)["admitted"]
+
+def test_interim_decodes_add_to_sessions_that_use_them():
+    capacity = measured(0.2, max_load=1.0)
+    assert capacity.admit("live", 2.0, 1, interim=True)["admitted"]
+    for _ in range(5):
+        capacity.record_interim(0.1, session="live")
+        capacity.record_interim(0.1, session="live")
+        capacity.record(2.0, 1, 1, 0.4, session="live")
+    assert capacity.admit("plain", 2.0, 1)["estimate"] == pytest.approx(0.2)
+    assert capacity.admit("with-interim", 2.0, 1, interim=True)["estimate"] == pytest.approx(0.3)
+
+def test_idle_sessions_expire():
+    capacity = measured(0.5, max_load=0.9, idle_timeout=0.0)
+    assert capacity.admit("gone", 2.0, 1)["admitted"]
+    assert capacity.admit("next", 2.0, 1)["admitted"]
+
+def test_concurrent_admissions_see_each_other():
+    capacity = measured(0.4, max_load=0.9)
+    start = threading.Barrier(8)
+    decisions = []
+
+    def admit(i):
+        start.wait()
+        decisions.append(capacity.admit(f"s{i}", 2.0, 1))
+
+    threads = [threading.Thread(target=admit, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(d["admitted"] for d in decisions) == 2
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the caption broadcaster: one coalesced delta per room and tick,
+replacements of earlier captions, and snapshots for joining viewers. Run
+with pytest or directly.
+"""
+
+import sys
+import json
+
+import pytest
+
+from caption_broadcast import CaptionBroadcaster
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, to=None):
+        self.emitted.append((event, to, json.loads(payload)))
+
+@pytest.fixture
+def socketio():
+    return FakeSocketIO()
+
+def test_updates_within_a_tick_are_one_delta_per_room(socketio):
+    broadcaster = CaptionBroadcaster(socketio)
+    broadcaster.append("lang:de", "Hallo")
+    broadcaster.append("lang:de", "Welt", speaker="A")
+    broadcaster.append("lang:fr", "Bonjour")
+    broadcaster.flush()
+
+    assert len(socketio.emitted) == 2
+    deltas = {room: message for _, room, message in socketio.emitted}
+    assert deltas["lang:de"] == {"l": "lang:de", "q": 1, "a": [[0, "Hallo", None], [1, "Welt", "A"]]}
+    assert deltas["lang:fr"]["a"] == [[0, "Bonjour", None]]
+
+    # Nothing changed: nothing is sent
+    broadcaster.flush()
+    assert len(socketio.emitted) == 2
+
+def test_replace_sends_the_new_text_of_an_earlier_caption(socketio):
+    broadcaster = CaptionBroadcaster(socketio)
+    index = broadcaster.append("lang:en", "interim")
+    broadcaster.flush()
+    broadcaster.replace("lang:en", index, "final text")
+    broadcaster.flush()
+
+    _, _, message = socketio.emitted[-1]
+    assert message == {"l": "lang:en", "q": 2, "r": [[index, "final text"]]}
+
+def test_replace_before_the_flush_rides_on_the_append(socketio):
+    broadcaster = CaptionBroadcaster(socketio)
+    index = broadcaster.append("lang:en", "interim")
+    broadcaster.replace("lang:en", index, "final")
+    broadcaster.flush()
+
+    _, _, message = socketio.emitted[-1]
+    assert message["a"] == [[index, "final", None]]
+    assert "r" not in message
+
+def test_status_is_sent_once_to_every_room(socketio):
+    broadcaster = CaptionBroadcaster(socketio)
+    broadcaster.append("lang:en", "a")
+    broadcaster.append("lang:de", "b")
+    broadcaster.flush()
+    broadcaster.set_status(state="running")
+    broadcaster.set_status(state="stopping")
+    broadcaster.flush()
+
+    statuses = [message["st"] for _, _, message in socketio.emitted[2:]]
+    assert statuses == [{"state": "stopping"}] * 2
+    broadcaster.flush()
+    assert len(socketio.emitted) == 4
+
+def test_snapshot_holds_the_recent_tail(socketio):
+    broadcaster = CaptionBroadcaster(socketio, tail_size=3)
+    for i in range(5):
+        broadcaster.append("lang:en", f"caption {i}")
+    broadcaster.flush()
+    broadcaster.replace("lang:en", 0, "too old to change")
+
+    snapshot = json.loads(broadcaster.snapshot("lang:en"))
+    assert snapshot["full"] is True
+    assert snapshot["q"] == 1
+    assert [entry[1] for entry in snapshot["a"]] == ["caption 2", "caption 3", "caption 4"]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
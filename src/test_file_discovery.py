@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the streaming directory walk: every audio file of the tree is
+found once, in chunks, and a walk held by a slow consumer can be stopped.
+Run with pytest or directly.
+"""
+
+import os
+import sys
+
+import pytest
+
+from file_discovery import DirectoryWalker
+
+def make_tree(root, depth=3, width=3, files=4):
+    """Nested directories with audio and non-audio files; returns the audio paths"""
+    expected = set()
+    directories = [root]
+    for _ in range(depth):
+        children = []
+        for directory in directories:
+            for n in range(files):
+                name = f"clip{n}.WAV" if n % 2 else f"clip{n}.mp3"
+                path = os.path.join(directory, name)
+                open(path, "w").close()
+                expected.add(path)
+            open(os.path.join(directory, "notes.txt"), "w").close()
+            for n in range(width):
+                child = os.path.join(directory, f"dir{n}")
+                os.mkdir(child)
+                children.append(child)
+        directories = children
+    return expected
+
+def test_walk_finds_every_audio_file_once(tmp_path):
+    expected = make_tree(str(tmp_path))
+    found = list(DirectoryWalker(str(tmp_path), workers=4))
+    assert len(found) == len(expected)
+    assert set(found) == expected
+
+def test_take_returns_chunks_until_the_walk_is_done(tmp_path):
+    expected = make_tree(str(tmp_path), depth=2)
+    walker = DirectoryWalker(str(tmp_path), workers=2)
+    chunks = []
+    while True:
+        chunk = walker.take(5)
+        if not chunk:
+            break
+        assert len(chunk) <= 5
+        chunks.append(chunk)
+    assert set(path for chunk in chunks for path in chunk) == expected
+    assert walker.take(5) == []
+
+def test_walk_with_a_full_directory_queue_lists_subdirectories_itself(tmp_path):
+    expected = make_tree(str(tmp_path), depth=4)
+    walker = DirectoryWalker(str(tmp_path), workers=3, max_directories=1)
+    found = list(walker)
+    assert sorted(found) == sorted(expected)
+    assert walker.directories.maxsize == 1 and not walker.errors
+
+def test_pending_files_are_bounded_and_stop_ends_the_walk(tmp_path):
+    make_tree(str(tmp_path), depth=3, files=6)
+    walker = DirectoryWalker(str(tmp_path), workers=2, max_pending=8)
+    assert len(walker.take(3)) == 3
+    assert walker.files.qsize() <= 8
+    walker.stop()
+    for thread in walker.threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+def test_unreadable_directory_is_reported(tmp_path):
+    walker = DirectoryWalker(str(tmp_path / "missing"))
+    assert list(walker) == []
+    assert len(walker.errors) == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
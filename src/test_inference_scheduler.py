@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the inference scheduler: live work runs before batch work,
+live sessions take turns, and results come back in input order. Run with
+pytest or directly.
+"""
+
+import sys
+import threading
+
+import pytest
+
+from inference_scheduler import InferenceScheduler, LIVE, BATCH
+
+class Recorder:
+    """run callbacks that log (label, item) in the order the worker runs them"""
+
+    def __init__(self):
+        self.order = []
+
+    def run(self, label):
+        def run(items):
+            self.order += [(label, item) for item in items]
+            return [f"{label}:{item}" for item in items]
+        return run
+
+def hold_worker(scheduler):
+    """Occupy the worker with one unit until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def run(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    job = scheduler.submit([None], run, priority=BATCH)
+    assert started.wait(5)
+    return release, job
+
+def test_live_work_runs_before_queued_batch_work():
+    scheduler = InferenceScheduler()
+    recorder = Recorder()
+    release, gate = hold_worker(scheduler)
+    batch = scheduler.submit([1, 2, 3], recorder.run("batch"), priority=BATCH)
+    live = scheduler.submit([1, 2], recorder.run("live"), priority=LIVE, tenant="s1", unit_size=1)
+    release.set()
+
+    assert live.wait() == ["live:1", "live:2"]
+    assert batch.wait() == ["batch:1", "batch:2", "batch:3"]
+    gate.wait()
+    assert recorder.order[:2] == [("live", 1), ("live", 2)]
+
+def test_live_sessions_are_served_round_robin():
+    scheduler = InferenceScheduler()
+    recorder = Recorder()
+    release, _ = hold_worker(scheduler)
+    busy = scheduler.submit([1, 2, 3], recorder.run("a"), priority=LIVE, tenant="a", unit_size=1)
+    also_busy = scheduler.submit([4], recorder.run("a"), priority=LIVE, tenant="a")
+    quiet = scheduler.submit([1, 2], recorder.run("b"), priority=LIVE, tenant="b", unit_size=1)
+    release.set()
+    for job in (busy, also_busy, quiet):
+        job.wait()
+
+    assert [label for label, _ in recorder.order] == ["a", "b", "a", "b", "a", "a"]
+    assert [item for label, item in recorder.order if label == "a"] == [1, 2, 3, 4]
+
+def test_a_failed_job_raises_and_the_rest_is_dropped():
+    scheduler = InferenceScheduler()
+    calls = []
+
+    def fail(items):
+        calls.append(items)
+        raise RuntimeError("device lost")
+
+    with pytest.raises(RuntimeError, match="device lost"):
+        scheduler.run([1, 2, 3], fail, priority=LIVE, tenant="s1", unit_size=1)
+    assert calls == [[1]]
+    assert scheduler.run([5], lambda items: [i * 2 for i in items]) == [10]
+    assert scheduler.snapshot()["classes"][LIVE]["queued"] == 0
+
+def test_batch_units_stay_within_the_live_budget():
+    scheduler = InferenceScheduler(live_budget=1.0)
+    job = scheduler.submit([], lambda items: items)
+    job.unit_size = 100
+    assert scheduler.batch_unit(job) == 1
+    scheduler.metrics[BATCH].record_unit(10, 1.0)
+    assert scheduler.batch_unit(job) == 5
+    # Live chunks already wait most of the budget: smaller units
+    scheduler.metrics[LIVE].waits.extend([0.8] * 10)
+    assert scheduler.batch_unit(job) == 1
+
+def test_unknown_priority_is_refused():
+    with pytest.raises(ValueError):
+        InferenceScheduler().submit([1], lambda items: items, priority="urgent")
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the streaming resampler: the output does not depend on how the
+capture is split into blocks. Run with pytest or directly.
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+from resample import StreamResampler
+
+def resample_in_blocks(signal, block_sizes, **kwargs):
+    resampler = StreamResampler(**kwargs)
+    output = []
+    start = 0
+    sizes = iter(block_sizes)
+    while start < len(signal):
+        size = next(sizes)
+        resampler.process(signal[start:start + size], lambda out: output.append(out.copy()))
+        start += size
+    return np.concatenate(output)
+
+@pytest.mark.parametrize("in_rate,in_channels", [(48000, 2), (44100, 1), (8000, 1)])
+def test_output_does_not_depend_on_block_size(in_rate, in_channels):
+    rng = np.random.default_rng(0)
+    signal = rng.standard_normal((in_rate // 2, in_channels)).astype(np.float32)
+    options = dict(in_rate=in_rate, in_channels=in_channels, max_block=1024)
+
+    whole = resample_in_blocks(signal, [len(signal)], **options)
+    fixed = resample_in_blocks(signal, [480] * len(signal), **options)
+    irregular = resample_in_blocks(signal, rng.integers(1, 3000, size=len(signal)), **options)
+
+    assert len(whole) == len(fixed) == len(irregular)
+    assert abs(len(whole) - len(signal) * 16000 / in_rate) <= 1
+    np.testing.assert_allclose(fixed, whole, atol=1e-5)
+    np.testing.assert_allclose(irregular, whole, atol=1e-5)
+
+def test_downmix_averages_the_channels():
+    tone = np.sin(2 * np.pi * 440 * np.arange(4800) / 48000).astype(np.float32)
+    stereo = np.stack([tone, tone], axis=1)
+    left_only = np.stack([tone, np.zeros_like(tone)], axis=1)
+    both = resample_in_blocks(stereo, [512] * 10, in_rate=48000, in_channels=2)
+    half = resample_in_blocks(left_only, [512] * 10, in_rate=48000, in_channels=2)
+    np.testing.assert_allclose(half, both / 2, atol=1e-5)
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
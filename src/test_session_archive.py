@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the session audio archive across prompt changes, and of its
+re-decode: each segment is decoded with the prompt it was archived with, on
+a given backend whose beam size is set back afterwards. Run with pytest or
+directly.
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("soundfile")
+
+import transcript_journal
+from session_archive import AudioArchive, read_index, redecode
+
+ENGLISH = {"source_lang": "en", "target_langs": ["en"], "pnc": "yes"}
+GERMAN = {"source_lang": "de", "target_langs": ["en", "fr"], "pnc": "no"}
+
+class RecordingBackend:
+    """Answers with the prompt of each call and remembers the calls"""
+
+    def __init__(self, beam_size=1):
+        self.beam_size = beam_size
+        self.calls = []
+
+    def set_decoding(self, beam_size=1):
+        self.beam_size = beam_size
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        self.calls.append((taskname, source_lang, target_lang, pnc, self.beam_size, len(audio)))
+        return [f"{source_lang}->{target_lang}" for _ in audio]
+
+@pytest.fixture(autouse=True)
+def no_index(monkeypatch):
+    monkeypatch.setattr(transcript_journal, "index_session", lambda *args, **kwargs: None)
+
+def archive_with_change(directory):
+    """Two seconds of English, then a second of German translated into two languages"""
+    archive = AudioArchive(str(directory), samplerate=1000, segment_seconds=10, prompt=ENGLISH)
+    archive.write(np.zeros((2500, 1), dtype=np.float32))
+    # The new prompt applies from frame 2000, half a second ago
+    archive.set_prompt(GERMAN, frame=2000)
+    archive.write(np.zeros((500, 1), dtype=np.float32))
+    archive.close()
+
+def test_prompt_change_cuts_the_segment_where_it_applies(tmp_path):
+    archive_with_change(tmp_path)
+    _, segments = read_index(str(tmp_path))
+    assert [(s["start"], s["end"], s["source_lang"]) for s in segments] == [(0, 2, "en"), (2, 3, "de")]
+    assert segments[1]["target_langs"] == ["en", "fr"]
+
+def test_same_prompt_does_not_cut(tmp_path):
+    archive = AudioArchive(str(tmp_path), samplerate=1000, segment_seconds=10, prompt=ENGLISH)
+    archive.write(np.zeros((500, 1), dtype=np.float32))
+    archive.set_prompt(dict(ENGLISH))
+    archive.close()
+    assert len(read_index(str(tmp_path))[1]) == 1
+
+def test_redecode_uses_each_segments_prompt(tmp_path):
+    archive_with_change(tmp_path / "archive")
+    transcripts = {"en": str(tmp_path / "en"), "fr": str(tmp_path / "fr")}
+    backend = RecordingBackend(beam_size=1)
+    replaced = redecode(str(tmp_path / "archive"), transcripts, beam_size=4, backend=backend)
+
+    assert set(replaced) == {"en", "fr"}
+    assert (tmp_path / "en.txt").read_text().splitlines() == ["en->en", "de->en"]
+    # French was only decoded live after the change
+    assert (tmp_path / "fr.txt").read_text().splitlines() == ["de->fr"]
+    assert backend.calls == [("asr", "en", "en", "yes", 4, 1),
+                             ("s2t_translation", "de", "en", "no", 4, 1),
+                             ("s2t_translation", "de", "fr", "no", 4, 1)]
+    # The live model is left with its own beam
+    assert backend.beam_size == 1
+
+def test_redecode_of_an_archive_without_prompts_uses_the_given_one(tmp_path):
+    archive = AudioArchive(str(tmp_path / "archive"), samplerate=1000, segment_seconds=10)
+    archive.write(np.zeros((500, 1), dtype=np.float32))
+    archive.close()
+    backend = RecordingBackend()
+    redecode(str(tmp_path / "archive"), {"de": str(tmp_path / "de")}, source_lang="en", pnc="no",
+             backend=backend)
+    assert backend.calls == [("s2t_translation", "en", "de", "no", 4, 1)]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
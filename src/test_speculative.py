@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Behaviour of speculative greedy decoding: with any draft, good or bad, the
+output is the target's own greedy output, and a draft that agrees with the
+target saves target passes. The decoders are small deterministic stand-ins
+for Canary's, so only the acceptance logic is under test; cases that run
+the speculative loop need torch and NeMo, the others run on numpy. Run
+with pytest or directly.
+"""
+
+import sys
+import types
+import hashlib
+
+import numpy as np
+import pytest
+
+import speculative
+from speculative import DraftEncoder, SpeculativeGreedy, accepted_tokens
+
+VOCAB, PAD, EOS, BOS = 12, 0, 1, 2
+
+# The few tensor functions the toy decoders need, on numpy
+NUMPY = types.SimpleNamespace(tensor=np.array, zeros=lambda *shape: np.zeros(shape),
+                              ones=lambda *shape: np.ones(shape),
+                              cat=lambda tensors, dim: np.concatenate(tensors, axis=dim))
+
+def next_token(history, draft_agreement=None):
+    """Deterministic next token of a history; a draft picks another token unless it agrees"""
+    h = int(hashlib.md5(str(list(history)).encode()).hexdigest(), 16)
+    token = EOS if len(history) > 6 + (h >> 8) % 30 else 3 + h % (VOCAB - 3)
+    if draft_agreement is not None and (h >> 20) % 100 >= draft_agreement * 100:
+        token = 3 + (h >> 40) % (VOCAB - 3)
+    return token
+
+class ToyStack:
+    """Stand-in for _DecoderStack: scores from the token history, which its mems carry"""
+
+    def __init__(self, torch, draft_agreement=None):
+        self.torch = torch
+        self.draft_agreement = draft_agreement
+
+    def extend(self, ids, mems, encoder_states, encoder_attn_mask, key_mask=None):
+        torch = self.torch
+        history = torch.cat((mems[0], ids), dim=1) if mems else ids
+        cached = history.shape[1] - ids.shape[1]
+        scores = [[[0.0 if v == next_token(row[:cached + j + 1], self.draft_agreement) else -5.0
+                    for v in range(VOCAB)] for j in range(ids.shape[1])] for row in history.tolist()]
+        return torch.tensor(scores), [history, history]
+
+class ToyGreedy:
+    """Stand-in for NeMo's greedy generator, decoding with next_token()"""
+
+    pad, eos, bos = PAD, EOS, BOS
+
+    def __init__(self, torch, max_length):
+        self.torch = torch
+        self.max_length = max_length
+        self.calls = 0
+
+    def _prepare_for_search(self, decoder_input_ids, encoder_states):
+        return decoder_input_ids, decoder_input_ids.shape[0], self.max_length
+
+    def __call__(self, encoder_hidden_states=None, encoder_input_mask=None, decoder_input_ids=None):
+        self.calls += 1
+        rows = decoder_input_ids.tolist()
+        done = [False] * len(rows)
+        for _ in range(self.max_length):
+            for row, finished in zip(rows, list(done)):
+                row.append(PAD if finished else next_token(row))
+            done = [finished or row[-1] == EOS for row, finished in zip(rows, done)]
+            if all(done):
+                break
+        return self.torch.tensor(rows), None
+
+def speculative_generator(torch, batch_size, draft_tokens, draft_agreement, max_length):
+    """SpeculativeGreedy over the toy decoders; torch is the tensor library (torch or NUMPY)"""
+    greedy = ToyGreedy(torch, max_length)
+    encoder = types.SimpleNamespace(encoded=(torch.zeros(batch_size, 3), torch.ones(batch_size, 3)))
+    generator = SpeculativeGreedy.__new__(SpeculativeGreedy)
+    generator.greedy = greedy
+    generator.target = ToyStack(torch)
+    generator.draft = ToyStack(torch, draft_agreement)
+    generator.draft_encoder = encoder
+    generator.draft_tokens = draft_tokens
+    generator.enabled = True
+    generator.stats = {"tokens": 0, "target_passes": 0, "draft_steps": 0, "accepted": 0}
+    return generator
+
+@pytest.mark.parametrize("batch_size", [1, 3])
+@pytest.mark.parametrize("draft_tokens", [1, 4])
+@pytest.mark.parametrize("draft_agreement", [0.0, 0.6, 1.0])
+@pytest.mark.parametrize("max_length", [0, 1, 5, 60])
+def test_output_is_the_targets_greedy_output(batch_size, draft_tokens, draft_agreement, max_length):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("nemo.collections.common.parts")
+    generator = speculative_generator(torch, batch_size, draft_tokens, draft_agreement, max_length)
+    for prompt_id in range(5):
+        prompt = torch.tensor([[BOS, 3 + prompt_id, 4, 5 + row] for row in range(batch_size)])
+        encoder_states = torch.zeros(batch_size, 3)
+        output = generator(encoder_hidden_states=encoder_states, encoder_input_mask=torch.ones(batch_size, 3),
+                           decoder_input_ids=prompt)[0]
+        expected = generator.greedy(encoder_states, None, prompt)[0]
+        assert output.tolist() == expected.tolist()
+
+def test_agreeing_draft_saves_target_passes():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("nemo.collections.common.parts")
+    generator = speculative_generator(torch, 1, 4, 1.0, 60)
+    for prompt_id in range(10):
+        prompt = torch.tensor([[BOS, 3 + prompt_id % 5, 4 + prompt_id, 5]])
+        generator(encoder_hidden_states=torch.zeros(1, 3), encoder_input_mask=torch.ones(1, 3),
+                  decoder_input_ids=prompt)
+    stats = generator.stats
+    # Each pass after the prompt's commits the four draft tokens and one of its own
+    assert stats["target_passes"] * 3 < stats["tokens"]
+    assert stats["accepted"] >= stats["tokens"] - stats["target_passes"]
+
+def test_accepted_is_the_shortest_matching_prefix_of_unfinished_rows():
+    draft = [[5, 6, 7, 8], [5, 6, 9, 9]]
+    assert accepted_tokens([[5, 6, 7, 8], [5, 6, 9, 9]], draft, [False, False]) == 4
+    assert accepted_tokens([[5, 6, 7, 3], [5, 6, 9, 9]], draft, [False, False]) == 3
+    assert accepted_tokens([[5, 6, 7, 8], [5, 4, 9, 9]], draft, [False, False]) == 1
+    assert accepted_tokens([[4, 6, 7, 8], [5, 6, 9, 9]], draft, [False, False]) == 0
+    # A match after a mismatch does not count
+    assert accepted_tokens([[5, 0, 7, 8]], [[5, 6, 7, 8]], [False]) == 1
+
+def test_finished_rows_do_not_limit_acceptance():
+    draft = [[5, 6, 7], [1, 1, 1]]
+    choices = [[5, 6, 7], [0, 0, 0]]
+    assert accepted_tokens(choices, draft, [False, True]) == 3
+    assert accepted_tokens(choices, draft, [True, True]) == 3
+    assert accepted_tokens([], [], []) == 0
+
+def test_disabled_or_unencoded_batches_use_the_wrapped_generator():
+    generator = speculative_generator(NUMPY, 2, 4, 1.0, 10)
+    prompt = np.array([[BOS, 3], [BOS, 4]])
+    expected = generator.greedy(None, None, prompt)[0]
+    generator.enabled = False
+    output = generator(encoder_hidden_states=np.zeros((2, 3)), encoder_input_mask=None, decoder_input_ids=prompt)
+    assert output[0].tolist() == expected.tolist()
+    generator.enabled = True
+    # The draft encoded a batch of another size
+    generator.draft_encoder.encoded = (np.zeros((1, 3)), np.ones((1, 3)))
+    generator(encoder_hidden_states=np.zeros((2, 3)), encoder_input_mask=None, decoder_input_ids=prompt)
+    # No audio was encoded by the draft at all
+    generator.draft_encoder.encoded = None
+    generator(encoder_hidden_states=np.zeros((2, 3)), encoder_input_mask=None, decoder_input_ids=prompt)
+    assert generator.greedy.calls == 4
+    assert generator.stats["target_passes"] == 0
+    # Only generated tokens count, not the prompt or the padding
+    generated = (expected[:, 2:] != PAD).sum()
+    assert generator.stats["tokens"] == 3 * generated
+
+def test_draft_must_share_the_tokenizer():
+    def model(vocab_size):
+        return types.SimpleNamespace(tokenizer=types.SimpleNamespace(vocab_size=vocab_size))
+
+    speculative._check_tokenizers(model(1024), model(1024))
+    with pytest.raises(ValueError, match="shared tokenizer"):
+        speculative._check_tokenizers(model(1024), model(512))
+
+def test_draft_encoder_runs_only_while_active():
+    calls = []
+    draft = types.SimpleNamespace(forward=lambda **kwargs: calls.append(kwargs) or (None, None, "states", "mask"))
+    encoder = DraftEncoder(lambda **kwargs: "outputs", draft, "draft")
+    assert encoder(input_signal="audio", input_signal_length=3) == "outputs"
+    assert encoder.encoded == ("states", "mask")
+
+    model = types.SimpleNamespace(forward=encoder)
+    speculative.disable(model)
+    assert encoder.encoded is None
+    encoder(input_signal="audio", input_signal_length=3)
+    assert encoder.encoded is None
+    assert len(calls) == 1
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
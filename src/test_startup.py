@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Startup budget for commands that never need the model.
+
+Each case runs an entry point in a fresh interpreter and checks that NeMo and
+torch were not imported and that the command finished within the budget
+(CANARY_STARTUP_BUDGET seconds, default 2.0). Run with pytest or directly.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+BUDGET = float(os.environ.get("CANARY_STARTUP_BUDGET", "2.0"))
+HEAVY_MODULES = ("nemo", "torch")
+
+# Runs the script as __main__ and reports what it imported and how long it took
+RUNNER = """
+import sys, json, time, runpy
+start = time.perf_counter()
+missing = None
+try:
+    sys.argv = {argv!r}
+    runpy.run_path(sys.argv[0], run_name="__main__")
+except SystemExit:
+    pass
+except ModuleNotFoundError as e:
+    missing = e.name
+elapsed = time.perf_counter() - start
+heavy = sorted({{m.split('.')[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"elapsed": elapsed, "heavy": heavy, "missing": missing}}))
+"""
+
+CASES = [
+    ("rtc_canary.py", ["--help"]),
+    ("rtc_canary.py", ["--list-devices"]),
+    ("improved-rtc.py", ["--list-devices"]),
+    ("simple_transcribe.py", ["--help"]),
+    ("simple_transcribe.py", ["/nonexistent.wav"]),
+    ("app.py", ["--help"]),
+    ("app.py", ["--audio", "/nonexistent.wav"]),
+    ("batch_process.py", ["--help"]),
+    ("batch_process.py", ["--audio-dir", "/nonexistent"]),
+    ("batch_process.py", ["--watch", "--audio-dir", "/nonexistent"]),
+    ("streaming-rtc.py", ["--help"]),
+    ("load_test.py", ["--help"]),
+    ("transcript_index.py", ["--help"]),
+    ("bench_speculative.py", ["--help"]),
+]
+
+def run_entry_point(script, args):
+    """Run an entry point in a fresh interpreter and return its report"""
+    argv = [os.path.join(SRC_DIR, script)] + args
+    code = RUNNER.format(argv=argv, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR,
+                          capture_output=True, text=True, timeout=60)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+@pytest.mark.parametrize("script,args", CASES)
+def test_startup_budget(script, args):
+    report = run_entry_point(script, args)
+
+    # A missing heavy module means the command tried to import it
+    if report["missing"] and report["missing"].split('.')[0] not in HEAVY_MODULES:
+        pytest.skip(f"{report['missing']} is not installed")
+
+    assert report["missing"] is None, f"{script} {args} imported {report['missing']}"
+    assert not report["heavy"], f"{script} {args} imported {report['heavy']}"
+    assert report["elapsed"] < BUDGET, f"{script} {args} took {report['elapsed']:.2f}s (budget {BUDGET}s)"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the transcript index: full-text search with filters and
+paging, history pages and sync of transcripts written before the index.
+Run with pytest or directly.
+"""
+
+import sys
+import sqlite3
+
+import pytest
+
+import canary_config
+from transcript_index import TranscriptIndex, default_path, fts_query
+
+def has_fts5():
+    db = sqlite3.connect(":memory:")
+    try:
+        db.execute("CREATE VIRTUAL TABLE t USING fts5(text)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        db.close()
+
+pytestmark = pytest.mark.skipif(not has_fts5(), reason="SQLite was built without FTS5")
+
+@pytest.fixture
+def index(tmp_path):
+    index = TranscriptIndex(str(tmp_path / "transcripts.db"))
+    yield index
+    index.close()
+
+def add_results(index, tmp_path, texts, name="result", **fields):
+    for i, text in enumerate(texts):
+        path = tmp_path / f"{name}_{i}.txt"
+        path.write_text(text)
+        index.add_result(str(path), text, **fields)
+
+def test_fts_query_quotes_words_and_keeps_prefixes():
+    assert fts_query('quarterly "results" NEAR rev*') == '"quarterly" """results""" "NEAR" "rev"*'
+    assert fts_query("  ") == ""
+
+def test_search_matches_every_word(index, tmp_path):
+    add_results(index, tmp_path, ["the quarterly results are in", "quarterly planning", "results only"],
+                task="asr", source_lang="en", target_lang="en")
+    hits = index.search("quarterly results")
+    assert [hit["text"] for hit in hits] == ["the quarterly results are in"]
+    assert "[quarterly]" in hits[0]["snippet"]
+    assert {hit["text"] for hit in index.search("quart*")} == {"the quarterly results are in", "quarterly planning"}
+    assert index.search("") == []
+
+def test_search_filters_by_language_and_kind(index, tmp_path):
+    add_results(index, tmp_path, ["morning radio, guten morgen"], "asr", task="asr", source_lang="de",
+                target_lang="de")
+    add_results(index, tmp_path, ["good morning"], "translation", task="s2t_translation", source_lang="de",
+                target_lang="en")
+    session = tmp_path / "session.txt"
+    session.write_text("morning meeting")
+    index.add_session(str(session), {"session_id": "s1", "source_lang": "en"},
+                      [{"index": 0, "start": 0.0, "end": 2.0, "text": "morning meeting"}])
+
+    assert len(index.search("morning*")) == 3
+    assert [hit["text"] for hit in index.search("morning*", lang="de", task="asr")] == ["morning radio, guten morgen"]
+    hits = index.search("morning", kind="session")
+    assert [(hit["session_id"], hit["start"]) for hit in hits] == [("s1", 0.0)]
+
+def test_search_pages_through_the_hits(index, tmp_path):
+    add_results(index, tmp_path, [f"report number {i}" for i in range(7)], source_lang="en")
+    pages = [index.search("report", limit=3, offset=offset) for offset in (0, 3, 6)]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    texts = [hit["text"] for page in pages for hit in page]
+    assert len(set(texts)) == 7
+    # Most recently indexed first
+    assert texts[0] == "report number 6"
+    assert len(index.search("report", limit=3, order="relevance")) == 3
+    with pytest.raises(ValueError):
+        index.search("report", order="oldest")
+
+def test_history_pages_do_not_overlap(index, tmp_path):
+    add_results(index, tmp_path, [f"text {i}" for i in range(5)], source_lang="en")
+    seen = []
+    before = None
+    while True:
+        documents, before = index.history(limit=2, before=before)
+        seen += [document["id"] for document in documents]
+        if before is None:
+            break
+    assert len(seen) == len(set(seen)) == 5
+
+def test_reindexing_a_path_replaces_it(index, tmp_path):
+    path = tmp_path / "a_en_transcription.txt"
+    path.write_text("old words")
+    index.add_result(str(path), "old words")
+    path.write_text("new words")
+    index.add_result(str(path), "new words")
+    assert index.search("old") == []
+    assert len(index.search("new")) == 1
+
+def test_sync_adds_missing_results_once(index, tmp_path):
+    results = tmp_path / "out"
+    results.mkdir()
+    (results / "talk_en_to_de.txt").write_text("guten tag")
+    (results / "all_results_20240101_000000.txt").write_text("guten tag")
+    assert index.sync(str(tmp_path)) == 1
+    assert index.sync(str(tmp_path)) == 0
+    hit, = index.search("guten")
+    assert (hit["task"], hit["source_lang"], hit["target_lang"]) == ("s2t_translation", "en", "de")
+
+def test_default_path_follows_the_output_dir_the_writers_use(monkeypatch):
+    monkeypatch.setattr(canary_config, "_config", {"paths": {"output_dir": "/data/out"}})
+    assert default_path() == "/data/out/transcripts.db"
+    monkeypatch.setattr(canary_config, "_config", {"paths": {"output_dir": "/data/out", "transcript_index": ""}})
+    assert default_path() is None
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the transcript journal: segments written as they come are
+assembled into the .txt, .json and per-speaker transcripts, also from a
+journal cut short by a crash. Run with pytest or directly.
+"""
+
+import os
+import sys
+import json
+
+import pytest
+
+import transcript_journal
+from transcript_journal import TranscriptJournal, assemble, JOURNAL_SUFFIX
+
+@pytest.fixture(autouse=True)
+def no_index(monkeypatch):
+    indexed = []
+    monkeypatch.setattr(transcript_journal, "index_session",
+                        lambda path, metadata, segments: indexed.append((path, metadata, list(segments))))
+    return indexed
+
+def test_finish_assembles_the_transcript(tmp_path, no_index):
+    basename = str(tmp_path / "session")
+    journal = TranscriptJournal(basename, metadata={"session_id": "s1", "source_lang": "en"}, fsync_every=1)
+    journal.append("Hello there.", 0.0, 2.0)
+    journal.append("Second part.", 2.0, 4.0, chunk_index=1)
+    txt_path = journal.finish()
+
+    assert txt_path == basename + ".txt"
+    with open(txt_path) as f:
+        assert f.read() == "Hello there.\nSecond part."
+    with open(basename + ".json") as f:
+        session = json.load(f)
+    assert session["metadata"]["session_id"] == "s1"
+    assert [s["text"] for s in session["segments"]] == ["Hello there.", "Second part."]
+    assert session["segments"][1]["start"] == 2.0 and session["segments"][1]["chunk_index"] == 1
+    assert not os.path.exists(basename + JOURNAL_SUFFIX)
+    assert [s["text"] for s in no_index[0][2]] == ["Hello there.", "Second part."]
+
+def test_speakers_get_their_own_transcripts(tmp_path):
+    basename = str(tmp_path / "meeting")
+    journal = TranscriptJournal(basename)
+    journal.append("Good morning.", 0.0, 1.0, speaker="Speaker 1")
+    journal.append("Hi.", 1.0, 2.0, speaker="Speaker 2")
+    journal.append("Shall we start?", 2.0, 3.0, speaker="Speaker 1")
+    journal.finish()
+
+    with open(basename + ".txt") as f:
+        assert f.read() == "Speaker 1: Good morning.\nSpeaker 2: Hi.\nSpeaker 1: Shall we start?"
+    with open(basename + ".speaker_1.txt") as f:
+        assert f.read() == "Good morning.\nShall we start?\n"
+    with open(basename + ".speaker_2.txt") as f:
+        assert f.read() == "Hi.\n"
+
+def test_assemble_skips_a_line_cut_short_by_a_crash(tmp_path):
+    basename = str(tmp_path / "crashed")
+    journal = TranscriptJournal(basename)
+    journal.append("Kept.", 0.0, 1.0)
+    journal.close()
+    with open(basename + JOURNAL_SUFFIX, "a") as f:
+        f.write('{"index": 1, "text": "Lo')
+
+    txt_path = assemble(basename + JOURNAL_SUFFIX)
+    with open(txt_path) as f:
+        assert f.read() == "Kept."
+    with open(basename + ".json") as f:
+        assert len(json.load(f)["segments"]) == 1
+
+def test_empty_journal_leaves_nothing_behind(tmp_path):
+    basename = str(tmp_path / "empty")
+    assert TranscriptJournal(basename).finish() is None
+    assert os.listdir(tmp_path) == []
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
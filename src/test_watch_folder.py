@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Behaviour of the watch folder when a batch fails: files the decoder cannot
+read are recorded as failed, any other failure is retried later and never
+recorded. Run with pytest or directly.
+"""
+
+import sys
+
+import numpy as np
+import pytest
+
+sf = pytest.importorskip("soundfile")
+
+import watch_folder
+from watch_folder import FolderWatcher, undecodable
+
+PROMPT = ("asr", "en", "en", "yes")
+
+class FlakyBackend:
+    """Fails the first `outages` calls, and every call with an unreadable file"""
+
+    def __init__(self, outages=0):
+        self.outages = outages
+        self.calls = []
+
+    def transcribe(self, audio, taskname="asr", source_lang="en", target_lang="en", pnc="yes", batch_size=1):
+        self.calls.append(list(audio))
+        if self.outages:
+            self.outages -= 1
+            raise ConnectionError("daemon went away")
+        for path in audio:
+            sf.info(path)
+        return [f"text of {path}" for path in audio]
+
+@pytest.fixture(autouse=True)
+def no_index(monkeypatch):
+    monkeypatch.setattr(watch_folder, "index_result", lambda *args, **kwargs: None)
+
+@pytest.fixture
+def folder(tmp_path):
+    watched = tmp_path / "in"
+    watched.mkdir()
+    for name in ("a.wav", "b.wav"):
+        sf.write(str(watched / name), np.zeros(1600, dtype=np.float32), 16000)
+    (watched / "bad.wav").write_bytes(b"not audio")
+    return watched
+
+def watcher_for(folder, tmp_path, backend):
+    watcher = FolderWatcher({str(folder): PROMPT}, str(tmp_path / "out"), backend, batch_size=4,
+                            settle=0, max_wait=0, poll_interval=1)
+    watcher.scan(str(folder))
+    watcher.settle_pending()
+    return watcher
+
+def statuses(watcher):
+    return {path.rsplit("/", 1)[1]: entry["status"] for path, entry in watcher.ledger.entries.items()}
+
+def test_undecodable_tells_unreadable_files(folder):
+    assert undecodable(str(folder / "bad.wav"))
+    assert not undecodable(str(folder / "a.wav"))
+    # soundfile does not read m4a; it is up to the model
+    (folder / "c.m4a").write_bytes(b"not audio")
+    assert not undecodable(str(folder / "c.m4a"))
+
+def test_bad_file_is_recorded_and_the_rest_of_its_batch_processed(folder, tmp_path):
+    watcher = watcher_for(folder, tmp_path, FlakyBackend())
+    watcher.flush()
+    assert statuses(watcher) == {"a.wav": "done", "b.wav": "done", "bad.wav": "error"}
+    assert not watcher.deferred
+
+def test_transient_failure_is_retried_with_backoff_and_not_recorded(folder, tmp_path, monkeypatch):
+    (folder / "bad.wav").unlink()
+    backend = FlakyBackend(outages=3)
+    watcher = watcher_for(folder, tmp_path, backend)
+    watcher.flush()
+    # The batch and then each file alone failed
+    assert statuses(watcher) == {}
+    assert set(watcher.deferred) == {str(folder / "a.wav"), str(folder / "b.wav")}
+    assert watcher.failures == {str(folder / "a.wav"): 1, str(folder / "b.wav"): 1}
+
+    # Not due yet, and a rescan does not bypass the delay
+    watcher.scan(str(folder))
+    assert not watcher.pending
+    watcher.flush()
+    assert len(backend.calls) == 3
+
+    now = watch_folder.time.monotonic()
+    monkeypatch.setattr(watch_folder.time, "monotonic", lambda: now + watch_folder.RETRY_DELAY)
+    watcher.flush()
+    assert statuses(watcher) == {"a.wav": "done", "b.wav": "done"}
+    assert not watcher.deferred and not watcher.failures
+
+def test_retry_delay_doubles(folder, tmp_path, monkeypatch):
+    (folder / "bad.wav").unlink()
+    (folder / "b.wav").unlink()
+    watcher = watcher_for(folder, tmp_path, FlakyBackend(outages=2))
+    path = str(folder / "a.wav")
+    start = watch_folder.time.monotonic()
+    monkeypatch.setattr(watch_folder.time, "monotonic", lambda: start)
+    watcher.flush()
+    assert watcher.deferred[path][3] == start + watch_folder.RETRY_DELAY
+
+    monkeypatch.setattr(watch_folder.time, "monotonic", lambda: start + watch_folder.RETRY_DELAY)
+    watcher.flush()
+    assert watcher.failures[path] == 2
+    assert watcher.deferred[path][3] == start + 3 * watch_folder.RETRY_DELAY
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
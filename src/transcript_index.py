@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Full-text index over the transcripts directory.
+
+Transcripts are added to a SQLite database (FTS5) as they are written: live
+sessions when their journal is assembled, batch results as each file is
+saved. Every document records where it came from (session or audio file),
+task and languages; live sessions are indexed per segment with its position
+in the stream, so a hit points at the moment it was said.
+
+    documents      one row per transcript file
+    segments       its text, one row per segment (one per file for batch results)
+    segments_fts   FTS5 index over segments.text
+
+The database lives at paths.transcript_index (default: transcripts.db in
+paths.output_dir); set it to an empty string to turn indexing off. Writes
+from several processes are serialized by SQLite; an indexing failure is
+reported and never fails the transcription that triggered it.
+
+Transcripts written before the index existed are added with --sync (by
+default from paths.output_dir, where every writer puts its transcripts):
+
+    python transcript_index.py --sync
+    python transcript_index.py "quarterly results" --lang en
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+
+import canary_config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    source_file TEXT,
+    task TEXT,
+    source_lang TEXT,
+    target_lang TEXT,
+    created REAL NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    segment_count INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_created ON documents (created, id);
+CREATE INDEX IF NOT EXISTS documents_session ON documents (session_id);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    start REAL,
+    end REAL,
+    speaker TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_document ON segments (document_id, idx);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5 (
+    text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+# Batch outputs: <stem>_<src>_transcription.txt or <stem>_<src>_to_<tgt>.txt,
+# with a _YYYYmmdd_HHMMSS suffix when written by app.py --save
+RESULT_NAME = re.compile(r"^(?P<stem>.+)_(?P<source>[a-z]{2})_(?:transcription|to_(?P<target>[a-z]{2}))"
+                         r"(?:_\d{8}_\d{6})?\.txt$")
+DOCUMENT_FIELDS = ("id", "path", "kind", "session_id", "source_file", "task", "source_lang", "target_lang",
+                   "created", "segment_count")
+
+def default_path():
+    """Index location from the config, or None if indexing is turned off"""
+    output_dir = canary_config.get("paths", "output_dir")
+    return canary_config.get("paths", "transcript_index", os.path.join(output_dir, "transcripts.db")) or None
+
+def fts_query(text):
+    """
+    Turn user input into an FTS5 query: every word must match
+
+    Words are quoted so punctuation and FTS operators in the input are taken
+    literally; a trailing * keeps prefix matching.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+class TranscriptIndex:
+    def __init__(self, path=None):
+        """
+        Open (and create) an index
+
+        Args:
+            path: Database file (default: see default_path())
+        """
+        self.path = path or default_path()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        with self.db:
+            self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _replace(self, path, kind, segments, fields):
+        """Insert a document and its segments, replacing an earlier version; caller holds the lock"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            size, mtime = None, None
+        fields.setdefault("created", mtime or time.time())
+        with self.db:
+            self.db.execute("DELETE FROM documents WHERE path = ?", (path,))
+            cursor = self.db.execute(
+                "INSERT INTO documents (path, kind, session_id, source_file, task, source_lang, target_lang, "
+                "created, size, mtime, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, kind, fields.get("session_id"), fields.get("source_file"), fields.get("task"),
+                 fields.get("source_lang"), fields.get("target_lang"), fields["created"], size, mtime,
+                 json.dumps(fields.get("metadata")) if fields.get("metadata") else None))
+            document_id = cursor.lastrowid
+            count = 0
+            for segment in segments:
+                if not segment.get("text"):
+                    continue
+                self.db.execute(
+                    "INSERT INTO segments (document_id, idx, start, end, speaker, text) VALUES (?, ?, ?, ?, ?, ?)",
+                    (document_id, segment.get("index", count), segment.get("start"), segment.get("end"),
+                     segment.get("speaker"), segment["text"]))
+                count += 1
+            self.db.execute("UPDATE documents SET segment_count = ? WHERE id = ?", (count, document_id))
+        return document_id
+
+    def add_session(self, path, metadata, segments):
+        """
+        Index a live-session transcript
+
+        Args:
+            path: The assembled .txt
+            metadata: Session metadata from its journal
+            segments: Iterable of journal segments (text, start, end, index, speaker)
+        """
+        from canary_model import taskname_for
+        source_lang = metadata.get("source_lang")
+        target_lang = metadata.get("target_lang") or source_lang
+        with self.lock:
+            return self._replace(path, "session", segments, {
+                "session_id": metadata.get("session_id"),
+                # Each language of a session has its own transcript, so the task follows from the pair
+                "task": taskname_for(source_lang, target_lang) if source_lang else None,
+                "source_lang": source_lang,
+                "target_lang": target_lang,
+                "metadata": metadata
+            })
+
+    def add_result(self, path, text, source_file=None, task=None, source_lang=None, target_lang=None):
+        """Index a batch result: the text of one audio file"""
+        with self.lock:
+            return self._replace(path, "file", [{"index": 0, "text": text}], {
+                "source_file": os.path.abspath(source_file) if source_file else None,
+                "task": task,
+                "source_lang": source_lang,
+                "target_lang": target_lang
+            })
+
+    @staticmethod
+    def _filters(lang=None, task=None, kind=None, since=None, until=None):
+        clauses, params = [], []
+        if lang:
+            clauses.append("(d.source_lang = ? OR d.target_lang = ?)")
+            params += [lang, lang]
+        for column, value in (("d.task", task), ("d.kind", kind)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("d.created >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("d.created < ?")
+            params.append(until)
+        return clauses, params
+
+    def search(self, query, limit=20, offset=0, order="recent", **filters):
+        """
+        Segments matching every word of query
+
+        Args:
+            query: Words to find (a trailing * matches a prefix)
+            limit, offset: Page of hits
+            order: recent (most recently indexed first) or relevance (bm25). Recent
+                   reads only as many matches as the page needs; relevance scores
+                   every match, which is slower for words found in most transcripts
+            filters: lang, task, kind (session or file), since, until (epoch seconds)
+
+        Returns:
+            List of hits: the document fields plus segment index, start, end,
+            speaker, text and a snippet with the matches in [brackets]
+        """
+        if order not in ("recent", "relevance"):
+            raise ValueError(f"Unknown order: {order}")
+        match = fts_query(query)
+        if not match:
+            return []
+        clauses, params = self._filters(**filters)
+        where = "".join(f" AND {clause}" for clause in clauses)
+        fields = ", ".join(f"d.{field}" for field in DOCUMENT_FIELDS)
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT {fields}, s.idx AS segment, s.start, s.end, s.speaker, s.text, "
+                f"snippet(segments_fts, 0, '[', ']', '…', 16) AS snippet "
+                f"FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+                f"JOIN documents d ON d.id = s.document_id "
+                f"WHERE segments_fts MATCH ?{where} "
+                f"ORDER BY {'rank' if order == 'relevance' else 'segments_fts.rowid DESC'} LIMIT ? OFFSET ?",
+                [match, *params, limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def history(self, limit=20, before=None, **filters):
+        """
+        Documents, newest first, one page at a time
+
+        Args:
+            limit: Documents per page
+            before: id of the last document of the previous page (None for the first page)
+            filters: As for search()
+
+        Returns:
+            (documents, next) where next is the before value of the following page, or None
+        """
+        clauses, params = self._filters(**filters)
+        if before is not None:
+            clauses.append("(d.created, d.id) < (SELECT created, id FROM documents WHERE id = ?)")
+            params.append(before)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        fields = ", ".join(f"d.{field}" for field in DOCUMENT_FIELDS)
+        with self.lock:
+            rows = self.db.execute(f"SELECT {fields} FROM documents d{where} "
+                                   f"ORDER BY d.created DESC, d.id DESC LIMIT ?", [*params, limit + 1]).fetchall()
+        documents = [dict(row) for row in rows[:limit]]
+        return documents, (documents[-1]["id"] if len(rows) > limit else None)
+
+    def document(self, document_id, limit=100, offset=0):
+        """A document's fields and metadata with one page of its segments, or None"""
+        with self.lock:
+            row = self.db.execute(f"SELECT {', '.join(DOCUMENT_FIELDS)}, metadata FROM documents WHERE id = ?",
+                                  (document_id,)).fetchone()
+            if row is None:
+                return None
+            segments = self.db.execute("SELECT idx AS segment, start, end, speaker, text FROM segments "
+                                       "WHERE document_id = ? ORDER BY idx LIMIT ? OFFSET ?",
+                                       (document_id, limit, offset)).fetchall()
+        document = dict(row)
+        document["metadata"] = json.loads(document["metadata"]) if document["metadata"] else None
+        document["segments"] = [dict(segment) for segment in segments]
+        return document
+
+    def indexed(self, path, size, mtime):
+        """True if path is indexed at this size and mtime"""
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime FROM documents WHERE path = ?",
+                                  (os.path.abspath(path),)).fetchone()
+        return row is not None and (row["size"], row["mtime"]) == (size, mtime)
+
+    def sync(self, directory):
+        """
+        Add transcripts under directory that are missing or changed since they were indexed
+
+        Session transcripts are read from their .json; batch results from
+        their .txt, with task and languages taken from the file name.
+        Aggregate all_results files and per-speaker copies are skipped.
+
+        Returns:
+            Number of documents added or updated
+        """
+        from transcript_journal import JOURNAL_SUFFIX
+        added = 0
+        for root, _, files in os.walk(directory):
+            names = set(files)
+            for name in files:
+                if not name.endswith(".txt") or name.startswith("all_results_"):
+                    continue
+                path = os.path.join(root, name)
+                base = name[:-len(".txt")]
+                # A session transcript has a .json next to it; a speaker copy is <basename>.<speaker>.txt
+                if base.rpartition(".")[0] + ".json" in names or base + JOURNAL_SUFFIX in names:
+                    continue
+                stat = os.stat(path)
+                if self.indexed(path, stat.st_size, stat.st_mtime):
+                    continue
+                try:
+                    if base + ".json" in names:
+                        with open(os.path.join(root, base + ".json")) as f:
+                            session = json.load(f)
+                        self.add_session(path, session.get("metadata", {}), session.get("segments", []))
+                    else:
+                        match = RESULT_NAME.match(name)
+                        with open(path) as f:
+                            text = f.read()
+                        source_lang = match.group("source") if match else None
+                        target_lang = (match.group("target") or source_lang) if match else None
+                        task = None
+                        if match:
+                            task = "asr" if source_lang == target_lang else "s2t_translation"
+                        self.add_result(path, text, task=task, source_lang=source_lang, target_lang=target_lang)
+                    added += 1
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {path} ({e})")
+        return added
+
+_default = None
+_default_lock = threading.Lock()
+
+def default_index():
+    """The shared index of this process, or None if indexing is off or unavailable"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            path = default_path()
+            if not path:
+                return None
+            try:
+                _default = TranscriptIndex(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Transcript index unavailable ({e})")
+                _default = False
+        return _default or None
+
+def index_session(path, metadata, segments):
+    """Add a live-session transcript to the default index; failures are reported, not raised"""
+    index = default_index()
+    if index is not None:
+        try:
+            index.add_session(path, metadata, segments)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not index {path} ({e})")
+
+def index_result(path, text, source_file=None, task=None, source_lang=None, target_lang=None):
+    """Add a batch result to the default index; failures are reported, not raised"""
+    index = default_index()
+    if index is not None:
+        try:
+            index.add_result(path, text, source_file, task, source_lang, target_lang)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Could not index {path} ({e})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the transcript index")
+    parser.add_argument("query", type=str, nargs="*", help="Words to find")
+    parser.add_argument("--index", type=str, default=None, help="Index database (default: paths.transcript_index)")
+    parser.add_argument("--sync", type=str, metavar="DIR", nargs="?", default=None,
+                        const=canary_config.get("paths", "output_dir"),
+                        help="First add transcripts under DIR (default: paths.output_dir) that are not indexed yet")
+    parser.add_argument("--lang", type=str, default=None, help="Only transcripts in or from this language")
+    parser.add_argument("--task", choices=["asr", "s2t_translation"], default=None, help="Only this task")
+    parser.add_argument("--limit", type=int, default=20, help="Number of hits")
+
+    args = parser.parse_args()
+
+    path = args.index or default_path()
+    if not path:
+        parser.error("Indexing is turned off (paths.transcript_index is empty); pass --index")
+    index = TranscriptIndex(path)
+
+    if args.sync:
+        start = time.time()
+        added = index.sync(args.sync)
+        print(f"Indexed {added} transcript{'s' if added != 1 else ''} in {time.time() - start:.1f}s")
+
+    if args.query:
+        start = time.perf_counter()
+        hits = index.search(" ".join(args.query), limit=args.limit, lang=args.lang, task=args.task)
+        took = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            position = f" @ {hit['start']:.1f}s" if hit["start"] is not None else ""
+            print(f"{hit['path']}{position}\n    {hit['snippet']}")
+        print(f"{len(hits)} hit{'s' if len(hits) != 1 else ''} in {took:.1f} ms")
+    elif not args.sync:
+        parser.error("Give a query, --sync DIR, or both")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Append-only transcript journal for live sessions.
+
+Each finalized segment is appended to a JSONL journal as soon as it is
+produced, with its position in the audio stream. Writes are flushed to the
+OS per segment (so a crashed process loses nothing) and fsynced in batches
+(so a crashed host loses at most a few seconds). Only a short tail of
+recent segments is kept in memory; the final .txt/.json are assembled from
+the journal in one streaming pass.
+
+A journal left behind by a crash can be assembled by hand:
+
+    python transcript_journal.py /workspace/transcripts/<name>.journal.jsonl
+"""
+
+import os
+import json
+import time
+import argparse
+import datetime
+import collections
+
+from transcript_index import index_session
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+class TranscriptJournal:
+    def __init__(self, basename, metadata=None, tail_size=50, fsync_every=20, fsync_interval=5.0):
+        """
+        Initialize TranscriptJournal
+
+        Args:
+            basename: Output path without extension; the journal is basename + .journal.jsonl
+            metadata: Session details written as the first journal line and into the JSON output
+            tail_size: Number of recent segments kept in memory
+            fsync_every: fsync after this many segments...
+            fsync_interval: ...or after this many seconds, whichever comes first
+        """
+        self.basename = basename
+        self.path = basename + JOURNAL_SUFFIX
+        self.tail = collections.deque(maxlen=tail_size)
+        self.count = 0
+        self.word_count = 0
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.last_fsync = time.monotonic()
+        self.closed = False
+
+        self.file = open(self.path, 'a')
+        self.file.write(json.dumps({"metadata": metadata or {}}) + '\n')
+        self.file.flush()
+
+    def append(self, text, start, end, **extra):
+        """
+        Record a finalized segment
+
+        Args:
+            text: Segment text
+            start: Start of the segment in the audio stream, in seconds
+            end: End of the segment in the audio stream, in seconds
+            extra: Additional fields stored with the segment
+        """
+        segment = {
+            "index": self.count,
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "text": text,
+            **extra
+        }
+        self.file.write(json.dumps(segment) + '\n')
+        self.file.flush()
+
+        self.count += 1
+        self.word_count += len(text.split())
+        self.tail.append(text)
+
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.unsynced:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+        self.last_fsync = time.monotonic()
+
+    def close(self):
+        if not self.closed:
+            self.sync()
+            self.file.close()
+            self.closed = True
+
+    def finish(self, keep_journal=False):
+        """
+        Close the journal and assemble basename.txt and basename.json from it
+
+        Returns:
+            Path of the .txt file, or None if no segment was recorded
+        """
+        self.close()
+        if self.count == 0:
+            os.remove(self.path)
+            return None
+        txt_path = assemble(self.path, self.basename)
+        if not keep_journal:
+            os.remove(self.path)
+        return txt_path
+
+def read_journal(path):
+    """
+    Stream (metadata, segments) from a journal
+
+    A last line cut short by a crash is skipped.
+    """
+    f = open(path)
+    metadata = {}
+    first = f.readline()
+    if first:
+        metadata = json.loads(first).get("metadata", {})
+
+    def segments():
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    return metadata, segments()
+
+def speaker_path(basename, speaker):
+    """Per-speaker transcript path, e.g. basename.speaker_1.txt"""
+    slug = "".join(ch if ch.isalnum() else "_" for ch in speaker.lower()).strip("_")
+    return f"{basename}.{slug or 'speaker'}.txt"
+
+def assemble(journal_path, basename=None):
+    """
+    Write basename.txt and basename.json from a journal in one pass; returns the .txt path
+
+    Segments tagged with a speaker are written as "speaker: text" in the
+    merged transcript, and each speaker also gets basename.<speaker>.txt.
+    The transcript is then added to the search index (see transcript_index.py).
+    """
+    if basename is None:
+        basename = journal_path[:-len(JOURNAL_SUFFIX)] if journal_path.endswith(JOURNAL_SUFFIX) else journal_path
+    txt_path = basename + ".txt"
+    json_path = basename + ".json"
+    metadata, segments = read_journal(journal_path)
+    speakers = {}
+
+    try:
+        with open(txt_path + ".tmp", 'w') as txt, open(json_path + ".tmp", 'w') as js:
+            js.write('{"metadata": ' + json.dumps(metadata) + ', "segments": [')
+            for i, segment in enumerate(segments):
+                if i:
+                    txt.write("\n")
+                    js.write(",")
+                speaker = segment.get("speaker")
+                if speaker:
+                    txt.write(f"{speaker}: {segment['text']}")
+                    if speaker not in speakers:
+                        path = speaker_path(basename, speaker)
+                        speakers[speaker] = (path, open(path + ".tmp", 'w'))
+                    speakers[speaker][1].write(segment["text"] + "\n")
+                else:
+                    txt.write(segment["text"])
+                js.write("\n  " + json.dumps(segment))
+            js.write("\n]}\n")
+    finally:
+        for _, f in speakers.values():
+            f.close()
+    for path, _ in speakers.values():
+        os.replace(path + ".tmp", path)
+    os.replace(txt_path + ".tmp", txt_path)
+    os.replace(json_path + ".tmp", json_path)
+    index_session(txt_path, metadata, read_journal(journal_path)[1])
+    return txt_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Assemble a transcript from a live-session journal")
+    parser.add_argument("journal", type=str, help="Path to a .journal.jsonl file")
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.journal):
+        parser.error(f"Journal not found: {args.journal}")
+
+    txt_path = assemble(args.journal)
+    print(f"Transcript saved to {txt_path}")
+
+if __name__ == "__main__":
+    main()
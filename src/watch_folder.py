@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Watch-folder mode for batch_process.py.
+
+Directories are watched with inotify, so a new file is noticed as soon as it
+is written or moved in, without re-scanning the tree. A file is picked up once
+it is stable: its size and mtime have not changed for settle seconds (a copy
+over SMB or NFS may close and reopen the file several times). Stable files are
+grouped into micro-batches by prompt and duration bucket, so a batch never
+mixes tasks or pads a short clip to the length of a long one, and run on one
+warm backend.
+
+Results are written like batch_process.py's per-file outputs, mirroring the
+watched subdirectories, and every processed file is appended to a JSONL
+ledger in the output directory. The ledger is keyed by path, size and mtime:
+after a restart only files that are new or changed since are processed. A
+file the decoder cannot read is recorded as failed and retried when it
+changes; any other failure (the daemon went away, the GPU ran out of memory)
+is not recorded, and the file is retried with an increasing delay instead.
+
+Where inotify is unavailable (not Linux, or too few watches) the directories
+are re-scanned every poll_interval seconds instead.
+"""
+
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import datetime
+from pathlib import Path
+
+from adaptive_batch import bucket_for
+from batch_workers import audio_duration
+from canary_model import taskname_for
+from transcript_index import index_result
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg', '.m4a')
+LEDGER_FILE = "processed.jsonl"
+# Delay before retrying a file after a failure that was not its own, doubled per failure
+RETRY_DELAY = 5.0
+RETRY_MAX_DELAY = 600.0
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """Minimal inotify binding over libc; raises OSError where it is unavailable"""
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+        # Watch descriptor -> directory
+        self.watches = {}
+
+    def add_watch(self, directory, mask=WATCH_MASK):
+        wd = self._add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self.watches[wd] = directory
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds for events
+
+        Returns:
+            List of (mask, path) pairs; path is None for a queue overflow
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_IGNORED:
+                # The directory was removed or unmounted
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_Q_OVERFLOW:
+                events.append((mask, None))
+            elif directory is not None and name:
+                events.append((mask, os.path.join(directory, os.fsdecode(name))))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def parse_watch_spec(spec, default_prompt):
+    """
+    Split "DIR" or "DIR=task:source:target" into (directory, prompt)
+
+    The prompt is a (taskname, source_lang, target_lang, pnc) tuple; task is
+    asr or translation as on the command line.
+    """
+    directory, _, override = spec.partition("=")
+    if not override:
+        return directory, default_prompt
+    parts = override.split(":")
+    if len(parts) != 3 or parts[0] not in ("asr", "translation"):
+        raise ValueError(f"Expected DIR=task:source:target, got {spec}")
+    task, source_lang, target_lang = parts
+    if task == "asr":
+        target_lang = source_lang
+    return directory, (taskname_for(source_lang, target_lang), source_lang, target_lang, default_prompt[3])
+
+def undecodable(path):
+    """True if soundfile reads files of this type but cannot open this one"""
+    try:
+        import soundfile as sf
+    except ImportError:
+        return False
+    if Path(path).suffix[1:].upper() not in sf.available_formats():
+        # Left to the model's own loader; there is no telling
+        return False
+    try:
+        sf.info(path)
+    except Exception:
+        return True
+    return False
+
+def result_filename(path, taskname, source_lang, target_lang):
+    """Per-file output name, as batch_process.py writes it"""
+    stem = Path(path).stem
+    if taskname == "asr":
+        return f"{stem}_{source_lang}_transcription.txt"
+    return f"{stem}_{source_lang}_to_{target_lang}.txt"
+
+class Ledger:
+    """Append-only JSONL record of processed files, loaded once at startup"""
+
+    def __init__(self, path):
+        self.path = path
+        # Path -> latest entry
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by a crash
+                    self.entries[entry["path"]] = entry
+
+    def seen(self, path, size, mtime):
+        """True if path was already processed (or failed) at this size and mtime"""
+        entry = self.entries.get(path)
+        return entry is not None and entry["size"] == size and entry["mtime"] == mtime
+
+    def record(self, path, size, mtime, **fields):
+        entry = {"path": path, "size": size, "mtime": mtime,
+                 "time": datetime.datetime.now().isoformat(timespec="seconds"), **fields}
+        self.entries[path] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+class FolderWatcher:
+    def __init__(self, roots, output_dir, backend, batch_size=4, settle=2.0, max_wait=2.0,
+                 poll_interval=None):
+        """
+        Initialize FolderWatcher
+
+        Args:
+            roots: Dict of directory -> (taskname, source_lang, target_lang, pnc)
+            output_dir: Directory for the results and the ledger
+            backend: Loaded backend (see backends.py or canary_daemon.RemoteModel)
+            batch_size: Largest micro-batch
+            settle: Seconds a file's size and mtime must stay unchanged before it is processed
+            max_wait: Longest a stable file waits for its micro-batch to fill, in seconds
+            poll_interval: Re-scan every this many seconds instead of using inotify
+        """
+        self.roots = {os.path.abspath(directory): prompt for directory, prompt in roots.items()}
+        self.output_dir = output_dir
+        self.backend = backend
+        self.batch_size = batch_size
+        self.settle = settle
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        os.makedirs(output_dir, exist_ok=True)
+        self.ledger = Ledger(os.path.join(output_dir, LEDGER_FILE))
+        # Files seen but not yet stable: path -> (size, mtime, monotonic time of the last change)
+        self.pending = {}
+        # Stable files waiting for their batch: (prompt, bucket) -> [(path, size, mtime, ready time)]
+        self.batches = {}
+        # Path -> (batch key, size, mtime) of the files in self.batches
+        self.queued = {}
+        # Files waiting to be retried after a failure: path -> (batch key, size, mtime, monotonic due time)
+        self.deferred = {}
+        # Path -> failures in a row of the files in self.deferred
+        self.failures = {}
+        self.inotify = None
+
+    def root_of(self, path):
+        """Innermost watched directory that path lives under"""
+        matches = [root for root in self.roots if path == root or path.startswith(root + os.sep)]
+        return max(matches, key=len) if matches else None
+
+    def notice(self, path):
+        """A file may have changed; (re)start its settle timer"""
+        if not path.lower().endswith(AUDIO_EXTENSIONS) or os.path.basename(path).startswith("."):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        if self.ledger.seen(path, stat.st_size, stat.st_mtime):
+            return
+        if path in self.queued and self.queued[path][1:] == (stat.st_size, stat.st_mtime):
+            return
+        if path in self.deferred and self.deferred[path][1:3] == (stat.st_size, stat.st_mtime):
+            return
+        previous = self.pending.get(path)
+        if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+            self.pending[path] = (stat.st_size, stat.st_mtime, time.monotonic())
+
+    def scan(self, directory):
+        """Notice every file under directory, watching subdirectories with inotify"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            if self.inotify is not None:
+                try:
+                    self.inotify.add_watch(current)
+                except OSError as e:
+                    print(f"Cannot watch {current} ({e})")
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            self.notice(entry.path)
+            except OSError as e:
+                print(f"Cannot read {current} ({e})")
+
+    def settle_pending(self):
+        """Move files whose size and mtime held still for settle seconds into their batch"""
+        now = time.monotonic()
+        for path, (size, mtime, changed) in list(self.pending.items()):
+            if now - changed < self.settle:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime, now)
+                continue
+            del self.pending[path]
+            if self.ledger.seen(path, size, mtime):
+                continue
+            if self.deferred.pop(path, None) is not None:
+                # Changed while waiting for a retry; the new version gets a fresh start
+                self.failures.pop(path, None)
+            try:
+                duration = audio_duration(path)
+            except OSError:
+                # Deleted or renamed since the stat; a new name turns up on the next scan
+                duration = None
+            if path in self.queued:
+                # Changed again after it was batched; take the newer version
+                previous, _, _ = self.queued.pop(path)
+                self.batches[previous] = [item for item in self.batches[previous] if item[0] != path]
+            if duration is None:
+                continue
+            prompt = self.roots[self.root_of(path)]
+            key = (prompt, bucket_for(duration))
+            self.batches.setdefault(key, []).append((path, size, mtime, now))
+            self.queued[path] = (key, size, mtime)
+
+    def flush(self, force=False):
+        """Run every batch that is full or whose oldest file waited max_wait"""
+        now = time.monotonic()
+        for path, (key, size, mtime, due) in list(self.deferred.items()):
+            if now >= due:
+                del self.deferred[path]
+                self.batches.setdefault(key, []).append((path, size, mtime, now))
+                self.queued[path] = (key, size, mtime)
+        for key in list(self.batches):
+            files = self.batches[key]
+            while files and (force or len(files) >= self.batch_size or now - files[0][3] >= self.max_wait):
+                batch, files = files[:self.batch_size], files[self.batch_size:]
+                for path, _, _, _ in batch:
+                    del self.queued[path]
+                self.run_batch(key, batch)
+            if files:
+                self.batches[key] = files
+            else:
+                del self.batches[key]
+
+    def output_directory(self, path):
+        """Where the result of path goes: its subdirectory of the watched one, under output_dir"""
+        root = self.root_of(path)
+        relative = os.path.relpath(os.path.dirname(path), root)
+        if len(self.roots) > 1:
+            # Keep same-named files from different watched directories apart
+            relative = os.path.join(os.path.basename(root), relative)
+        return os.path.normpath(os.path.join(self.output_dir, relative))
+
+    def run_batch(self, key, batch):
+        (taskname, source_lang, target_lang, pnc), bucket = key
+        paths = [path for path, _, _, _ in batch]
+        start = time.time()
+        try:
+            results = self.backend.transcribe(paths, taskname, source_lang, target_lang, pnc,
+                                              batch_size=len(paths))
+        except Exception as e:
+            if len(batch) > 1:
+                # One unreadable file fails the whole batch; run each file alone to find it
+                print(f"Failed to process {len(paths)} files ({e}); retrying one by one")
+                for item in batch:
+                    self.run_batch(key, [item])
+                return
+            self.failed(key, batch[0], e)
+            return
+
+        for (path, size, mtime, _), text in zip(batch, results):
+            directory = self.output_directory(path)
+            os.makedirs(directory, exist_ok=True)
+            output_file = os.path.join(directory, result_filename(path, taskname, source_lang, target_lang))
+            # Write then rename, so readers never see a partial result
+            with open(output_file + ".tmp", "w") as f:
+                f.write(text)
+            os.replace(output_file + ".tmp", output_file)
+            index_result(output_file, text, path, taskname, source_lang, target_lang)
+            self.ledger.record(path, size, mtime, status="done", output=output_file,
+                               taskname=taskname, source_lang=source_lang, target_lang=target_lang)
+            self.failures.pop(path, None)
+        print(f"Processed {len(paths)} file{'s' if len(paths) != 1 else ''} ({taskname} "
+              f"{source_lang}->{target_lang}, {bucket}) in {time.time() - start:.1f}s")
+
+    def failed(self, key, item, error):
+        """Record a file the decoder cannot read, or retry it later after any other failure"""
+        path, size, mtime, _ = item
+        if not os.path.exists(path):
+            self.failures.pop(path, None)
+            return
+        if undecodable(path):
+            print(f"Cannot decode {path} ({error})")
+            self.failures.pop(path, None)
+            self.ledger.record(path, size, mtime, status="error", error=str(error))
+            return
+        failures = self.failures[path] = self.failures.get(path, 0) + 1
+        delay = min(RETRY_DELAY * 2 ** (failures - 1), RETRY_MAX_DELAY)
+        print(f"Failed to process {path} ({error}); retrying in {delay:.0f}s")
+        self.deferred[path] = (key, size, mtime, time.monotonic() + delay)
+
+    def wait_for_changes(self, timeout):
+        """Notice files changed in the next timeout seconds"""
+        if self.inotify is None:
+            time.sleep(timeout)
+            return
+        for mask, path in self.inotify.read(timeout):
+            if path is None:
+                print("inotify queue overflowed; re-scanning")
+                for root in self.roots:
+                    self.scan(root)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have landed before the watch was added
+                    self.scan(path)
+            else:
+                self.notice(path)
+
+    def run(self, stop=None):
+        """
+        Process existing unprocessed files, then new ones as they arrive
+
+        Args:
+            stop: Optional threading.Event; otherwise runs until interrupted
+        """
+        if self.poll_interval is None:
+            try:
+                self.inotify = Inotify()
+            except OSError as e:
+                print(f"{e}; re-scanning every 5 s instead")
+                self.poll_interval = 5.0
+
+        for root in self.roots:
+            self.scan(root)
+        print(f"Watching {', '.join(self.roots)} ({len(self.pending)} unprocessed files found)")
+
+        last_scan = time.monotonic()
+        try:
+            while stop is None or not stop.is_set():
+                self.wait_for_changes(0.5)
+                if self.poll_interval is not None and time.monotonic() - last_scan >= self.poll_interval:
+                    for root in self.roots:
+                        self.scan(root)
+                    last_scan = time.monotonic()
+                self.settle_pending()
+                self.flush()
+        finally:
+            if self.inotify is not None:
+                self.inotify.close()
+                self.inotify = None
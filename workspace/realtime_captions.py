@@ -1,86 +1,135 @@
 import numpy as np
 import pyaudio
-import wave
 import threading
 import queue
-import tempfile
 from nemo.collections.asr.models import EncDecMultiTaskModel
 
 class AudioTranscriber:
-    def __init__(self, model_name='nvidia/canary-1b'):
+    def __init__(self, model_name='nvidia/canary-1b', window_seconds=3, hop_seconds=1):
+        """
+        Initialize AudioTranscriber
+
+        Args:
+            model_name: Pretrained model name
+            window_seconds: Longest stretch of audio a caption covers
+            hop_seconds: How often the current caption is refreshed
+        """
         self.chunk = 1024
         self.format = pyaudio.paFloat32
         self.channels = 1
         self.rate = 16000
-        self.record_seconds = 3
+        self.window_seconds = window_seconds
+        self.hop_seconds = hop_seconds
         self.audio_queue = queue.Queue()
-        
+        # Words of the last committed caption, to drop what the overlap repeats
+        self.committed_words = []
+
         # Initialize PyAudio
         self.p = pyaudio.PyAudio()
-        
+
         # Load Canary model
         self.model = EncDecMultiTaskModel.from_pretrained(model_name)
         decode_cfg = self.model.cfg.decoding
         decode_cfg.beam.beam_size = 1
         self.model.change_decoding_strategy(decode_cfg)
-        
+
         self.is_recording = False
-        
+
     def start_recording(self):
         self.is_recording = True
-        self.recording_thread = threading.Thread(target=self._record_audio)
+        # PortAudio pushes blocks to _on_audio as they arrive
+        self.stream = self.p.open(format=self.format,
+                                  channels=self.channels,
+                                  rate=self.rate,
+                                  input=True,
+                                  frames_per_buffer=self.chunk,
+                                  stream_callback=self._on_audio)
         self.transcription_thread = threading.Thread(target=self._process_audio)
-        
-        self.recording_thread.start()
         self.transcription_thread.start()
-        
+
     def stop_recording(self):
         self.is_recording = False
-        self.recording_thread.join()
+        self.stream.stop_stream()
+        self.stream.close()
+        # Wake the consumer so it can finish without waiting for more audio
+        self.audio_queue.put(None)
         self.transcription_thread.join()
-        
-    def _record_audio(self):
-        stream = self.p.open(format=self.format,
-                           channels=self.channels,
-                           rate=self.rate,
-                           input=True,
-                           frames_per_buffer=self.chunk)
-        
-        while self.is_recording:
-            frames = []
-            for _ in range(0, int(self.rate / self.chunk * self.record_seconds)):
-                if not self.is_recording:
-                    break
-                data = stream.read(self.chunk)
-                frames.append(data)
-            
-            if frames:
-                self.audio_queue.put(frames)
-        
-        stream.stop_stream()
-        stream.close()
-        
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        self.audio_queue.put(np.frombuffer(in_data, dtype=np.float32))
+        return (None, pyaudio.paContinue if self.is_recording else pyaudio.paComplete)
+
     def _process_audio(self):
-        while self.is_recording or not self.audio_queue.empty():
-            if not self.audio_queue.empty():
-                frames = self.audio_queue.get()
-                
-                # Save temporary WAV file
-                with tempfile.NamedTemporaryFile(suffix='.wav', delete=True) as temp_wav:
-                    with wave.open(temp_wav.name, 'wb') as wf:
-                        wf.setnchannels(self.channels)
-                        wf.setsampwidth(self.p.get_sample_size(self.format))
-                        wf.setframerate(self.rate)
-                        wf.writeframes(b''.join(frames))
-                    
-                    # Transcribe using Canary
-                    try:
-                        transcription = self.model.transcribe([temp_wav.name])
-                        if transcription:
-                            print("Transcription:", transcription[0])
-                    except Exception as e:
-                        print(f"Error in transcription: {e}")
-        
+        """
+        Caption a growing window of audio
+
+        The caption for the current window is refreshed every hop_seconds of
+        new audio; once the window reaches window_seconds the caption is
+        committed and a new window starts with the last hop_seconds of the
+        old one, so words spanning the boundary are heard whole. The consumer
+        blocks on the queue, so it uses no CPU while there is no audio.
+        """
+        window = np.zeros(int(self.rate * self.window_seconds), dtype=np.float32)
+        hop_samples = int(self.rate * self.hop_seconds)
+        overlap_samples = min(hop_samples, len(window) // 2)
+        filled = 0
+        last_captioned = 0
+
+        final = False
+        while not final:
+            # Block until audio arrives, then take any backlog too, so a slow
+            # inference is followed by one caption of the latest audio
+            blocks = [self.audio_queue.get()]
+            while True:
+                try:
+                    blocks.append(self.audio_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for block in blocks:
+                if block is None:
+                    final = True
+                    break
+                # Anything beyond the window is carried into the next one
+                while len(block):
+                    take = min(len(block), len(window) - filled)
+                    window[filled:filled + take] = block[:take]
+                    filled += take
+                    block = block[take:]
+                    if filled == len(window):
+                        self._caption(window, commit=True)
+                        # Keep the tail of the window as overlap for context
+                        if overlap_samples > 0:
+                            window[:overlap_samples] = window[len(window) - overlap_samples:]
+                        filled = last_captioned = overlap_samples
+
+            if filled - last_captioned >= hop_samples or (final and filled > last_captioned):
+                self._caption(window[:filled], commit=final)
+                last_captioned = filled
+
+    def _new_words(self, text):
+        """Words of text after the longest prefix that repeats the end of the last committed caption"""
+        words = str(text).split()
+        committed = [w.strip(".,;:!?").lower() for w in self.committed_words]
+        for n in range(min(len(words), len(committed)), 0, -1):
+            if [w.strip(".,;:!?").lower() for w in words[:n]] == committed[-n:]:
+                return words[n:]
+        return words
+
+    def _caption(self, audio, commit):
+        """Transcribe in-memory audio and show it as the current caption"""
+        try:
+            transcription = self.model.transcribe([audio.copy()], batch_size=1, verbose=False)
+            if transcription:
+                text = getattr(transcription[0], "text", transcription[0])
+                words = self._new_words(text)
+                end = "\n" if commit else ""
+                print(f"\r\033[KTranscription: {' '.join(words)}", end=end, flush=True)
+                if commit:
+                    self.committed_words = str(text).split()
+        except Exception as e:
+            print(f"\nError in transcription: {e}")
+
     def cleanup(self):
         self.p.terminate()
 
@@ -94,4 +143,4 @@ if __name__ == "__main__":
         pass
     finally:
         transcriber.stop_recording()
-        transcriber.cleanup()
\ No newline at end of file
+        transcriber.cleanup()